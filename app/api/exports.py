@@ -0,0 +1,86 @@
+# Copyright: (c) 2020, Michele Valsecchi <https://github.com/MicheleV>
+# GNU General Public License v3.0+
+# (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+"""
+Streaming exports of expenses and incomes, as CSV or NDJSON (one JSON object
+per line)
+
+Rows are read with QuerySet.iterator() (a server side cursor on Postgres) and
+written to the response while they are read: memory use does not depend on
+the number of exported rows, and the first bytes are sent right away
+"""
+import csv
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+
+# Exported columns, and the fields they are read from
+COLUMNS = (
+  ('id', 'id'),
+  ('date', 'date'),
+  ('amount', 'amount'),
+  ('category_id', 'category_id'),
+  ('category_text', 'category__text'),
+  ('note', 'note'),
+)
+# Rows fetched from the DB at once
+CHUNK_SIZE = 2000
+# Rows written to the response at once
+ROWS_PER_WRITE = 500
+
+CONTENT_TYPES = {
+  'csv': 'text/csv; charset=utf-8',
+  'ndjson': 'application/x-ndjson',
+}
+
+
+class Echo:  # pylint: disable=R0903; # noqa
+    """File-like object returning what is written, to feed csv.writer"""
+
+    def write(self, value):  # pylint: disable=R0201; # noqa
+        return value
+
+
+def iter_rows(queryset):
+    """Yield the exported columns of queryset rows, ordered by id"""
+    fields = [field for _, field in COLUMNS]
+    return queryset.values_list(*fields).order_by('id').iterator(
+           chunk_size=CHUNK_SIZE)
+
+
+def csv_lines(rows):
+    """Yield the CSV lines of rows, header first"""
+    writer = csv.writer(Echo())
+    yield writer.writerow([column for column, _ in COLUMNS])
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def ndjson_lines(rows):
+    """Yield the NDJSON lines of rows"""
+    columns = [column for column, _ in COLUMNS]
+    encoder = DjangoJSONEncoder()
+    for row in rows:
+        yield encoder.encode(dict(zip(columns, row))) + '\n'
+
+
+def batched(lines, size=ROWS_PER_WRITE):
+    """Join lines in groups of size, to write fewer and larger chunks"""
+    batch = []
+    for line in lines:
+        batch.append(line)
+        if len(batch) == size:
+            yield ''.join(batch)
+            batch = []
+    if batch:
+        yield ''.join(batch)
+
+
+def export_response(queryset, fmt, name):
+    """Return a response streaming the rows of queryset in fmt"""
+    lines = csv_lines if fmt == 'csv' else ndjson_lines
+    response = StreamingHttpResponse(batched(lines(iter_rows(queryset))),
+                                     content_type=CONTENT_TYPES[fmt])
+    response['Content-Disposition'] = f'attachment; filename="{name}.{fmt}"'
+    return response
@@ -0,0 +1,71 @@
+# Copyright: (c) 2020, Michele Valsecchi <https://github.com/MicheleV>
+# GNU General Public License v3.0+
+# (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+"""
+Keyset (cursor) pagination of expenses and incomes, ordered by (date, id)
+
+Each page is read with a single query starting right after the last row of
+the previous page, found through the (created_by, date, id) indexes: unlike
+OFFSET pagination, there is no COUNT(*) and deep pages cost as much as the
+first one. Clients follow the opaque `next` token until it is null
+"""
+import base64
+import datetime
+import os
+
+DEFAULT_PAGE_SIZE = 100
+DEFAULT_MAX_PAGE_SIZE = 1000
+
+
+def get_max_page_size():
+    """Return the largest page size clients can ask for"""
+    return int(os.getenv('API_MAX_PAGE_SIZE', DEFAULT_MAX_PAGE_SIZE))
+
+
+def get_page_size(value):
+    """
+    Return the page size asked by a client (None for the default one), capped
+    to API_MAX_PAGE_SIZE. Raise ValueError if it is not a positive integer
+    """
+    if value is None:
+        return min(DEFAULT_PAGE_SIZE, get_max_page_size())
+    page_size = int(value)
+    if page_size < 1:
+        raise ValueError(f"Invalid page size: {value}")
+    return min(page_size, get_max_page_size())
+
+
+def encode_cursor(row):
+    """Return the token pointing right after row (a values() dict)"""
+    key = f"{row['date'].isoformat()}|{row['id']}"
+    return base64.urlsafe_b64encode(key.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    """Return the (date, id) a token points after. Raise ValueError if invalid"""
+    # Decoding and parsing errors are all ValueError subclasses
+    padding = '=' * (-len(token) % 4)
+    key = base64.urlsafe_b64decode(token + padding).decode()
+    date, pk = key.split('|')
+    return datetime.date.fromisoformat(date), int(pk)
+
+
+def paginate(queryset, cursor, page_size):
+    """
+    Return the page_size rows of queryset (a values() queryset, with at least
+    the 'date' and 'id' keys) following cursor (None for the first page), and
+    the token of the next page (None for the last one)
+    """
+    queryset = queryset.order_by('date', 'id')
+    if cursor:
+        date, pk = decode_cursor(cursor)
+        # Same as (date, id) > (cursor date, cursor id), but the date range
+        # alone is enough to seek into the index
+        queryset = queryset.filter(date__gte=date).exclude(date=date,
+                                                           id__lte=pk)
+    rows = list(queryset[:page_size + 1])
+    next_cursor = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        next_cursor = encode_cursor(rows[-1])
+    return rows, next_cursor
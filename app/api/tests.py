@@ -1,3 +1,377 @@
-from django.test import TestCase
+# Copyright: (c) 2020, Michele Valsecchi <https://github.com/MicheleV>
+# GNU General Public License v3.0+
+# (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+import csv
+import datetime
+import json
+import os
+import random
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.renderers import JSONRenderer
+
+import budgets.models as m
+from budgets import serializers
+from budgets import signals
+from budgets.tests.base import BaseTest
+import budgets.views_utils as utils
+
+
+class ChartSeriesTest(BaseTest):
+    """Unit tests related to the chart series api"""
+
+    def create_monthly_balances(self):
+        """Create two monthly balances for this month and the previous one"""
+        start = datetime.date.today().replace(day=1)
+        prev = utils.get_previous_month_first_day_date(start)
+        for _ in range(2):
+            cat = self.create_monthly_balance_category(self.generate_string(10))
+            self.create_monthly_balance(cat, random.randint(1, 90000), start)
+            self.create_monthly_balance(cat, random.randint(1, 90000), prev)
+        return start, prev
+
+    @BaseTest.login
+    def test_expenses_pie_series(self):
+        date = datetime.date.today().replace(day=1)
+        cat_1 = self.create_category('cat_1')
+        cat_2 = self.create_category('cat_2')
+        self.create_expense(cat_1, 10, self.generate_string(10), date)
+        self.create_expense(cat_1, 5, self.generate_string(10), date)
+        self.create_expense(cat_2, 20, self.generate_string(10), date)
+
+        url = reverse('api:expenses_pie_graph_data')
+        response = self.client.get(url, {'start': date.strftime('%Y-%m')})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {'labels': ['cat_1', 'cat_2'],
+                                           'values': [15, 20]})
+
+    @BaseTest.login
+    def test_expenses_pie_series_rejects_malformed_dates(self):
+        url = reverse('api:expenses_pie_graph_data')
+        response = self.client.get(url, {'start': '2020-13'})
+        self.assertEqual(response.status_code, 400)
+
+    @BaseTest.login
+    def test_not_enough_data(self):
+        url = reverse('api:monthly_balances_bar_graph_data')
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+    @BaseTest.login
+    def test_monthly_balances_series(self):
+        start, prev = self.create_monthly_balances()
+        goal = self.create_goal(100, 'goal', 'note')
+        self.create_goal(200, 'archived', 'other note', is_archived=True)
+
+        url = reverse('api:monthly_balances_bar_graph_data')
+        data = self.client.get(url).json()
+        self.assertEqual(data['labels'], [str(prev), str(start)])
+        self.assertEqual(data['goals'], [{'text': goal.text,
+                                          'amount': goal.amount}])
+
+        url = reverse('api:monthly_balances_pie_graph_data')
+        data = self.client.get(url, {'date': start.strftime('%Y-%m')}).json()
+        self.assertEqual(len(data['labels']), 2)
+        self.assertEqual(len(data['values']), 2)
+
+    @BaseTest.login
+    def test_pages_use_client_side_charts(self):
+        """When CHART_RENDERING=client, pages link the series api"""
+        start, _ = self.create_monthly_balances()
+
+        with mock.patch.dict(os.environ, {'CHART_RENDERING': 'client'}):
+            response = self.client.get(reverse('budgets:home'))
+
+        bar_url = reverse('api:monthly_balances_bar_graph_data')
+        self.assertEqual(response.context['bar_graph'], bar_url)
+        self.assertContains(response, f'data-series-url="{bar_url}"')
+        self.assertNotContains(response, '<img')
+
+
+class ExportTest(BaseTest):
+    """Unit tests related to the expenses and incomes exports"""
+
+    def setUp(self):
+        super().setUp()
+        self.signup_and_login()
+        self.rent = self.create_category('Rent')
+        self.food = self.create_category('Food')
+        self.create_expense(self.rent, 1000, 'January, "rent"', '2020-01-05')
+        self.create_expense(self.food, 30, '', '2020-01-25')
+        self.create_expense(self.rent, 1000, 'February', '2020-02-05')
+
+    @staticmethod
+    def read(response):
+        """Return the whole streamed content of response"""
+        return b''.join(response.streaming_content).decode()
+
+    def test_csv(self):
+        response = self.client.get(reverse('api:export_expenses',
+                                           kwargs={'fmt': 'csv'}))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        self.assertEqual(response['Content-Disposition'],
+                         'attachment; filename="expenses.csv"')
+        rows = list(csv.reader(self.read(response).splitlines()))
+        self.assertEqual(rows[0], ['id', 'date', 'amount', 'category_id',
+                                   'category_text', 'note'])
+        self.assertEqual([row[1:] for row in rows[1:]], [
+          ['2020-01-05', '1000', str(self.rent.id), 'Rent', 'January, "rent"'],
+          ['2020-01-25', '30', str(self.food.id), 'Food', ''],
+          ['2020-02-05', '1000', str(self.rent.id), 'Rent', 'February'],
+        ])
+
+    def test_ndjson_filters(self):
+        url = reverse('api:export_expenses', kwargs={'fmt': 'ndjson'})
+        response = self.client.get(url, {'start': '2020-01-01',
+                                         'end': '2020-01-31',
+                                         'category_id': self.rent.id})
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        rows = [json.loads(line) for line in self.read(response).splitlines()]
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0], {
+          'id': rows[0]['id'], 'date': '2020-01-05', 'amount': 1000,
+          'category_id': self.rent.id, 'category_text': 'Rent',
+          'note': 'January, "rent"'})
+
+    def test_rows_are_read_while_streaming(self):
+        url = reverse('api:export_expenses', kwargs={'fmt': 'csv'})
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertFalse(any('budgets_expense' in query['sql']
+                             for query in ctx.captured_queries))
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(len(self.read(response).splitlines()), 4)
+        self.assertEqual(len(ctx), 1)
+
+    def test_only_current_user_rows(self):
+        self.signup_and_login()
+        salary = self.create_income_category('Salary')
+        self.create_income(salary, 3000, 'January', '2020-01-25')
+
+        url = reverse('api:export_expenses', kwargs={'fmt': 'ndjson'})
+        self.assertEqual(self.read(self.client.get(url)), '')
+        url = reverse('api:export_incomes', kwargs={'fmt': 'csv'})
+        rows = list(csv.reader(self.read(self.client.get(url)).splitlines()))
+        self.assertEqual([row[1:] for row in rows[1:]], [
+          ['2020-01-25', '3000', str(salary.id), 'Salary', 'January'],
+        ])
+
+    def test_malformed_filters(self):
+        url = reverse('api:export_expenses', kwargs={'fmt': 'csv'})
+        self.assertEqual(self.client.get(url, {'start': '2020-13-01'})
+                         .status_code, 400)
+        self.assertEqual(self.client.get(url, {'category_id': 'x'})
+                         .status_code, 400)
+
+
+class ExpensesApiTest(BaseTest):
+    """Unit tests related to the keyset pagination of the expenses api"""
+
+    def setUp(self):
+        super().setUp()
+        self.signup_and_login()
+        self.rent = self.create_category('Rent')
+        # Several expenses share the same date: pages must not skip them
+        self.expenses = [
+          self.create_expense(self.rent, i, f'note {i}',
+                              f'2020-01-{1 + i // 3:02}')
+          for i in range(10)]
+        self.url = reverse('api:expenses')
+
+    def fetch_all(self, **params):
+        """Follow the cursors, return the pages"""
+        pages = []
+        cursor = None
+        while True:
+            if cursor:
+                params['cursor'] = cursor
+            response = self.client.get(self.url, params)
+            self.assertEqual(response.status_code, 200)
+            data = response.json()
+            pages.append([expense['amount'] for expense in data['results']])
+            cursor = data['next']
+            if cursor is None:
+                return pages
+
+    def test_follow_cursors(self):
+        self.assertEqual(self.fetch_all(page_size=4),
+                         [[0, 1, 2, 3], [4, 5, 6, 7], [8, 9]])
+        self.assertEqual(self.fetch_all(), [list(range(10))])
+        self.assertEqual(self.fetch_all(page_size=5, start='2020-01-02'),
+                         [[3, 4, 5, 6, 7], [8, 9]])
+
+    def test_page_size_is_capped(self):
+        with mock.patch.dict(os.environ, {'API_MAX_PAGE_SIZE': '3'}):
+            self.assertEqual(self.fetch_all(page_size=1000),
+                             [[0, 1, 2], [3, 4, 5], [6, 7, 8], [9]])
+
+    def test_malformed_parameters(self):
+        for params in ({'cursor': 'not a cursor'}, {'page_size': 0},
+                       {'page_size': 'x'}, {'start': '2020-13-01'}):
+            response = self.client.get(self.url, params)
+            self.assertEqual(response.status_code, 400, params)
+
+    def test_pages_cost_one_query(self):
+        first = self.client.get(self.url, {'page_size': 2}).json()
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(self.url, {'page_size': 2,
+                                                  'cursor': first['next']})
+        expense_queries = [q['sql'] for q in ctx.captured_queries
+                           if 'budgets_expense' in q['sql']]
+        self.assertEqual(len(expense_queries), 1)
+        self.assertNotIn('COUNT(', expense_queries[0])
+        self.assertNotIn('OFFSET', expense_queries[0])
+        self.assertEqual(len(response.json()['results']), 2)
+
+
+class FastRowsTest(BaseTest):
+    """Check the values() rows match the output of the serializers"""
+
+    @staticmethod
+    def as_json(data):
+        """Return data, as received by clients"""
+        return json.loads(JSONRenderer().render(data))
+
+    def test_expense_rows(self):
+        self.signup_and_login()
+        rent = self.create_category('Rent')
+        self.create_expense(rent, 1000, 'January', '2020-01-05')
+        self.create_expense(rent, 30, '', '2020-01-25')
+
+        expenses = m.Expense.objects.order_by('id')  # pylint: disable=E1101; # noqa
+        self.assertEqual(
+          self.as_json(list(serializers.expense_rows(expenses))),
+          self.as_json(serializers.ExpenseSerializer(expenses, many=True).data))
+
+    @mock.patch.dict(os.environ, {'EXCHANGE_RATE': '100'})
+    def test_monthly_balance_rows(self):
+        self.signup_and_login()
+        bank = self.create_monthly_balance_category('Bank')
+        foreign = self.create_monthly_balance_category('Foreign bank')
+        foreign.is_foreign_currency = True
+        foreign.save()
+        date = datetime.date.today().replace(day=1)
+        self.create_monthly_balance(bank, 1000, date)
+        self.create_monthly_balance(foreign, 30, date)
+
+        balances = m.MonthlyBalance.objects.order_by('id')  # pylint: disable=E1101; # noqa
+        rows = self.as_json(serializers.monthly_balance_rows(balances))
+        self.assertEqual(rows, self.as_json(
+          serializers.MonthlyBalanceSerializer(balances, many=True).data))
+        self.assertEqual([row['amount'] for row in rows], [1000, 3000])
+
+        response = self.client.get(reverse('api:monthly_balances'))
+        self.assertEqual(response.json(), rows)
+        response = self.client.get(reverse('api:monthly_balances'),
+                                   {'date': 'not a date'})
+        self.assertEqual(response.status_code, 400)
+
+
+class ConditionalRequestsTest(BaseTest):
+    """Check API responses are tagged with the user data version"""
+
+    def setUp(self):
+        super().setUp()
+        self.signup_and_login()
+        self.rent = self.create_category('Rent')
+        self.create_expense(self.rent, 1000, 'January', '2020-01-05')
+        self.url = reverse('api:expenses')
+
+    def test_not_modified(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('private', response['Cache-Control'])
+        self.assertIn('no-cache', response['Cache-Control'])
+        etag = response['ETag']
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        self.assertFalse([query for query in queries.captured_queries
+                          if 'budgets_' in query['sql']])
+
+        # Responses change with the date and the exchange rate too, which
+        # a modification time can not tell
+        self.assertFalse(response.has_header('Last-Modified'))
+        response = self.client.get(
+                   self.url, HTTP_IF_MODIFIED_SINCE='Fri, 01 Jan 2100 '
+                                                    '00:00:00 GMT')
+        self.assertEqual(response.status_code, 200)
+        with mock.patch.dict(os.environ, {'EXCHANGE_RATE': '1'}):
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_changes_update_the_etag(self):
+        response = self.client.get(self.url)
+        etag = response['ETag']
+        self.create_expense(self.rent, 30, '', '2020-01-25')
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['results']), 2)
+        self.assertNotEqual(response['ETag'], etag)
+
+        etag = response['ETag']
+        self.create_monthly_balance_category('Bank')
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+        etag = response['ETag']
+        date = datetime.date.today().replace(day=1)
+        utils.upsert_monthly_rows(m.MonthlyBudget, self.user, [
+          m.MonthlyBudget(category=self.rent, amount=1200, date=date)])
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_etags_differ_by_url_and_user(self):
+        etag = self.client.get(self.url)['ETag']
+        self.assertNotEqual(
+          etag, self.client.get(reverse('api:categories'))['ETag'])
+        self.assertNotEqual(
+          etag, self.client.get(self.url, {'page_size': 1})['ETag'])
+
+        self._logout()
+        self.signup_and_login()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['results'], [])
+
+    def test_deferred_deletes(self):
+        etag = self.client.get(self.url)['ETag']
+        # The owner is loaded before the row is deleted
+        m.Expense.objects.only('id').get().delete()  # pylint: disable=E1101; # noqa
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['results'], [])
+
+        # ...otherwise, every user may own it
+        self._logout()
+        self.signup_and_login()
+        category = m.Category.objects.only('id').get()  # pylint: disable=E1101; # noqa
+        self.assertEqual(sorted(signals.get_owner_ids(category)),
+                         sorted(User.objects.values_list('id', flat=True)))
+
+    @mock.patch.dict(os.environ, {'API_CONDITIONAL_REQUESTS': 'n'})
+    def test_disabled(self):
+        response = self.client.get(self.url)
+        self.assertFalse(response.has_header('ETag'))
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH='*')
+        self.assertEqual(response.status_code, 200)
+
+    @override_settings(CACHES={'default': {
+      'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}})
+    def test_cache_without_storage(self):
+        # Writes still work, and requests are answered without versions
+        self.create_expense(self.rent, 30, '', '2020-01-25')
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['results']), 2)
+        self.assertFalse(response.has_header('ETag'))
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH='*')
+        self.assertEqual(response.status_code, 200)
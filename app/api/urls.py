@@ -2,6 +2,7 @@
 # GNU General Public License v3.0+
 # (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
 from django.urls import path
+from django.urls import re_path
 
 from api import views
 
@@ -9,7 +10,21 @@ app_name = 'api'  # pylint: disable=C0103; # noqa
 urlpatterns = [
     path('categories', views.all_categories, name='categories'),
     path('expenses', views.all_expenses, name='expenses'),
+    re_path(r'expenses/export\.(?P<fmt>csv|ndjson)$', views.export_expenses,
+            name='export_expenses'),
+    path('expenses/monthly_totals', views.expense_monthly_totals,
+         name='expense_monthly_totals'),
+    re_path(r'incomes/export\.(?P<fmt>csv|ndjson)$', views.export_incomes,
+            name='export_incomes'),
+    path('incomes/monthly_totals', views.income_monthly_totals,
+         name='income_monthly_totals'),
     path('monthly_balance_categories', views.monthly_balance_categories,
          name='monthly_balance_categories'),
     path('monthly_balances', views.monthly_balances, name='monthly_balances'),
+    path('charts/expenses_pie', views.expenses_pie_graph_data,
+         name='expenses_pie_graph_data'),
+    path('charts/monthly_balances_pie', views.monthly_balances_pie_graph_data,
+         name='monthly_balances_pie_graph_data'),
+    path('charts/monthly_balances_bar', views.monthly_balances_bar_graph_data,
+         name='monthly_balances_bar_graph_data'),
 ]
@@ -1,17 +1,26 @@
 from django.contrib.auth.decorators import login_required
-from django.core.paginator import Paginator
-from django.core.paginator import EmptyPage
-from django.core.paginator import PageNotAnInteger
+from django.core.exceptions import ValidationError
+from django.http import HttpResponseBadRequest
+from django.views.decorators.http import require_http_methods
 
+from rest_framework import status
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
 
+from api import exports
+from api import pagination
+from budgets import dashboard
 import budgets.models as m
+from budgets import rollups
+from budgets import versions
 from budgets.serializers import CategorySerializer
-from budgets.serializers import ExpenseSerializer
+from budgets.serializers import expense_rows
 from budgets.serializers import MonthlyBalanceCategorySerializer
-from budgets.serializers import MonthlyBalanceSerializer
+from budgets.serializers import MonthlyCategoryTotalSerializer
+from budgets.serializers import MonthlyIncomeCategoryTotalSerializer
+from budgets.serializers import monthly_balance_rows
 from budgets.views_utils import current_month_boundaries
+from budgets.views_utils import load_expenses_pie_graph_data
 
 ###############################################################################
 # API
@@ -19,6 +28,7 @@ from budgets.views_utils import current_month_boundaries
 
 
 @login_required
+@versions.conditional
 @api_view(['GET'])
 # @renderer_classes([JSONRenderer])
 def all_categories(request):
@@ -38,11 +48,10 @@ def all_categories(request):
     return Response(serializer.data)
 
 
-@login_required
-@api_view(['GET'])
-def all_expenses(request):
+def get_transaction_filters(request):
     """
-    List all expenses
+    Return the filters of the current user expenses (or incomes) matching the
+    request parameters
     """
     filters = {
       'created_by': request.user
@@ -65,34 +74,64 @@ def all_expenses(request):
     # Case insensitive: "where note ILIKE '%xxx%'"
     if request.GET.get('note'):
         filters['note__icontains'] = request.GET['note']
+    return filters
 
-    queryset = m.Expense.objects.select_related(  # pylint: disable=E1101; # noqa
-                  'category').filter(**filters).order_by('id')
-
-    # Return 100 results by default
-    # Return everything if "huge_page" param is set
-    if not request.GET.get('huge_page'):
-        paginator = Paginator(queryset, 100)
-        page = request.query_params.get('page')
-
-        try:
-            expenses = paginator.page(page)
-        except PageNotAnInteger:
-            # If page is not an integer, deliver first page.
-            expenses = paginator.page(1)
-        except EmptyPage:
-            # If page is out of range (e.g. 9999),
-            # deliver last page of results.
-            expenses = paginator.page(paginator.num_pages)
-
-        serializer = ExpenseSerializer(expenses, many=True)
-    else:
-        serializer = ExpenseSerializer(queryset, many=True)
 
-    return Response(serializer.data)
+@login_required
+@versions.conditional
+@api_view(['GET'])
+def all_expenses(request):
+    """
+    List all expenses, oldest first, page_size (default 100) at a time.
+    Pass the returned `next` token as cursor to get the following page
+    """
+    try:
+        page_size = pagination.get_page_size(request.GET.get('page_size'))
+        queryset = m.Expense.objects.filter(**get_transaction_filters(request))  # pylint: disable=E1101; # noqa
+        expenses, next_cursor = pagination.paginate(
+                                expense_rows(queryset),
+                                request.GET.get('cursor'), page_size)
+    except (ValueError, ValidationError):
+        return Response(status=status.HTTP_400_BAD_REQUEST)
+
+    # Same rows as ExpenseSerializer, built by the DB
+    return Response({'results': expenses, 'next': next_cursor})
+
+
+def export_transactions(request, model, fmt, name):
+    """
+    Stream the current user expenses (or incomes) as CSV or NDJSON, filtered
+    as all_expenses does
+    """
+    try:
+        queryset = model.objects.filter(**get_transaction_filters(request))
+    except (ValueError, ValidationError):
+        return HttpResponseBadRequest()
+    return exports.export_response(queryset, fmt, name)
+
+
+@login_required
+@versions.conditional
+@require_http_methods(["GET"])
+def export_expenses(request, fmt):
+    """
+    Export all expenses (e.g. /api/expenses/export.csv?start=2020-01-01)
+    """
+    return export_transactions(request, m.Expense, fmt, 'expenses')
 
 
 @login_required
+@versions.conditional
+@require_http_methods(["GET"])
+def export_incomes(request, fmt):
+    """
+    Export all incomes (e.g. /api/incomes/export.ndjson)
+    """
+    return export_transactions(request, m.Income, fmt, 'incomes')
+
+
+@login_required
+@versions.conditional
 @api_view(['GET'])
 def monthly_balance_categories(request):
     """
@@ -112,6 +151,7 @@ def monthly_balance_categories(request):
 
 
 @login_required
+@versions.conditional
 @api_view(['GET'])
 def monthly_balances(request):
     """
@@ -127,6 +167,111 @@ def monthly_balances(request):
     else:
         filters['date'] = current_month_boundaries()[0]
 
-    mb = m.MonthlyBalance.objects.filter(**filters).order_by('id')  # pylint: disable=C0103,E1101; # noqa
-    serializer = MonthlyBalanceSerializer(mb, many=True)
-    return Response(serializer.data)
+    try:
+        mb = m.MonthlyBalance.objects.filter(**filters).order_by('id')  # pylint: disable=C0103,E1101; # noqa
+    except ValidationError:
+        return Response(status=status.HTTP_400_BAD_REQUEST)
+    # Same rows as MonthlyBalanceSerializer, built by the DB
+    return Response(monthly_balance_rows(mb))
+
+
+def monthly_totals_response(request, rollup, serializer_class):
+    """
+    List the monthly totals of the current user, optionally filtered by
+    months (start=YYYY-mm, end=YYYY-mm, both included) and category_id
+    """
+    try:
+        totals = rollups.get_monthly_totals(
+                 rollup, request.user, request.GET.get('start'),
+                 request.GET.get('end'), request.GET.get('category_id'))
+        serializer = serializer_class(totals, many=True)
+        return Response(serializer.data)
+    except (ValueError, ValidationError):
+        return Response(status=status.HTTP_400_BAD_REQUEST)
+
+
+@login_required
+@versions.conditional
+@api_view(['GET'])
+def expense_monthly_totals(request):
+    """
+    List the sum and number of expenses per month and category
+    """
+    return monthly_totals_response(request, m.MonthlyCategoryTotal,
+                                   MonthlyCategoryTotalSerializer)
+
+
+@login_required
+@versions.conditional
+@api_view(['GET'])
+def income_monthly_totals(request):
+    """
+    List the sum and number of incomes per month and category
+    """
+    return monthly_totals_response(request, m.MonthlyIncomeCategoryTotal,
+                                   MonthlyIncomeCategoryTotalSerializer)
+
+
+###############################################################################
+# Chart series (drawn client side when CHART_RENDERING=client)
+###############################################################################
+def chart_series_response(data, goals=None):
+    """
+    Return the labels/values of a chart, or 404 if there is not enough data
+    to draw it
+    """
+    if data is None:
+        return Response(status=status.HTTP_404_NOT_FOUND)
+
+    labels, values = data[0], data[1]
+    series = {'labels': labels, 'values': values}
+    if goals is not None:
+        series['goals'] = [{'text': g.text, 'amount': g.amount} for g in goals]
+    return Response(series)
+
+
+@login_required
+@versions.conditional
+@api_view(['GET'])
+def expenses_pie_graph_data(request):
+    """
+    Return the expenses pie graph series for a given month (start=YYYY-mm),
+    or between two dates (start=YYYY-mm-dd&end=YYYY-mm-dd)
+    """
+    start = request.GET.get('start')
+    end = request.GET.get('end')
+    try:
+        data = load_expenses_pie_graph_data(request.user, start, end)
+    except (ValueError, ValidationError):
+        return Response(status=status.HTTP_400_BAD_REQUEST)
+    return chart_series_response(data)
+
+
+@login_required
+@versions.conditional
+@api_view(['GET'])
+def monthly_balances_pie_graph_data(request):
+    """
+    Return the monthly balances pie graph series for a given month
+    (date=YYYY-mm), defaults to the current month
+    """
+    date = request.GET.get('date')
+    try:
+        data = dashboard.load_monthly_balance_pie_graph_data(request.user,
+                                                             date)
+    except (ValueError, ValidationError):
+        return Response(status=status.HTTP_400_BAD_REQUEST)
+    return chart_series_response(data)
+
+
+@login_required
+@versions.conditional
+@api_view(['GET'])
+def monthly_balances_bar_graph_data(request):
+    """
+    Return the monthly balances bar graph series, and the goals lines
+    """
+    data = dashboard.load_monthly_balance_bar_graph_data(request.user)
+    if data is None:
+        return chart_series_response(data)
+    return chart_series_response(data, goals=data[2])
@@ -0,0 +1,21 @@
+# Copyright: (c) 2020, Michele Valsecchi <https://github.com/MicheleV>
+# GNU General Public License v3.0+
+# (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+"""
+Health checks of persistent DB connections (CONN_MAX_AGE > 0)
+
+Django 2.2 reuses a persistent connection without checking it first: a
+connection dropped by the DB server (restart, idle timeout) would make the
+next request on that worker fail. When DB_CONN_HEALTH_CHECKS is on, reused
+connections are checked at the start of each request, and reopened if broken
+"""
+from django.db import connections
+
+
+def close_unusable_connections(**kwargs):  # pylint: disable=W0613; # noqa
+    """Close the persistent connections that can not be used anymore"""
+    for conn in connections.all():
+        if conn.connection is None or conn.in_atomic_block:
+            continue
+        if conn.settings_dict['CONN_MAX_AGE'] and not conn.is_usable():
+            conn.close()
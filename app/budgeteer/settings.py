@@ -137,6 +137,7 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'budgets.context_processors.frontend',
             ],
         },
     },
@@ -167,6 +168,52 @@ else:
         }
     }
 
+# Keep connections open across requests (seconds, 0: close them after each
+# request, as Django does by default). Broken persistent connections are
+# replaced at the start of the next request, see budgeteer.db
+DATABASES['default']['CONN_MAX_AGE'] = int(os.getenv("DB_CONN_MAX_AGE", 0))
+DB_CONN_HEALTH_CHECKS = 'y' in os.getenv("DB_CONN_HEALTH_CHECKS", "y")
+
+
+# Cache
+# https://docs.djangoproject.com/en/2.2/topics/cache/
+# locmem caches are private to each process: with several gunicorn workers use
+# memcached (or file, on a single host) so that workers share cached data
+CACHE_BACKENDS = {
+    'locmem': ('django.core.cache.backends.locmem.LocMemCache', 'budgeteer'),
+    'file': ('django.core.cache.backends.filebased.FileBasedCache',
+             '/tmp/budgeteer-cache'),
+    'memcached': ('django.core.cache.backends.memcached.MemcachedCache',
+                  '127.0.0.1:11211'),
+    'dummy': ('django.core.cache.backends.dummy.DummyCache', ''),
+}
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "locmem")
+if CACHE_BACKEND not in CACHE_BACKENDS:
+    raise ValueError(f"Unknown CACHE_BACKEND: {CACHE_BACKEND}")
+CACHES = {
+    'default': {
+        'BACKEND': CACHE_BACKENDS[CACHE_BACKEND][0],
+        'LOCATION': os.getenv("CACHE_LOCATION",
+                              CACHE_BACKENDS[CACHE_BACKEND][1]),
+        'TIMEOUT': int(os.getenv("CACHE_TIMEOUT", 300)),
+        'KEY_PREFIX': os.getenv("CACHE_KEY_PREFIX", ''),
+    }
+}
+if CACHE_BACKEND in ('locmem', 'file'):
+    # memcached clients reject unknown options, and evict entries themselves
+    CACHES['default']['OPTIONS'] = {
+        'MAX_ENTRIES': int(os.getenv("CACHE_MAX_ENTRIES", 1000)),
+    }
+
+# Sessions are read on every request: keep them in cache too, when the cache
+# is shared among processes. Sessions cached by a single process would stay
+# valid there after being deleted (e.g. on logout) by another one
+if CACHE_BACKEND in ('file', 'memcached'):
+    DEFAULT_SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+else:
+    DEFAULT_SESSION_ENGINE = 'django.contrib.sessions.backends.db'
+SESSION_ENGINE = os.getenv("SESSION_ENGINE", DEFAULT_SESSION_ENGINE)
+
 
 # Password validation
 # https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators
@@ -0,0 +1 @@
+default_app_config = 'budgets.apps.BudgetsConfig'  # pylint: disable=C0103; # noqa
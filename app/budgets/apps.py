@@ -2,7 +2,18 @@
 # GNU General Public License v3.0+
 # (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
 from django.apps import AppConfig
+from django.conf import settings
+from django.core.signals import request_started
 
 
 class BudgetsConfig(AppConfig):
     name = 'budgets'
+
+    def ready(self):
+        # Register signal handlers
+        import budgets.signals  # pylint: disable=W0611,C0415; # noqa
+
+        if settings.DB_CONN_HEALTH_CHECKS:
+            from budgeteer.db import close_unusable_connections  # pylint: disable=C0415; # noqa
+            request_started.connect(close_unusable_connections,
+                                    dispatch_uid='db_health_checks')
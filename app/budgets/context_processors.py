@@ -0,0 +1,17 @@
+# Copyright: (c) 2020, Michele Valsecchi <https://github.com/MicheleV>
+# GNU General Public License v3.0+
+# (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+import os
+
+from budgets.views_utils import use_client_side_charts
+
+
+def frontend(request):  # pylint: disable=W0613; # noqa
+    """
+    Expose to every template where to load the frontend bundle from, and
+    whether charts are drawn by the browser or served as images
+    """
+    return {
+        'webpack': os.getenv("USE_WEBPACK_DEV_SERVER"),
+        'client_charts': use_client_side_charts(),
+    }
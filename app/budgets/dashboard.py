@@ -0,0 +1,153 @@
+# Copyright: (c) 2020, Michele Valsecchi <https://github.com/MicheleV>
+# GNU General Public License v3.0+
+# (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+"""
+Per user snapshot of the home page (dashboard)
+
+Everything the home page shows (balances, totals, goals) and the data of its
+two charts is computed once and stored in Django cache (DASHBOARD_CACHE_ALIAS,
+default 'default') for DASHBOARD_CACHE_TIMEOUT seconds (0 disables caching).
+
+Snapshots are versioned: the cache key contains a per user version token,
+replaced (see budgets.signals) once a transaction changing the user
+MonthlyBalance, MonthlyBalanceCategory or Goal rows is committed. Snapshots
+are written as a whole under a new key and never updated, so readers always
+get either the old or the new snapshot, never a mix of the two.
+
+NOTE: with several server processes, use a cache shared among them
+(e.g. memcached), or each process would keep serving its own snapshots
+"""
+import os
+import uuid
+
+from django.core.cache import caches
+
+import budgets.views_utils as utils
+
+
+DEFAULT_TIMEOUT = 24 * 60 * 60
+
+
+def get_timeout():
+    """Return for how many seconds snapshots are kept, 0 if disabled"""
+    return int(os.getenv('DASHBOARD_CACHE_TIMEOUT', DEFAULT_TIMEOUT))
+
+
+def _get_cache():
+    return caches[os.getenv('DASHBOARD_CACHE_ALIAS', 'default')]
+
+
+def _version_key(user_id):
+    return f"dashboard:version:{user_id}"
+
+
+def get_version(user_id):
+    """Return the current snapshot version token of a user"""
+    cache = _get_cache()
+    version = cache.get(_version_key(user_id))
+    if version is None:
+        # add() is a no-op if another process set the token in the meantime:
+        # read it again so that every process agrees on the same one
+        cache.add(_version_key(user_id), uuid.uuid4().hex, None)
+        version = cache.get(_version_key(user_id))
+    return version
+
+
+def invalidate(user_id):
+    """
+    Make the snapshots of a user outdated.
+    A random token (instead of a counter) is used, so that evicting the version
+    key can never bring an old snapshot back to life
+    """
+    if get_timeout() > 0:
+        _get_cache().set(_version_key(user_id), uuid.uuid4().hex, None)
+
+
+def build_snapshot(user, start, rate):
+    """
+    Compute the dashboard of user for the month starting on start
+    Return a dictionary with the 'context' of the home page template, and the
+    'pie' and 'bar' chart data (None if there is not enough data to draw them)
+    """
+    # Fetch current and previous month balances at once, to compare them
+    prev_month = utils.get_previous_month_first_day_date(start)
+    stats = utils.get_months_balance_stats([start, prev_month], rate, user)
+    current_mb, curr_tot = stats[start]
+    prev_mb, prev_tot = stats[prev_month]
+    # Sums are None for months without balances
+    current_balance = curr_tot if current_mb else None
+    starting_balance = prev_tot if prev_mb else None
+
+    # TODO: use 1 year or 6 months, instead of 2 months
+    curr_tot, diff, diff_perc = utils.calc_increase_perc(curr_tot, prev_tot)
+
+    # Only active goals
+    goals = list(utils.get_goals_and_time_to_completions(curr_tot, diff, user))
+
+    pie_data = None
+    if len(current_mb) > 1:
+        pie_data = utils.get_monthly_balance_pie_graph_data(current_mb)
+
+    bar_data = None
+    balances_by_date = utils.get_monthly_balances_by_date(
+                       user, rate, utils.get_history_months())
+    if len(balances_by_date) > 1:
+        dates, amounts = utils.get_monthly_balance_bar_graph_data(
+                         balances_by_date)
+        bar_data = (dates, amounts, goals)
+
+    return {
+      'context': {
+        'current_balance': current_balance,
+        'starting_balance': starting_balance,
+        'current_mb': current_mb,
+        'current_mb_total': curr_tot,
+        'prev_mb': prev_mb,
+        'prev_mb_total': prev_tot,
+        'two_months_diff': diff,
+        'two_months_diff_perc': diff_perc,
+        'goals': goals,
+      },
+      'pie': pie_data,
+      'bar': bar_data,
+    }
+
+
+def get_snapshot(user):
+    """
+    Return the dashboard of user for the current month (see build_snapshot),
+    from cache when possible
+    """
+    rate = int(os.getenv("EXCHANGE_RATE"))
+    (start, _) = utils.current_month_boundaries()
+    timeout = get_timeout()
+    if timeout <= 0:
+        return build_snapshot(user, start, rate)
+
+    cache = _get_cache()
+    key = (f"dashboard:{user.id}:{get_version(user.id)}:"
+           f"{start.strftime('%Y-%m')}:{rate}:{utils.get_history_months()}")
+    snapshot = cache.get(key)
+    if snapshot is None:
+        snapshot = build_snapshot(user, start, rate)
+        cache.set(key, snapshot, timeout)
+    return snapshot
+
+
+def load_monthly_balance_pie_graph_data(user, date):
+    """
+    Same as views_utils.load_monthly_balance_pie_graph_data, reading the
+    current month data from the snapshot
+    """
+    (start, _) = utils.get_month_boundaries(date)
+    if start == utils.current_month_boundaries()[0]:
+        return get_snapshot(user)['pie']
+    return utils.load_monthly_balance_pie_graph_data(user, date)
+
+
+def load_monthly_balance_bar_graph_data(user):
+    """
+    Same as views_utils.load_monthly_balance_bar_graph_data, reading the
+    data from the snapshot
+    """
+    return get_snapshot(user)['bar']
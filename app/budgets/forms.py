@@ -186,3 +186,79 @@ class GoalForm(forms.models.ModelForm):
             }),
             'is_archived': forms.fields.CheckboxInput,
         }
+
+
+class CategoryChoiceField(forms.ModelChoiceField):
+    """
+    ModelChoiceField listing and looking choices up in a {pk: category}
+    dictionary, instead of querying its queryset every time
+    """
+
+    def __init__(self, categories, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.categories = categories
+        choices = [(pk, self.label_from_instance(category))
+                   for pk, category in categories.items()]
+        if self.empty_label is not None:
+            choices.insert(0, ('', self.empty_label))
+        self.choices = choices
+
+    def to_python(self, value):
+        if value in self.empty_values:
+            return None
+        try:
+            return self.categories[int(value)]
+        except (KeyError, TypeError, ValueError):
+            raise forms.ValidationError(self.error_messages['invalid_choice'],
+                                        code='invalid_choice')
+
+
+class MultipleMonthlyFormMixin:
+    """
+    Form of the multiple create views, validating a whole formset with no
+    query per form: categories are looked up in the ones loaded once by the
+    view, and rows already stored for a (category, date) pair are updated
+    (see views_utils.upsert_monthly_rows) instead of failing validation
+    """
+
+    def __init__(self, user, *args, categories=None, **kwargs):
+        super().__init__(user, *args, **kwargs)
+        field = self.fields['category']
+        self.fields['category'] = CategoryChoiceField(
+          categories or {}, queryset=field.queryset, widget=field.widget)
+
+    def _get_validation_exclusions(self):
+        # The category exists: it was found among the loaded ones
+        return super()._get_validation_exclusions() + ['category']
+
+    def validate_unique(self):
+        pass
+
+
+class MultipleMonthlyBudgetForm(MultipleMonthlyFormMixin, MonthlyBudgetForm):
+    pass
+
+
+class MultipleMonthlyBalanceForm(MultipleMonthlyFormMixin, MonthlyBalanceForm):
+    pass
+
+
+class MultipleMonthlyFormSet(forms.BaseFormSet):
+    """
+    Formset of the multiple create views, storing a single row per
+    (category, date) pair
+    """
+
+    def clean(self):
+        """Reject forms sharing the same category and date"""
+        if any(self.errors):
+            return
+        seen = set()
+        for form in self.forms:
+            if not form.has_changed():
+                continue
+            key = (form.cleaned_data['category'], form.cleaned_data['date'])
+            if key in seen:
+                raise forms.ValidationError(
+                  f"{key[0]} is used more than once for {key[1]}.")
+            seen.add(key)
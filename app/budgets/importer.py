@@ -0,0 +1,665 @@
+# Copyright: (c) 2020, Michele Valsecchi <https://github.com/MicheleV>
+# GNU General Public License v3.0+
+# (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+"""
+Import expenses and incomes from the CSV export of the budget spreadsheet
+
+Refer to tools/csv_parser/sample.csv for the format: each line holds an
+expense (columns 1-4: date, amount, description, category) and/or an income
+(columns 6-9). Lines without a category or a valid amount (headers, notes)
+are skipped, malformed dates are replaced by the previous valid one, and
+missing categories are created. Descriptions and categories too long to be
+stored stop the import.
+
+Imports run as a pipeline: the file is read chunk_size rows at a time, rows
+are parsed and validated (by a pool of `workers` processes, if any), missing
+dates are filled and entries fingerprinted in file order, and entries are
+saved with bulk_create batch_size at a time. Only a few chunks are in flight
+at once: memory use does not depend on the file size, but for the
+fingerprints counter, which keeps an entry per distinct entry of the file for
+the whole import: it grows linearly with them, by about 70 MB per million.
+
+Rows, or parts of rows, which are not imported are counted by reason in a
+Report, along with the dates replaced and the categories created. Dry runs
+go through the whole pipeline, looking up what would be skipped, but write
+nothing.
+
+Imports are idempotent and resumable:
+- the fingerprint of an entry (a hash of the source file name, its fields and
+  how many identical entries precede it in the file) is saved along with it,
+  unique per user: entries imported before are skipped
+- each chunk is committed along with an ImportCheckpoint, recording the last
+  committed line and the sha1 of the file up to there. Importing the same file
+  again (or a longer version of it) does not look up the fingerprints of the
+  rows before the checkpoint at all
+"""
+import collections
+import concurrent.futures
+import csv
+import datetime
+import functools
+import hashlib
+import itertools
+import time
+
+import django
+from django.db import transaction
+
+from budgets import rollups
+from budgets import versions
+import budgets.models as m
+import budgets.views_utils as utils
+from graphs import background
+
+EXPENSE = 'expense'
+INCOME = 'income'
+
+# Columns of the date, amount, description and category of each entry
+COLUMNS = {
+  EXPENSE: (1, 2, 3, 4),
+  INCOME: (6, 7, 8, 9),
+}
+MODELS = {
+  EXPENSE: (m.Expense, m.Category),
+  INCOME: (m.Income, m.IncomeCategory),
+}
+
+DATE_FORMAT = '%Y/%m/%d'
+# Used until the first valid date is found
+DEFAULT_DATE = datetime.date(1970, 1, 1)
+DEFAULT_CURRENCY_SYMBOL = '€'
+DEFAULT_ENCODING = 'utf-8'
+DEFAULT_BATCH_SIZE = 1000
+DEFAULT_CHUNK_SIZE = 10000
+# Chunks submitted to each worker process ahead of the ones being saved
+CHUNKS_PER_WORKER = 2
+# Fingerprints looked up with each query
+FINGERPRINTS_PER_QUERY = 500
+# Bytes of the sha1 of their fields identical entries are counted by
+OCCURRENCE_KEY_BYTES = 8
+
+# Pipeline stages, in order
+READ = 'read'
+PARSE = 'parse'
+# Filling dates and fingerprinting
+HASH = 'hash'
+# Looking up imported entries, without saving them (dry runs)
+LOOKUP = 'lookup'
+WRITE = 'write'
+STAGES = (READ, PARSE, HASH, LOOKUP, WRITE)
+
+# Reasons parts of rows are not imported for
+HEADER = 'header'
+MISSING_COLUMNS = 'missing columns'
+NO_CATEGORY = 'no category'
+INVALID_AMOUNT = 'invalid amount'
+TOO_LONG = 'too long'
+# Lines listed in reports, for each reason
+REPORT_LINES = 5
+
+# line is the number of the line of the file (1 based) the entry is read from,
+# date is None if missing or malformed
+Entry = collections.namedtuple('Entry',
+                               'kind line date amount note category '
+                               'fingerprint', defaults=(None,))
+# Rows of the file, starting at line first_line. The file is offset bytes long
+# up to the end of the chunk, and digest is the sha1 of those bytes
+Chunk = collections.namedtuple('Chunk', 'first_line rows offset digest')
+
+
+class InvalidRow(ValueError):
+    """A row of the file can not be imported"""
+
+    def __init__(self, line, message):
+        # Both arguments are kept in args, for exceptions raised by worker
+        # processes to be pickled back
+        super().__init__(line, message)
+        self.line = line
+        self.message = message
+
+    def __str__(self):
+        return f"Line {self.line}: {self.message}"
+
+
+class Stats:
+    """Rows handled by each stage of the pipeline, and the time it took"""
+
+    def __init__(self):
+        self.rows = dict.fromkeys(STAGES, 0)
+        self.seconds = dict.fromkeys(STAGES, 0.0)
+        self.start = time.perf_counter()
+
+    def add(self, stage, rows, seconds):
+        """Account rows handled by stage in seconds"""
+        self.rows[stage] += rows
+        self.seconds[stage] += seconds
+
+    def as_dict(self):
+        """
+        Return the {stage: {rows, seconds, rate}} throughput of the stages
+        which ran, and of the whole import (since the instance was created)
+        """
+        stages = {}
+        for stage, rows in self.rows.items():
+            seconds = self.seconds[stage]
+            if rows or seconds:
+                stages[stage] = {'rows': rows, 'seconds': seconds,
+                                 'rate': rows / seconds if seconds else 0}
+        seconds = time.perf_counter() - self.start
+        rows = self.rows[READ]
+        stages['total'] = {'rows': rows, 'seconds': seconds,
+                           'rate': rows / seconds if seconds else 0}
+        return stages
+
+    def report(self, workers=0):
+        """Return the lines describing the throughput of each stage"""
+        lines = []
+        for stage, stats in self.as_dict().items():
+            unit = 'entries' if stage in (HASH, LOOKUP, WRITE) else 'rows'
+            if stage == PARSE and workers:
+                # Seconds of the worker processes add up
+                note = f' per worker, {workers} in parallel'
+            else:
+                note = ''
+            lines.append(f"{stage:<6} {stats['rows']} {unit} in "
+                         f"{stats['seconds']:.2f} s ({stats['rate']:.0f} "
+                         f"{unit}/s{note})")
+        return lines
+
+
+class Report:
+    """
+    What importing a file does, besides saving entries: the entries accepted
+    and the ones rejected (by reason), the missing or malformed dates replaced
+    by the previous valid one, and the categories created.
+    Only the first REPORT_LINES lines of each case are kept
+    """
+
+    def __init__(self):
+        self.accepted = dict.fromkeys(COLUMNS, 0)
+        # {(kind, reason): [count, lines]}
+        self.rejected = {}
+        # {kind: [count, lines]}
+        self.date_fallbacks = {}
+        self.new_categories = {kind: set() for kind in COLUMNS}
+
+    @staticmethod
+    def _add(cases, key, count, lines):
+        case = cases.setdefault(key, [0, []])
+        case[0] += count
+        case[1].extend(lines[:REPORT_LINES - len(case[1])])
+
+    def reject(self, kind, reason, line):
+        """Account an entry of kind, at line, rejected for reason"""
+        self._add(self.rejected, (kind, reason), 1, [line])
+
+    def fallback(self, kind, line):
+        """Account an entry of kind, at line, dated as the previous one"""
+        self._add(self.date_fallbacks, kind, 1, [line])
+
+    def merge(self, other):
+        """Add the cases of another report, of the following lines"""
+        for kind, count in other.accepted.items():
+            self.accepted[kind] += count
+        for key, (count, lines) in other.rejected.items():
+            self._add(self.rejected, key, count, lines)
+        for key, (count, lines) in other.date_fallbacks.items():
+            self._add(self.date_fallbacks, key, count, lines)
+        for kind, texts in other.new_categories.items():
+            self.new_categories[kind].update(texts)
+
+    def as_dict(self):
+        """Return the report, as a JSON serializable dictionary"""
+        rejected = {kind: {} for kind in COLUMNS}
+        for (kind, reason), (count, lines) in sorted(self.rejected.items()):
+            rejected[kind][reason] = {'count': count, 'lines': lines}
+        return {
+          'accepted': self.accepted,
+          'rejected': rejected,
+          'date_fallbacks': {
+            kind: {'count': count, 'lines': lines}
+            for kind, (count, lines) in sorted(self.date_fallbacks.items())},
+          'new_categories': {kind: sorted(texts)
+                             for kind, texts in self.new_categories.items()},
+        }
+
+    def report(self):
+        """Return the lines describing the report"""
+        lines = [f"accepted {self.accepted[EXPENSE]} expenses and "
+                 f"{self.accepted[INCOME]} incomes"]
+        for (kind, reason), (count, at) in sorted(self.rejected.items()):
+            lines.append(f"rejected {count} {kind} entries ({reason}), "
+                         f"lines {', '.join(map(str, at))}"
+                         f"{', ...' if count > len(at) else ''}")
+        for kind, (count, at) in sorted(self.date_fallbacks.items()):
+            lines.append(f"dated {count} {kind} entries as the previous "
+                         f"one, lines {', '.join(map(str, at))}"
+                         f"{', ...' if count > len(at) else ''}")
+        for kind, texts in self.new_categories.items():
+            if texts:
+                lines.append(f"new {kind} categories: "
+                             f"{', '.join(sorted(texts))}")
+        return lines
+
+
+@functools.lru_cache()
+def _amount_table(currency_symbol):
+    return str.maketrans('', '', f" {currency_symbol},")
+
+
+def parse_amount(value, currency_symbol=DEFAULT_CURRENCY_SYMBOL):
+    """
+    Return the amount written in value (e.g. "€1,200"), None if not valid.
+    NOTE: assuming "," as thousand separator and no decimals
+    """
+    amount = value.translate(_amount_table(currency_symbol))
+    if not amount.isdecimal():
+        return None
+    return int(amount)
+
+
+def parse_date(value):
+    """
+    Return the date written in value (DATE_FORMAT), None if missing or
+    malformed
+    """
+    # Same as strptime(value, DATE_FORMAT), several times faster
+    parts = value.split('/')
+    if (len(parts) != 3 or len(parts[0]) != 4 or
+            not 1 <= len(parts[1]) <= 2 or not 1 <= len(parts[2]) <= 2 or
+            not all(part.isdecimal() for part in parts)):
+        return None
+    try:
+        return datetime.date(*map(int, parts))
+    except ValueError:
+        return None
+
+
+def check_length(model, field, value):
+    """Return why value does not fit in a field of model, None if it does"""
+    max_length = model._meta.get_field(field).max_length  # pylint: disable=W0212; # noqa
+    if len(value) > max_length:
+        return (f"{model.__name__} {field} is longer than {max_length} "
+                f"characters: {value}")
+    return None
+
+
+def parse_row(row, line, currency_symbol=DEFAULT_CURRENCY_SYMBOL,
+              report=None, strict=True):
+    """
+    Return the entries found in a row of the file, accounting the accepted
+    and rejected ones in report, if passed.
+    Raise InvalidRow if they can not be saved, unless strict is False:
+    reject them instead
+    """
+    entries = []
+    for kind, columns in COLUMNS.items():
+        values = row[columns[0]:columns[-1] + 1]
+        # Blank cells are not worth a mention
+        if not any(value.strip() for value in values):
+            continue
+        if len(values) < len(columns):
+            reason = MISSING_COLUMNS
+        else:
+            date, amount, note, category = values
+            category = category.strip().capitalize()
+            amount = parse_amount(amount, currency_symbol)
+            if category == 'Category':
+                reason = HEADER
+            elif not category:
+                reason = NO_CATEGORY
+            elif amount is None:
+                reason = INVALID_AMOUNT
+            else:
+                model, category_model = MODELS[kind]
+                error = (check_length(model, 'note', note) or
+                         check_length(category_model, 'text', category))
+                if error is None:
+                    reason = None
+                    entries.append(Entry(kind, line, parse_date(date),
+                                         amount, note, category))
+                elif strict:
+                    raise InvalidRow(line, error)
+                else:
+                    reason = TOO_LONG
+        if report is not None:
+            if reason is None:
+                report.accepted[kind] += 1
+            else:
+                report.reject(kind, reason, line)
+    return entries
+
+
+def parse_chunk(first_line, rows, currency_symbol=DEFAULT_CURRENCY_SYMBOL,
+                strict=True):
+    """
+    Return the entries of a chunk of rows, starting at line first_line, the
+    seconds parsing them took, and their Report
+    """
+    start = time.perf_counter()
+    report = Report()
+    entries = [entry for line, row in enumerate(rows, first_line)
+               for entry in parse_row(row, line, currency_symbol, report,
+                                      strict)]
+    return entries, time.perf_counter() - start, report
+
+
+class Lines:  # pylint: disable=R0903; # noqa
+    """
+    Decoded lines of a binary file, to feed csv.reader. Keep the number of
+    bytes read so far, and their sha1
+    """
+
+    def __init__(self, file, encoding=DEFAULT_ENCODING):
+        self.file = file
+        self.encoding = encoding
+        self.offset = 0
+        self.sha1 = hashlib.sha1()
+
+    def __iter__(self):
+        for line in self.file:
+            self.offset += len(line)
+            self.sha1.update(line)
+            yield line.decode(self.encoding)
+
+
+def read_chunks(file, chunk_size=DEFAULT_CHUNK_SIZE,
+                encoding=DEFAULT_ENCODING, stats=None):
+    """Yield the chunks of a CSV binary file object"""
+    lines = Lines(file, encoding)
+    # csv.reader reads as many lines as the row it returns spans: the offset
+    # is always at the end of the last returned row
+    rows = csv.reader(lines, delimiter=',')
+    first_line = 1
+    while True:
+        start = time.perf_counter()
+        chunk = list(itertools.islice(rows, chunk_size))
+        if stats is not None:
+            stats.add(READ, len(chunk), time.perf_counter() - start)
+        if not chunk:
+            break
+        yield Chunk(first_line, chunk, lines.offset, lines.sha1.hexdigest())
+        first_line += len(chunk)
+
+
+def parse_chunks(chunks, currency_symbol=DEFAULT_CURRENCY_SYMBOL, workers=0,
+                 stats=None, report=None, strict=True):
+    """
+    Yield the (chunk, entries) of chunks, in order, parsed by a pool of
+    workers processes (in this process if workers is 0)
+    """
+    def parsed(chunk, result):
+        entries, seconds, chunk_report = result
+        if stats is not None:
+            stats.add(PARSE, len(chunk.rows), seconds)
+        if report is not None:
+            report.merge(chunk_report)
+        return chunk, entries
+
+    if not workers:
+        for chunk in chunks:
+            yield parsed(chunk, parse_chunk(chunk.first_line, chunk.rows,
+                                            currency_symbol, strict))
+        return
+
+    # Workers load the models too (to validate the field lengths)
+    with concurrent.futures.ProcessPoolExecutor(
+            workers, initializer=django.setup) as executor:
+        pending = collections.deque()
+        for chunk in chunks:
+            pending.append((chunk, executor.submit(
+              parse_chunk, chunk.first_line, chunk.rows, currency_symbol,
+              strict)))
+            if len(pending) >= workers * CHUNKS_PER_WORKER:
+                chunk, future = pending.popleft()
+                yield parsed(chunk, future.result())
+        for chunk, future in pending:
+            yield parsed(chunk, future.result())
+
+
+class Sequencer:
+    """
+    Fill the missing dates of entries and fingerprint them: both depend on the
+    entries read before, so entries must be passed in file order
+    """
+
+    def __init__(self, source, stats=None, report=None):
+        self.source = source
+        self.stats = stats
+        self.report = report
+        self.last_dates = dict.fromkeys(COLUMNS, DEFAULT_DATE)
+        # Number of entries read so far, by the first OCCURRENCE_KEY_BYTES of
+        # the sha1 of their fields. Every entry is counted: an identical one
+        # may come at any later line, and restarting its count would give it
+        # the fingerprint of the first one
+        self.seen = {}
+
+    def fingerprint(self, kind, date, entry):
+        """Return the fingerprint of an entry, dated date"""
+        fields = (self.source, kind, date.isoformat(), str(entry.amount),
+                  entry.note, entry.category)
+        digest = hashlib.sha1('\0'.join(fields).encode()).digest()
+        # Identical entries (e.g. two coffees the same day) are told apart by
+        # how many of them precede each one. Different entries sharing a key
+        # only get a higher number: their fingerprints still differ
+        key = int.from_bytes(digest[:OCCURRENCE_KEY_BYTES], 'big')
+        occurrence = self.seen.get(key, 0)
+        self.seen[key] = occurrence + 1
+        if occurrence:
+            digest = hashlib.sha1(digest + str(occurrence).encode()).digest()
+        return digest.hex()
+
+    def __call__(self, entries):
+        """Return entries, with their dates and fingerprints"""
+        start = time.perf_counter()
+        result = []
+        for entry in entries:
+            date = entry.date
+            if date is None:
+                date = self.last_dates[entry.kind]
+                if self.report is not None:
+                    self.report.fallback(entry.kind, entry.line)
+            else:
+                self.last_dates[entry.kind] = date
+            result.append(entry._replace(
+              date=date, fingerprint=self.fingerprint(entry.kind, date,
+                                                      entry)))
+        if self.stats is not None:
+            self.stats.add(HASH, len(result), time.perf_counter() - start)
+        return result
+
+
+def get_category_ids(model, user):
+    """Return the {text: id} dictionary of the categories of user"""
+    return dict(model.objects.filter(created_by=user).values_list('text',
+                                                                  'id'))
+
+
+def get_category_id(categories, model, user, text):
+    """Return the id of a category of user, creating it if missing"""
+    if text not in categories:
+        categories[text] = model.objects.create(text=text, created_by=user).id
+    return categories[text]
+
+
+def get_imported(model, user, fingerprints):
+    """Return the fingerprints already imported by user"""
+    imported = set()
+    fingerprints = list(fingerprints)
+    for i in range(0, len(fingerprints), FINGERPRINTS_PER_QUERY):
+        imported.update(model.objects.filter(
+          created_by=user,
+          import_fingerprint__in=fingerprints[i:i + FINGERPRINTS_PER_QUERY],
+        ).values_list('import_fingerprint', flat=True))
+    return imported
+
+
+def save_entries(entries, user, categories, batch_size=DEFAULT_BATCH_SIZE,
+                 stats=None, report=None, dry_run=False):
+    """
+    Save entries as expenses and incomes of user, in batches of batch_size,
+    skipping the ones already imported. categories are the
+    {kind: {text: id}} categories of user, updated with the created ones
+    (also added to report, if passed).
+    Return the {kind: number of saved entries} dictionary, the number of
+    skipped entries, and the
+    {kind: {(category_id, month): [amount, count, positive amount]}} monthly
+    totals of the saved entries.
+    If dry_run is True, only look up the imported entries: return what would
+    be saved, without totals.
+    NOTE: bulk_create sends no signals, see import_csv()
+    """
+    saved = dict.fromkeys(COLUMNS, 0)
+    skipped = 0
+    totals = {kind: collections.defaultdict(lambda: [0, 0, 0])
+              for kind in COLUMNS}
+    for i in range(0, len(entries), batch_size):
+        batch = entries[i:i + batch_size]
+        start = time.perf_counter()
+        by_kind = {kind: [entry for entry in batch if entry.kind == kind]
+                   for kind in COLUMNS}
+        for kind, kind_entries in by_kind.items():
+            if not kind_entries:
+                continue
+            model, category_model = MODELS[kind]
+            imported = get_imported(model, user,
+                                    (entry.fingerprint
+                                     for entry in kind_entries))
+            instances = []
+            for entry in kind_entries:
+                if entry.fingerprint in imported:
+                    skipped += 1
+                    continue
+                if (report is not None and
+                        entry.category not in categories[kind]):
+                    report.new_categories[kind].add(entry.category)
+                if dry_run:
+                    saved[kind] += 1
+                    continue
+                category_id = get_category_id(categories[kind],
+                                              category_model, user,
+                                              entry.category)
+                instances.append(model(
+                  category_id=category_id, amount=entry.amount,
+                  note=entry.note, date=entry.date, created_by=user,
+                  import_fingerprint=entry.fingerprint))
+                total = totals[kind][(category_id,
+                                      rollups.month_of(entry.date))]
+                total[0] += entry.amount
+                total[1] += 1
+                total[2] += max(entry.amount, 0)
+            if instances:
+                model.objects.bulk_create(instances)
+                saved[kind] += len(instances)
+        if stats is not None:
+            stats.add(LOOKUP if dry_run else WRITE, len(batch),
+                      time.perf_counter() - start)
+    return saved, skipped, totals
+
+
+def add_totals(user, totals):
+    """Add the totals returned by save_entries() to the monthly totals"""
+    # Unlike rollups.rebuild(), this does not read the existing expenses and
+    # incomes again
+    for kind, cells in totals.items():
+        rollup = rollups.ROLLUPS[MODELS[kind][0]]
+        for (category_id, month), (amount, count, positive) in cells.items():
+            rollups.add_totals(rollup, (user.id, category_id, month), amount,
+                               count, positive)
+
+
+def get_resume_line(file, user, source):
+    """
+    Return the last line of file committed by a previous import of source,
+    0 if there is none or if the file changed since then (up to that line)
+    """
+    checkpoint = m.ImportCheckpoint.objects.filter(  # pylint: disable=E1101; # noqa
+                 created_by=user, source=source).first()
+    if checkpoint is None:
+        return 0
+    sha1 = hashlib.sha1()
+    remaining = checkpoint.offset
+    while remaining > 0:
+        block = file.read(min(remaining, 1 << 20))
+        if not block:
+            break
+        sha1.update(block)
+        remaining -= len(block)
+    file.seek(0)
+    if remaining or sha1.hexdigest() != checkpoint.digest:
+        return 0
+    return checkpoint.line
+
+
+def import_csv(file, user, source, batch_size=DEFAULT_BATCH_SIZE,
+               currency_symbol=DEFAULT_CURRENCY_SYMBOL, workers=0,
+               chunk_size=DEFAULT_CHUNK_SIZE, encoding=DEFAULT_ENCODING,
+               stats=None, report=None, dry_run=False):
+    """
+    Import the expenses and incomes of a CSV binary file object (named
+    source) as user, parsing it with workers processes (0: in this process).
+    Each chunk is saved in its own transaction. Account the time spent by
+    each stage in stats (a Stats instance), and what happens to the rows of
+    the file in report (a Report instance), if passed.
+    Return the {kind: number of saved entries} dictionary, the number of
+    entries skipped as imported before, and the line the import resumed from
+    (0 if it started from the beginning).
+    Raise InvalidRow if a row can not be imported: the chunks before it are
+    saved, and importing the file again resumes from there.
+    If dry_run is True, write nothing (not even categories or the
+    checkpoint) and reject the rows which can not be imported instead: return
+    what would be saved and skipped
+    """
+    resume_line = get_resume_line(file, user, source)
+    saved = dict.fromkeys(COLUMNS, 0)
+    skipped = 0
+    months = set()
+    categories = {kind: get_category_ids(model, user)
+                  for kind, (_, model) in MODELS.items()}
+    sequencer = Sequencer(source, stats, report)
+    chunks = read_chunks(file, chunk_size, encoding, stats)
+    try:
+        for chunk, entries in parse_chunks(chunks, currency_symbol, workers,
+                                           stats, report, not dry_run):
+            # Every entry goes through the sequencer, to be fingerprinted
+            # the same way whatever line the import resumes from
+            entries = sequencer(entries)
+            new_entries = [entry for entry in entries
+                           if entry.line > resume_line]
+            skipped += len(entries) - len(new_entries)
+            last_line = chunk.first_line + len(chunk.rows) - 1
+            if last_line <= resume_line:
+                continue
+            if dry_run:
+                chunk_saved, chunk_skipped, _ = save_entries(
+                  new_entries, user, categories, batch_size, stats, report,
+                  dry_run=True)
+                for kind, count in chunk_saved.items():
+                    saved[kind] += count
+                skipped += chunk_skipped
+                continue
+            with transaction.atomic():
+                chunk_saved, chunk_skipped, totals = save_entries(
+                  new_entries, user, categories, batch_size, stats, report)
+                start = time.perf_counter()
+                add_totals(user, totals)
+                m.ImportCheckpoint.objects.update_or_create(  # pylint: disable=E1101; # noqa
+                  created_by=user, source=source,
+                  defaults={'line': last_line, 'offset': chunk.offset,
+                            'digest': chunk.digest})
+                if stats is not None:
+                    stats.add(WRITE, 0, time.perf_counter() - start)
+                if any(chunk_saved.values()):
+                    versions.bump(user.id)
+            for kind, count in chunk_saved.items():
+                saved[kind] += count
+            skipped += chunk_skipped
+            months.update(month for _, month in totals[EXPENSE])
+    finally:
+        # Render the graphs of the committed chunks, even if a later one failed
+        if background.is_enabled():
+            for month in sorted(months):
+                transaction.on_commit(
+                  lambda month=month: utils.rerender_expenses_pie_graph(
+                    user, month))
+    return saved, skipped, resume_line
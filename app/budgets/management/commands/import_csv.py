@@ -0,0 +1,103 @@
+# Copyright: (c) 2020, Michele Valsecchi <https://github.com/MicheleV>
+# GNU General Public License v3.0+
+# (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+import json
+import os
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.core.management.base import CommandError
+
+from budgets import importer
+
+
+class Command(BaseCommand):
+    """Import expenses and incomes from a CSV file"""
+
+    help = ("Import the expenses and incomes of a CSV export of the budget "
+            "spreadsheet (see tools/csv_parser/sample.csv) as a user. "
+            "Entries imported before are skipped")
+
+    def write_report(self, path, data):
+        """Write the JSON report to path ('-': the standard output)"""
+        if path == '-':
+            self.stdout.write(json.dumps(data, indent=2))
+            return
+        try:
+            with open(path, 'w') as file:
+                json.dump(data, file, indent=2)
+        except OSError as error:
+            raise CommandError(error)
+
+    def add_arguments(self, parser):
+        parser.add_argument('csv_file', help="Path of the CSV file")
+        parser.add_argument('--user', required=True, dest='username',
+                            help="Owner of the imported entries")
+        parser.add_argument('--source',
+                            help="Name identifying the file, to skip the "
+                                 "entries imported from it before (default: "
+                                 "the file name)")
+        parser.add_argument('--batch-size', type=int,
+                            default=importer.DEFAULT_BATCH_SIZE,
+                            help="Entries saved with each INSERT")
+        parser.add_argument('--workers', type=int, default=0,
+                            help="Processes parsing the file (default: parse "
+                                 "it in this process)")
+        parser.add_argument('--chunk-size', type=int,
+                            default=importer.DEFAULT_CHUNK_SIZE,
+                            help="Rows read and parsed at once")
+        parser.add_argument('--currency-symbol',
+                            default=importer.DEFAULT_CURRENCY_SYMBOL,
+                            help="Symbol to strip from the amounts")
+        parser.add_argument('--dry-run', action='store_true',
+                            help="Parse the whole file and report what would "
+                                 "be imported, without writing anything")
+        parser.add_argument('--report', metavar='PATH',
+                            help="Write a JSON report of the rows accepted "
+                                 "and rejected, the categories created and "
+                                 "the throughput to PATH ('-' for the "
+                                 "standard output)")
+
+    def handle(self, *args, **options):
+        for option in ('batch_size', 'chunk_size'):
+            if options[option] < 1:
+                raise CommandError(f"--{option.replace('_', '-')} must be a "
+                                   "positive integer")
+        if options['workers'] < 0:
+            raise CommandError("--workers must not be negative")
+        try:
+            user = User.objects.get(username=options['username'])
+        except User.DoesNotExist:
+            raise CommandError(f"Unknown user: {options['username']}")
+
+        source = options['source'] or os.path.basename(options['csv_file'])
+        dry_run = options['dry_run']
+        stats = importer.Stats()
+        report = importer.Report()
+        try:
+            with open(options['csv_file'], 'rb') as file:
+                saved, skipped, resume_line = importer.import_csv(
+                  file, user, source, options['batch_size'],
+                  options['currency_symbol'], options['workers'],
+                  options['chunk_size'], stats=stats, report=report,
+                  dry_run=dry_run)
+        except OSError as error:
+            raise CommandError(error)
+        except importer.InvalidRow as error:
+            raise CommandError(f"{error}\nThe chunks before it were saved: "
+                               "import the fixed file again to resume")
+        if resume_line:
+            self.stdout.write(f"Resumed after line {resume_line}")
+        self.stdout.write(self.style.SUCCESS(
+          f"{'Would create' if dry_run else 'Created'} "
+          f"{saved[importer.EXPENSE]} expenses and "
+          f"{saved[importer.INCOME]} incomes, "
+          f"{'would skip' if dry_run else 'skipped'} {skipped} entries "
+          "imported before"))
+        for line in report.report() + stats.report(options['workers']):
+            self.stdout.write(line)
+        if options['report']:
+            self.write_report(options['report'], dict(
+              source=source, dry_run=dry_run, resumed_after_line=resume_line,
+              saved=saved, skipped=skipped, **report.as_dict(),
+              stages=stats.as_dict()))
@@ -0,0 +1,32 @@
+# Copyright: (c) 2020, Michele Valsecchi <https://github.com/MicheleV>
+# GNU General Public License v3.0+
+# (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.core.management.base import CommandError
+
+from budgets import rollups
+
+
+class Command(BaseCommand):
+    """Compute again the monthly totals from the expenses and incomes"""
+
+    help = ("Rebuild the monthly totals of expenses and incomes "
+            "(MonthlyCategoryTotal, MonthlyIncomeCategoryTotal)")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', action='append', dest='usernames',
+                            help="Rebuild the totals of this user only "
+                                 "(can be repeated)")
+
+    def handle(self, *args, **options):
+        users = None
+        if options['usernames']:
+            users = list(User.objects.filter(
+                         username__in=options['usernames']))
+            missing = set(options['usernames']) - {u.username for u in users}
+            if missing:
+                raise CommandError(f"Unknown users: {', '.join(sorted(missing))}")
+
+        created = rollups.rebuild(users=users)
+        self.stdout.write(self.style.SUCCESS(f"Created {created} monthly totals"))
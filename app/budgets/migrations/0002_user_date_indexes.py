@@ -0,0 +1,29 @@
+# Generated by Django 2.2.13 on 2026-10-18 18:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('budgets', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='expense',
+            index=models.Index(fields=['created_by', 'date', 'id'], name='expense_user_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='income',
+            index=models.Index(fields=['created_by', 'date', 'id'], name='income_user_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='monthlybalance',
+            index=models.Index(fields=['created_by', 'date'], name='monthlybalance_user_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='monthlybudget',
+            index=models.Index(fields=['created_by', 'date'], name='monthlybudget_user_date_idx'),
+        ),
+    ]
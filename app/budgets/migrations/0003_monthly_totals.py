@@ -0,0 +1,67 @@
+# Generated by Django 2.2.13 on 2026-10-18 18:49
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+from django.db.models import Sum
+from django.db.models.functions import TruncMonth
+import django.db.models.deletion
+
+
+def compute_totals(apps, schema_editor):
+    """Fill the totals of the existing expenses and incomes"""
+    for source, rollup in (('Expense', 'MonthlyCategoryTotal'),
+                           ('Income', 'MonthlyIncomeCategoryTotal')):
+        source = apps.get_model('budgets', source)
+        rollup = apps.get_model('budgets', rollup)
+        rows = source.objects.filter(created_by__isnull=False).annotate(
+               month=TruncMonth('date')).values(
+               'created_by', 'category', 'month').annotate(
+               amount_sum=Sum('amount'), transactions=Count('id')).order_by()
+        rollup.objects.bulk_create([
+          rollup(created_by_id=row['created_by'], category_id=row['category'],
+                 date=row['month'], amount=row['amount_sum'],
+                 count=row['transactions'])
+          for row in rows], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('budgets', '0002_user_date_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MonthlyIncomeCategoryTotal',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('amount', models.IntegerField(default=0)),
+                ('count', models.IntegerField(default=0)),
+                ('category', models.ForeignKey(default=None, null=True, on_delete=django.db.models.deletion.CASCADE, to='budgets.IncomeCategory')),
+                ('created_by', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='MonthlyCategoryTotal',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('amount', models.IntegerField(default=0)),
+                ('count', models.IntegerField(default=0)),
+                ('category', models.ForeignKey(default=None, null=True, on_delete=django.db.models.deletion.CASCADE, to='budgets.Category')),
+                ('created_by', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='monthlyincomecategorytotal',
+            constraint=models.UniqueConstraint(fields=('created_by', 'date', 'category'), name='income-total-per-month'),
+        ),
+        migrations.AddConstraint(
+            model_name='monthlycategorytotal',
+            constraint=models.UniqueConstraint(fields=('created_by', 'date', 'category'), name='expense-total-per-month'),
+        ),
+        migrations.RunPython(compute_totals, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 2.2.13 on 2026-10-18 20:08
+
+from django.db import migrations, models
+from django.db.models import Sum
+from django.db.models.functions import TruncMonth
+
+
+def compute_positive_totals(apps, schema_editor):
+    """Fill the positive amounts of the existing totals"""
+    for source, rollup in (('Expense', 'MonthlyCategoryTotal'),
+                           ('Income', 'MonthlyIncomeCategoryTotal')):
+        source = apps.get_model('budgets', source)
+        rollup = apps.get_model('budgets', rollup)
+        rows = source.objects.filter(
+               created_by__isnull=False, amount__gt=0).annotate(
+               month=TruncMonth('date')).values(
+               'created_by', 'category', 'month').annotate(
+               positive_sum=Sum('amount')).order_by()
+        for row in rows:
+            rollup.objects.filter(
+              created_by_id=row['created_by'], category_id=row['category'],
+              date=row['month']).update(positive_amount=row['positive_sum'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('budgets', '0004_import_fingerprints'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='monthlycategorytotal',
+            name='positive_amount',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='monthlyincomecategorytotal',
+            name='positive_amount',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(compute_positive_totals,
+                             migrations.RunPython.noop),
+    ]
@@ -38,6 +38,21 @@ class Expense(models.Model):  # pylint: disable=C0115; # noqa
     date = models.DateField()
     created_by = models.ForeignKey(User, default=None,
                                    null=True, on_delete=models.SET_NULL)
+    # Set for expenses imported from a file (see budgets.importer), to never
+    # import them twice
+    import_fingerprint = models.CharField(max_length=40, null=True,
+                                          blank=True, editable=False)
+
+    class Meta:   # pylint: disable=C0115,R0903; # noqa
+        # Expenses are always listed per user, in a date range, by date/id
+        indexes = [
+          models.Index(fields=['created_by', 'date', 'id'],
+                       name='expense_user_date_idx'),
+        ]
+        constraints = [
+          models.UniqueConstraint(fields=['created_by', 'import_fingerprint'],
+                                  name="expense-import-fingerprint")
+        ]
 
     def __str__(self):
         id = self.category.id  # pylint: disable=C0103; # noqa
@@ -57,6 +72,10 @@ class MonthlyBudget(models.Model):  # pylint: disable=C0115; # noqa
 
     class Meta:   # pylint: disable=C0115,R0903; # noqa
         unique_together = ('category', 'date')
+        indexes = [
+          models.Index(fields=['created_by', 'date'],
+                       name='monthlybudget_user_date_idx'),
+        ]
 
 
 class IncomeCategory(models.Model):  # pylint: disable=C0115; # noqa
@@ -85,6 +104,19 @@ class Income(models.Model):  # pylint: disable=C0115; # noqa
     date = models.DateField()
     created_by = models.ForeignKey(User, default=None,
                                    null=True, on_delete=models.SET_NULL)
+    # Set for incomes imported from a file (see budgets.importer)
+    import_fingerprint = models.CharField(max_length=40, null=True,
+                                          blank=True, editable=False)
+
+    class Meta:   # pylint: disable=C0115,R0903; # noqa
+        indexes = [
+          models.Index(fields=['created_by', 'date', 'id'],
+                       name='income_user_date_idx'),
+        ]
+        constraints = [
+          models.UniqueConstraint(fields=['created_by', 'import_fingerprint'],
+                                  name="income-import-fingerprint")
+        ]
 
     def __str__(self):
         id = self.category.id
@@ -133,6 +165,10 @@ class MonthlyBalance(models.Model):  # pylint: disable=C0115; # noqa
         # FIXME: unique should be (name + created_by) not only name, as we have
         # multiple users now
         unique_together = ('category', 'date')
+        indexes = [
+          models.Index(fields=['created_by', 'date'],
+                       name='monthlybalance_user_date_idx'),
+        ]
 
     def get_absolute_url(self):
         return reverse('budgets:edit_monthly_balance', args=[str(self.pk)])
@@ -154,3 +190,70 @@ class Goal(models.Model):  # pylint: disable=C0115; # noqa
         amount = self.amount
         text = self.text
         return f"{id}: {amount}, {text}"
+
+
+# NOTE: the following tables are derived from Expense and Income, and are kept
+# up to date by budgets.rollups. Rebuild them with `manage.py rebuild_rollups`
+class MonthlyCategoryTotal(models.Model):  # pylint: disable=C0115; # noqa
+    category = models.ForeignKey(Category, default=None, null=True,
+                                 on_delete=models.CASCADE)
+    # First day of the month
+    date = models.DateField()
+    # Sum and number of the expenses of the category in that month
+    amount = models.IntegerField(default=0)
+    count = models.IntegerField(default=0)
+    # Sum of the positive ones only (refunds excluded), shown by reports
+    positive_amount = models.IntegerField(default=0)
+    created_by = models.ForeignKey(User, on_delete=models.CASCADE)
+
+    class Meta:   # pylint: disable=C0115,R0903; # noqa
+        constraints = [
+          models.UniqueConstraint(fields=['created_by', 'date', 'category'],
+                                  name="expense-total-per-month")
+        ]
+
+    def __str__(self):
+        return f"{self.category_id}: {self.amount} ({self.count}), {self.date}"
+
+
+class MonthlyIncomeCategoryTotal(models.Model):  # pylint: disable=C0115; # noqa
+    category = models.ForeignKey(IncomeCategory, default=None, null=True,
+                                 on_delete=models.CASCADE)
+    # First day of the month
+    date = models.DateField()
+    # Sum and number of the incomes of the category in that month
+    amount = models.IntegerField(default=0)
+    count = models.IntegerField(default=0)
+    # Sum of the positive ones only
+    positive_amount = models.IntegerField(default=0)
+    created_by = models.ForeignKey(User, on_delete=models.CASCADE)
+
+    class Meta:   # pylint: disable=C0115,R0903; # noqa
+        constraints = [
+          models.UniqueConstraint(fields=['created_by', 'date', 'category'],
+                                  name="income-total-per-month")
+        ]
+
+    def __str__(self):
+        return f"{self.category_id}: {self.amount} ({self.count}), {self.date}"
+
+
+class ImportCheckpoint(models.Model):  # pylint: disable=C0115; # noqa
+    # Name of the imported file
+    source = models.CharField(max_length=255)
+    # Last line whose entries were committed, the size in bytes of the file up
+    # to that line, and the sha1 of those bytes
+    line = models.PositiveIntegerField(default=0)
+    offset = models.BigIntegerField(default=0)
+    digest = models.CharField(max_length=40)
+    updated = models.DateTimeField(auto_now=True)
+    created_by = models.ForeignKey(User, on_delete=models.CASCADE)
+
+    class Meta:   # pylint: disable=C0115,R0903; # noqa
+        constraints = [
+          models.UniqueConstraint(fields=['created_by', 'source'],
+                                  name="import-checkpoint-per-file")
+        ]
+
+    def __str__(self):
+        return f"{self.source}: line {self.line} ({self.offset} bytes)"
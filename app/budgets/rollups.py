@@ -0,0 +1,195 @@
+# Copyright: (c) 2020, Michele Valsecchi <https://github.com/MicheleV>
+# GNU General Public License v3.0+
+# (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+"""
+Monthly totals of expenses and incomes, per user and category
+
+MonthlyCategoryTotal (MonthlyIncomeCategoryTotal) holds the sum and the number
+of the expenses (incomes) of each user, category and month: reports spanning
+long periods read months x categories rows instead of every transaction.
+The monthly expenses report and pie graph read them (see
+budgets.views_utils.get_month_expenses_by_category).
+
+Totals are updated by the signal handlers in budgets.signals whenever a single
+expense or income is saved or deleted. Operations bypassing signals, such as
+QuerySet.update() or bulk_create(), must call rebuild() (or add_totals())
+afterwards.
+"""
+import datetime
+
+from django.db import IntegrityError
+from django.db import transaction
+from django.db.models import Case
+from django.db.models import Count
+from django.db.models import F
+from django.db.models import IntegerField
+from django.db.models import Sum
+from django.db.models import When
+from django.db.models.functions import TruncMonth
+
+import budgets.models as m
+
+
+ROLLUPS = {
+  m.Expense: m.MonthlyCategoryTotal,
+  m.Income: m.MonthlyIncomeCategoryTotal,
+}
+
+# Fields an instance must have loaded to find its totals
+TRACKED_FIELDS = {'amount', 'category_id', 'created_by_id', 'date'}
+# Previous values of an instance that could not be read (deferred fields)
+UNKNOWN = 'unknown'
+
+
+def month_of(date):
+    """
+    Return the first day of the month of date (a date, or a YYYY-mm or
+    YYYY-mm-dd string)
+    """
+    if isinstance(date, str):
+        date = datetime.datetime.strptime(date[:7], '%Y-%m').date()
+    return date.replace(day=1)
+
+
+def get_cell(instance):
+    """
+    Return the (created_by_id, category_id, month) tuple identifying the
+    total instance counts in, and its amount.
+    Return None if instance is not owned by any user
+    """
+    if instance.created_by_id is None:
+        return None
+    key = (instance.created_by_id, instance.category_id,
+           month_of(instance.date))
+    return key, int(instance.amount)
+
+
+def add_totals(rollup, key, amount, count, positive_amount):
+    """
+    Add amount, count and positive_amount (the sum of the positive amounts
+    only) to a total, creating it if missing and removing it once it counts
+    no transaction
+    """
+    created_by_id, category_id, date = key
+    totals = rollup.objects.filter(created_by_id=created_by_id,
+                                   category_id=category_id, date=date)
+    changes = {'amount': F('amount') + amount, 'count': F('count') + count,
+               'positive_amount': F('positive_amount') + positive_amount}
+    with transaction.atomic():
+        updated = totals.update(**changes)
+        if not updated:
+            try:
+                with transaction.atomic():
+                    rollup.objects.create(
+                      created_by_id=created_by_id, category_id=category_id,
+                      date=date, amount=amount, count=count,
+                      positive_amount=positive_amount)
+            except IntegrityError:
+                # Created by a concurrent request in the meantime
+                totals.update(**changes)
+        if count < 0:
+            totals.filter(count__lte=0).delete()
+
+
+def snapshot(instance):
+    """
+    Remember the total a stored instance counts in, to move its amount out of
+    it when the instance is changed or deleted
+    """
+    if instance.pk is None:
+        cell = None
+    elif TRACKED_FIELDS & instance.get_deferred_fields():
+        cell = UNKNOWN
+    else:
+        cell = get_cell(instance)
+    instance._rollup_cell = cell  # pylint: disable=W0212; # noqa
+
+
+def on_saved(instance, created):
+    """Update the totals after an expense or income was saved"""
+    previous = None if created else getattr(instance, '_rollup_cell', UNKNOWN)
+    if previous == UNKNOWN:
+        rebuild(users=[instance.created_by_id])
+    else:
+        current = get_cell(instance)
+        if previous != current:
+            rollup = ROLLUPS[type(instance)]
+            if previous is not None:
+                add_totals(rollup, previous[0], -previous[1], -1,
+                           -max(previous[1], 0))
+            if current is not None:
+                add_totals(rollup, current[0], current[1], 1,
+                           max(current[1], 0))
+    snapshot(instance)
+
+
+def before_deleted(instance):
+    """
+    Read the total an instance about to be deleted counts in, if it was not
+    known when the instance was loaded (see snapshot())
+    """
+    if getattr(instance, '_rollup_cell', UNKNOWN) == UNKNOWN:
+        stored = type(instance).objects.filter(pk=instance.pk).first()
+        if stored is not None:
+            instance._rollup_cell = stored._rollup_cell  # pylint: disable=W0212; # noqa
+
+
+def on_deleted(instance):
+    """Update the totals after an expense or income was deleted"""
+    previous = getattr(instance, '_rollup_cell', UNKNOWN)
+    if previous == UNKNOWN:
+        # The row was gone already before_deleted(): recompute the totals of
+        # its owner (of everybody, if that is unknown too)
+        if 'created_by_id' in instance.get_deferred_fields():
+            rebuild()
+        else:
+            rebuild(users=[instance.created_by_id])
+    elif previous is not None:
+        add_totals(ROLLUPS[type(instance)], previous[0], -previous[1], -1,
+                   -max(previous[1], 0))
+
+
+def rebuild(users=None):
+    """
+    Compute again every total (of the given users only, if passed) from the
+    expenses and incomes. Return the number of totals created
+    """
+    created = 0
+    positive_amount = Case(When(amount__gt=0, then='amount'), default=0,
+                           output_field=IntegerField())
+    with transaction.atomic():
+        for model, rollup in ROLLUPS.items():
+            source = model.objects.filter(created_by__isnull=False)
+            totals = rollup.objects.all()
+            if users is not None:
+                source = source.filter(created_by__in=users)
+                totals = totals.filter(created_by__in=users)
+            totals.delete()
+
+            rows = source.annotate(month=TruncMonth('date')).values(
+                   'created_by', 'category', 'month').annotate(
+                   amount_sum=Sum('amount'), transactions=Count('id'),
+                   positive_sum=Sum(positive_amount)).order_by()
+            created += len(rollup.objects.bulk_create([
+              rollup(created_by_id=row['created_by'],
+                     category_id=row['category'], date=row['month'],
+                     amount=row['amount_sum'], count=row['transactions'],
+                     positive_amount=row['positive_sum'])
+              for row in rows], batch_size=500))
+    return created
+
+
+def get_monthly_totals(rollup, user, start=None, end=None, category_id=None):
+    """
+    Return the totals of user, oldest month first, optionally limited to a
+    range of months (dates, extremes included) and to a single category
+    """
+    filters = {'created_by': user}
+    if start is not None:
+        filters['date__gte'] = month_of(start)
+    if end is not None:
+        filters['date__lte'] = month_of(end)
+    if category_id is not None:
+        filters['category_id'] = category_id
+    return rollup.objects.select_related('category').filter(
+           **filters).order_by('date', 'category_id')
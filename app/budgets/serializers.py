@@ -3,12 +3,18 @@
 # (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
 import os
 
+from django.db.models import Case
+from django.db.models import F
+from django.db.models import IntegerField
+from django.db.models import When
 from rest_framework import serializers
 
 from budgets.models import Category
 from budgets.models import Expense
 from budgets.models import MonthlyBalanceCategory
 from budgets.models import MonthlyBalance
+from budgets.models import MonthlyCategoryTotal
+from budgets.models import MonthlyIncomeCategoryTotal
 
 
 class CategorySerializer(serializers.ModelSerializer):  # pylint: disable=C0115; # noqa
@@ -45,3 +51,52 @@ class MonthlyBalanceSerializer(serializers.ModelSerializer):  # pylint: disable=
     class Meta:  # pylint: disable=C0115,R0903; # noqa
         model = MonthlyBalance
         fields = ['id', 'amount', 'category_id', 'category_text', 'category_is_foreign_currency', 'date']
+
+
+class MonthlyCategoryTotalSerializer(serializers.ModelSerializer):  # pylint: disable=C0115; # noqa
+    category_text = serializers.CharField(source='category.text', default=None)
+
+    class Meta:  # pylint: disable=C0115,R0903; # noqa
+        model = MonthlyCategoryTotal
+        fields = ['date', 'category_id', 'category_text', 'amount', 'count']
+
+
+class MonthlyIncomeCategoryTotalSerializer(serializers.ModelSerializer):  # pylint: disable=C0115; # noqa
+    category_text = serializers.CharField(source='category.text', default=None)
+
+    class Meta:  # pylint: disable=C0115,R0903; # noqa
+        model = MonthlyIncomeCategoryTotal
+        fields = ['date', 'category_id', 'category_text', 'amount', 'count']
+
+
+# Read only fast path of the list endpoints: rows with the same keys and values
+# of ExpenseSerializer and MonthlyBalanceSerializer, built by the DB with
+# .values() (category fields joined, and currency converted, in SQL) instead
+# of going through the serializer fields of every instance
+MONTHLY_BALANCE_FIELDS = ('id', 'amount', 'category_id', 'category_text',
+                          'category_is_foreign_currency', 'date')
+
+
+def expense_rows(queryset):
+    """Return the rows of ExpenseSerializer, as a values() queryset"""
+    return queryset.values('id', 'amount', 'category_id', 'note', 'date',
+                           category_text=F('category__text'))
+
+
+def monthly_balance_rows(queryset, rate=None):
+    """
+    Return the rows of MonthlyBalanceSerializer, as a list of dicts.
+    Foreign currency amounts are multiplied by rate (EXCHANGE_RATE if None)
+    """
+    if rate is None:
+        rate = int(os.getenv("EXCHANGE_RATE"))
+    # The converted amount can not be annotated as 'amount', a model field
+    rows = queryset.annotate(
+           actual_amount=Case(When(category__is_foreign_currency=True,
+                                   then=F('amount') * rate),
+                              default=F('amount'), output_field=IntegerField()),
+           category_text=F('category__text'),
+           category_is_foreign_currency=F('category__is_foreign_currency'),
+           ).values_list('id', 'actual_amount', 'category_id', 'category_text',
+                         'category_is_foreign_currency', 'date')
+    return [dict(zip(MONTHLY_BALANCE_FIELDS, row)) for row in rows]
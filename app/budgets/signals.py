@@ -0,0 +1,180 @@
+# Copyright: (c) 2020, Michele Valsecchi <https://github.com/MicheleV>
+# GNU General Public License v3.0+
+# (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models.signals import post_delete
+from django.db.models.signals import post_init
+from django.db.models.signals import post_save
+from django.db.models.signals import pre_delete
+from django.dispatch import receiver
+
+from budgets import dashboard
+import budgets.models as m
+from budgets import rollups
+from budgets import versions
+import budgets.views_utils as utils
+from graphs import background
+
+
+# Rows owned by users, whose owner the post_delete receivers below read
+OWNED_MODELS = [m.Category, m.Expense, m.MonthlyBudget, m.IncomeCategory,
+                m.Income, m.MonthlyBalanceCategory, m.MonthlyBalance, m.Goal]
+
+
+def get_owner_ids(instance):
+    """
+    Return the ids of the users instance may belong to: its owner, or every
+    user if created_by was not loaded (deleted rows can not be loaded anymore)
+    """
+    if 'created_by_id' in instance.get_deferred_fields():
+        return list(User.objects.values_list('id', flat=True))
+    if instance.created_by_id is None:
+        return []
+    return [instance.created_by_id]
+
+
+@receiver(pre_delete)
+def load_owner(sender, instance, **kwargs):  # pylint: disable=W0613; # noqa
+    """Load the owner of a row about to be deleted, if it was deferred"""
+    if (sender in OWNED_MODELS and
+            'created_by_id' in instance.get_deferred_fields()):
+        try:
+            instance.refresh_from_db(fields=['created_by'])
+        except sender.DoesNotExist:
+            # Deleted in the meantime: get_owner_ids() falls back to everybody
+            pass
+
+
+# NOTE: graphs are re-rendered only once the transaction is committed, so the
+# rendering processes never draw data that could still be rolled back
+@receiver(pre_delete, sender=m.Expense)
+@receiver(pre_delete, sender=m.MonthlyBalance)
+def load_graph_date(sender, instance, **kwargs):  # pylint: disable=W0613; # noqa
+    """Load the date of a row about to be deleted, if it was deferred"""
+    if background.is_enabled() and 'date' in instance.get_deferred_fields():
+        try:
+            instance.refresh_from_db(fields=['date'])
+        except sender.DoesNotExist:
+            pass
+
+
+def get_graph_owner(instance):
+    """
+    Return the owner of a changed row, without loading it (deleted rows can
+    not be loaded anymore): None if it is unknown
+    """
+    if ('created_by_id' in instance.get_deferred_fields() or
+            instance.created_by_id is None):
+        return None
+    return instance.created_by
+
+
+def get_graph_date(instance):
+    """Same as get_graph_owner(), for the date of the row"""
+    if 'date' in instance.get_deferred_fields():
+        return None
+    return instance.date
+
+
+@receiver([post_save, post_delete], sender=m.Expense)
+def rerender_expenses_graphs(sender, instance, **kwargs):  # pylint: disable=W0613; # noqa
+    """Render in background the pie graph of the changed expense month"""
+    if background.is_enabled():
+        user, date = get_graph_owner(instance), get_graph_date(instance)
+        if user is not None and date is not None:
+            transaction.on_commit(
+              lambda: utils.rerender_expenses_pie_graph(user, date))
+
+
+@receiver([post_save, post_delete], sender=m.MonthlyBalance)
+def rerender_monthly_balance_graphs(sender, instance, **kwargs):  # pylint: disable=W0613; # noqa
+    """Render in background the graphs showing the changed balance"""
+    if background.is_enabled():
+        user, date = get_graph_owner(instance), get_graph_date(instance)
+        if user is not None:
+            # Without a date, only the bar graph can be found
+            transaction.on_commit(
+              lambda: utils.rerender_monthly_balance_graphs(user, date))
+
+
+@receiver([post_save, post_delete], sender=m.Goal)
+def rerender_goal_graphs(sender, instance, **kwargs):  # pylint: disable=W0613; # noqa
+    """Render in background the bar graph showing the goals"""
+    if background.is_enabled():
+        user = get_graph_owner(instance)
+        if user is not None:
+            transaction.on_commit(
+              lambda: utils.rerender_monthly_balance_graphs(user))
+
+
+# Monthly totals (see budgets.rollups)
+@receiver(post_init, sender=m.Expense)
+@receiver(post_init, sender=m.Income)
+def snapshot_rollup_cell(sender, instance, **kwargs):  # pylint: disable=W0613; # noqa
+    """Remember which monthly total a loaded instance counts in"""
+    rollups.snapshot(instance)
+
+
+@receiver(post_save, sender=m.Expense)
+@receiver(post_save, sender=m.Income)
+def update_rollups_on_save(sender, instance, created, raw, **kwargs):  # pylint: disable=W0613; # noqa
+    """Move the amount of the saved instance to its monthly total"""
+    # Fixtures are loaded as they are: run `manage.py rebuild_rollups` after
+    if not raw:
+        rollups.on_saved(instance, created)
+
+
+@receiver(pre_delete, sender=m.Expense)
+@receiver(pre_delete, sender=m.Income)
+def load_rollup_cell(sender, instance, **kwargs):  # pylint: disable=W0613; # noqa
+    """Read the monthly total of the instance about to be deleted"""
+    rollups.before_deleted(instance)
+
+
+@receiver(post_delete, sender=m.Expense)
+@receiver(post_delete, sender=m.Income)
+def update_rollups_on_delete(sender, instance, **kwargs):  # pylint: disable=W0613; # noqa
+    """Remove the amount of the deleted instance from its monthly total"""
+    rollups.on_deleted(instance)
+
+
+@receiver(post_delete, sender=m.Category)
+@receiver(post_delete, sender=m.IncomeCategory)
+def rebuild_rollups_on_category_delete(sender, instance, **kwargs):  # pylint: disable=W0613; # noqa
+    """
+    Deleting a category leaves its transactions without a category, via an
+    UPDATE sending no signal: recompute the totals of the category owner
+    """
+    users = get_owner_ids(instance)
+    if users:
+        rollups.rebuild(users=users)
+
+
+# Home page snapshots (see budgets.dashboard)
+@receiver([post_save, post_delete], sender=m.MonthlyBalance)
+@receiver([post_save, post_delete], sender=m.MonthlyBalanceCategory)
+@receiver([post_save, post_delete], sender=m.Goal)
+def invalidate_dashboard(sender, instance, **kwargs):  # pylint: disable=W0613; # noqa
+    """Outdate the home page snapshots of the owner of the changed row"""
+    for user_id in get_owner_ids(instance):
+        # Concurrent requests may cache a snapshot of the data before the
+        # transaction is committed: outdate it once more after the commit
+        dashboard.invalidate(user_id)
+        transaction.on_commit(
+          lambda user_id=user_id: dashboard.invalidate(user_id))
+
+
+# API data versions (see budgets.versions)
+@receiver([post_save, post_delete], sender=m.Category)
+@receiver([post_save, post_delete], sender=m.Expense)
+@receiver([post_save, post_delete], sender=m.MonthlyBudget)
+@receiver([post_save, post_delete], sender=m.IncomeCategory)
+@receiver([post_save, post_delete], sender=m.Income)
+@receiver([post_save, post_delete], sender=m.MonthlyBalanceCategory)
+@receiver([post_save, post_delete], sender=m.MonthlyBalance)
+@receiver([post_save, post_delete], sender=m.Goal)
+def bump_data_version(sender, instance, **kwargs):  # pylint: disable=W0613; # noqa
+    """Outdate the API responses of the owner of the changed row"""
+    for user_id in get_owner_ids(instance):
+        versions.bump(user_id)
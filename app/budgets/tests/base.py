@@ -9,6 +9,7 @@ import string
 from dotenv import load_dotenv
 
 from django.contrib.auth.models import User
+from django.core.cache import cache
 from django.test import TestCase
 from django.urls import resolve
 from django.urls import reverse
@@ -24,6 +25,8 @@ class BaseTest(TestCase):
 
     def setUp(self):  # pylint: disable=C0103; # noqa
         """BaseTest signup, called once per test (method)"""
+        # Users ids are reused among tests: drop their cached home pages
+        cache.clear()
         self._sign_up()
 
     @staticmethod
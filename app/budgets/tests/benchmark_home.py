@@ -0,0 +1,100 @@
+# Copyright: (c) 2020, Michele Valsecchi <https://github.com/MicheleV>
+# GNU General Public License v3.0+
+# (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+"""
+Measure the home page latency as the number of users in the DB grows
+
+Every user owns MONTHS x CATEGORIES monthly balances and a goal: the page of
+a single user must cost the same whatever the size of the installation.
+The home page snapshot cache is disabled, so that every request hits the DB.
+
+Not collected by `manage.py test` (the file name does not start with test),
+run it explicitly with:
+    python manage.py test budgets.tests.benchmark_home
+"""
+import datetime
+import os
+import statistics
+import time
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+import budgets.models as m
+from budgets.tests.base import BaseTest
+import budgets.views_utils as utils
+
+USERS = (10, 100, 1000, 10000)
+MONTHS = 24
+CATEGORIES = 2
+RUNS = 30
+
+
+class HomePageBenchmark(BaseTest):
+    """Print the median home page latency for a growing number of users"""
+
+    def add_users(self, count):
+        """Create count users, each with their balances and goals"""
+        first = User.objects.count()
+        if count <= 0:
+            return
+        users = User.objects.bulk_create([
+          User(username=f"user{first + i}") for i in range(count)])
+        if connection.vendor != 'postgresql':
+            # Only Postgres sets the primary keys on bulk_create
+            users = list(User.objects.order_by('-id')[:count])
+        self.add_data(users)
+
+    @staticmethod
+    def add_data(users):
+        """Create the balances and goals of users"""
+        categories = m.MonthlyBalanceCategory.objects.bulk_create([  # pylint: disable=E1101; # noqa
+          m.MonthlyBalanceCategory(text=f"category {i}", created_by=user,
+                                   is_foreign_currency=i == 0)
+          for user in users for i in range(CATEGORIES)])
+        if connection.vendor != 'postgresql':
+            categories = list(m.MonthlyBalanceCategory.objects.select_related(  # pylint: disable=E1101; # noqa
+                         'created_by').order_by('-id')[:len(categories)])
+
+        balances = []
+        for category in categories:
+            date = datetime.date.today().replace(day=1)
+            for _ in range(MONTHS):
+                balances.append(m.MonthlyBalance(
+                  category=category, amount=1000, date=date,
+                  created_by_id=category.created_by_id))
+                date = utils.get_previous_month_first_day_date(date)
+        m.MonthlyBalance.objects.bulk_create(balances)  # pylint: disable=E1101; # noqa
+        m.Goal.objects.bulk_create([  # pylint: disable=E1101; # noqa
+          m.Goal(amount=100000, text=f"goal {user.id}", note=f"note {user.id}",
+                 created_by=user)
+          for user in users])
+
+    def measure(self, url):
+        """Return the median latency in ms, and the number of queries"""
+        timings = []
+        for _ in range(RUNS):
+            start = time.perf_counter()
+            response = self.client.get(url)
+            timings.append(time.perf_counter() - start)
+        self.assertEqual(response.status_code, 200)
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get(url)
+        return statistics.median(timings) * 1000, len(ctx)
+
+    @mock.patch.dict(os.environ, {'DASHBOARD_CACHE_TIMEOUT': '0'})
+    def test_report(self):
+        self._login()
+        self.add_data([self.user])
+        url = reverse('budgets:home')
+
+        print(f"\n{'users':>6} {'balances':>9} {'latency (ms)':>13}"
+              f" {'queries':>8}")
+        for total in USERS:
+            self.add_users(total - User.objects.count())
+            latency, queries = self.measure(url)
+            balances = m.MonthlyBalance.objects.count()  # pylint: disable=E1101; # noqa
+            print(f"{total:>6} {balances:>9} {latency:>13.1f} {queries:>8}")
@@ -0,0 +1,89 @@
+# Copyright: (c) 2020, Michele Valsecchi <https://github.com/MicheleV>
+# GNU General Public License v3.0+
+# (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+"""
+Compare the time to query and encode as JSON expenses and monthly balances
+with the DRF serializers, and with the values() rows of the API fast path
+
+Not collected by `manage.py test` (the file name does not start with test),
+run it explicitly with:
+    python manage.py test budgets.tests.benchmark_serializers
+"""
+import datetime
+import json
+import statistics
+import time
+
+from rest_framework.renderers import JSONRenderer
+
+import budgets.models as m
+from budgets import serializers
+from budgets.tests.base import BaseTest
+
+ROWS = (10000, 100000)
+RUNS = 3
+# Monthly balances are unique per (category, date)
+MONTHS = 100
+
+
+class SerializersBenchmark(BaseTest):
+    """Print the median time to encode ROWS rows, with both paths"""
+
+    @staticmethod
+    def measure(encode):
+        """Return the median time, in ms, encode takes"""
+        timings = []
+        for _ in range(RUNS):
+            start = time.perf_counter()
+            encode()
+            timings.append(time.perf_counter() - start)
+        return statistics.median(timings) * 1000
+
+    def add_expenses(self, count):
+        category = self.create_category(f'expenses {count}')
+        m.Expense.objects.bulk_create([  # pylint: disable=E1101; # noqa
+          m.Expense(category=category, amount=i, note=f'note {i}',
+                    date=datetime.date(2020, 1, 1 + i % 28),
+                    created_by=self.user)
+          for i in range(count)])
+        return m.Expense.objects.filter(category=category).order_by('id')  # pylint: disable=E1101; # noqa
+
+    def add_monthly_balances(self, count):
+        categories = [self.create_monthly_balance_category(f'{count} {i}')
+                      for i in range(count // MONTHS)]
+        for category in categories[::2]:
+            category.is_foreign_currency = True
+            category.save()
+        dates = [datetime.date(2000 + i // 12, 1 + i % 12, 1)
+                 for i in range(MONTHS)]
+        m.MonthlyBalance.objects.bulk_create([  # pylint: disable=E1101; # noqa
+          m.MonthlyBalance(category=category, amount=100, date=date,
+                           created_by=self.user)
+          for category in categories for date in dates])
+        return m.MonthlyBalance.objects.filter(  # pylint: disable=E1101; # noqa
+               category__in=categories).order_by('id')
+
+    def test_report(self):
+        self.signup_and_login()
+        render = JSONRenderer().render
+
+        print(f"\n{'rows':>7} {'model':<15} {'serializer (ms)':>16}"
+              f" {'values (ms)':>12} {'speedup':>8}")
+        for count in ROWS:
+            expenses = self.add_expenses(count)
+            balances = self.add_monthly_balances(count)
+            cases = (
+              ('expense',
+               lambda: render(serializers.ExpenseSerializer(
+                 expenses.select_related('category'), many=True).data),
+               lambda: render(list(serializers.expense_rows(expenses)))),
+              ('monthly balance',
+               lambda: render(serializers.MonthlyBalanceSerializer(
+                 balances.select_related('category'), many=True).data),
+               lambda: render(serializers.monthly_balance_rows(balances))),
+            )
+            for name, slow, fast in cases:
+                self.assertEqual(json.loads(slow()), json.loads(fast()))
+                slow_ms, fast_ms = self.measure(slow), self.measure(fast)
+                print(f"{count:>7} {name:<15} {slow_ms:>16.0f}"
+                      f" {fast_ms:>12.0f} {slow_ms / fast_ms:>7.1f}x")
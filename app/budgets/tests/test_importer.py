@@ -0,0 +1,324 @@
+# Copyright: (c) 2020, Michele Valsecchi <https://github.com/MicheleV>
+# GNU General Public License v3.0+
+# (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+import datetime
+from io import BytesIO
+from io import StringIO
+import os
+from unittest import mock
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import CommandError
+
+import budgets.models as m
+from budgets import importer
+from budgets import rollups
+from budgets.tests.base import BaseTest
+
+SAMPLE_CSV = os.path.join(settings.BASE_DIR, 'tools', 'csv_parser',
+                          'sample.csv')
+HEADER = (',Date,Amount,Description,Category,,'
+          'Date,Amount,Description,Category\n')
+
+
+class ImporterTest(BaseTest):
+    """Unit tests for the CSV importer"""
+
+    def import_sample(self, **kwargs):
+        """Import sample.csv, return the number of saved entries"""
+        with open(SAMPLE_CSV, 'rb') as file:
+            saved, _, _ = importer.import_csv(file, self.user, 'sample.csv',
+                                              **kwargs)
+        return saved
+
+    def import_bytes(self, data, source='test.csv', **kwargs):
+        """Import a file with data, return what import_csv() returns"""
+        return importer.import_csv(BytesIO(data.encode()), self.user, source,
+                                   **kwargs)
+
+    def test_sample(self):
+        rent = self.create_category('Rent')
+        self.create_expense(rent, 1000, 'Old rent', '2018-12-01')
+        saved = self.import_sample()
+        self.assertEqual(saved, {importer.EXPENSE: 16, importer.INCOME: 3})
+
+        expenses = m.Expense.objects.filter(created_by=self.user)  # pylint: disable=E1101; # noqa
+        self.assertEqual(expenses.count(), 17)
+        self.assertEqual(
+          expenses.get(category=rent, note='December rent').amount, 2000)
+        # Malformed and missing dates are replaced by the previous one
+        self.assertEqual(expenses.get(note='Note about food').date,
+                         datetime.date(2018, 12, 10))
+        self.assertEqual(expenses.get(amount=6).date,
+                         datetime.date(2018, 12, 17))
+        self.assertEqual(expenses.get(amount=29790).category.text, 'Leisure')
+        # "other" and "Other" are the same category
+        self.assertEqual(
+          m.Category.objects.filter(created_by=self.user).count(), 9)  # pylint: disable=E1101; # noqa
+
+        incomes = m.Income.objects.filter(created_by=self.user)  # pylint: disable=E1101; # noqa
+        self.assertEqual(incomes.get(amount=420).date,
+                         datetime.date(2018, 12, 1))
+        # Monthly totals are updated too
+        total = m.MonthlyCategoryTotal.objects.get(  # pylint: disable=E1101; # noqa
+                created_by=self.user, category=rent)
+        self.assertEqual((total.amount, total.count), (3000, 2))
+        totals = [list(rollup.objects.order_by('category', 'date').values_list(
+                  'category', 'date', 'amount', 'count'))
+                  for rollup in rollups.ROLLUPS.values()]
+        rollups.rebuild()
+        self.assertEqual([list(rollup.objects.order_by(
+                          'category', 'date').values_list(
+                          'category', 'date', 'amount', 'count'))
+                          for rollup in rollups.ROLLUPS.values()], totals)
+
+    def test_batch_size_does_not_change_the_result(self):
+        self.import_sample(batch_size=1000)
+        expected = list(m.Expense.objects.values_list(  # pylint: disable=E1101; # noqa
+                        'amount', 'note', 'date', 'category__text'))
+        m.Expense.objects.all().delete()  # pylint: disable=E1101; # noqa
+        m.ImportCheckpoint.objects.all().delete()  # pylint: disable=E1101; # noqa
+
+        self.import_sample(batch_size=3)
+        self.assertEqual(list(m.Expense.objects.values_list(  # pylint: disable=E1101; # noqa
+                         'amount', 'note', 'date', 'category__text')),
+                         expected)
+
+    def test_workers(self):
+        self.import_sample(batch_size=4)
+        expected = list(m.Expense.objects.values_list(  # pylint: disable=E1101; # noqa
+                        'amount', 'note', 'date', 'category__text',
+                        'import_fingerprint'))
+        m.Expense.objects.all().delete()  # pylint: disable=E1101; # noqa
+        m.Income.objects.all().delete()  # pylint: disable=E1101; # noqa
+        m.ImportCheckpoint.objects.all().delete()  # pylint: disable=E1101; # noqa
+
+        # Dates carry forward across chunks parsed by different processes
+        stats = importer.Stats()
+        saved = self.import_sample(batch_size=4, workers=2, chunk_size=3,
+                                   stats=stats)
+        self.assertEqual(saved, {importer.EXPENSE: 16, importer.INCOME: 3})
+        self.assertEqual(list(m.Expense.objects.values_list(  # pylint: disable=E1101; # noqa
+                         'amount', 'note', 'date', 'category__text',
+                         'import_fingerprint')), expected)
+        self.assertEqual(stats.rows, {importer.READ: 21, importer.PARSE: 21,
+                                      importer.HASH: 19, importer.LOOKUP: 0,
+                                      importer.WRITE: 19})
+
+    def test_parse_date(self):
+        for value in ('2018/12/10', '2018/1/5', '12/17/2018', '17/12/18', '',
+                      'Random string', '2018/02/30', '2018/13/01',
+                      '2018/01/01 ', '2018/001/01', '2018//1', '+018/01/01',
+                      '2018/01/1²'):
+            try:
+                expected = datetime.datetime.strptime(
+                           value, importer.DATE_FORMAT).date()
+            except ValueError:
+                expected = None
+            self.assertEqual(importer.parse_date(value), expected, value)
+
+    def test_parse_amount(self):
+        for value, expected in (('€1,200', 1200), ('1200', 1200), ('', None),
+                                ('€', None), ('-€10', None), ('€1.5', None),
+                                ('€1²', None), ('€²', None)):
+            self.assertEqual(importer.parse_amount(value), expected, value)
+
+    def test_invalid_rows_stop_the_import(self):
+        data = (HEADER +
+                ',2020/01/01,€10,Bread,Food,,,,,\n'
+                f',2020/01/02,€10,{"x" * 151},Food,,,,,\n'
+                ',2020/01/03,€10,Milk,Food,,,,,\n')
+        with self.assertRaises(importer.InvalidRow) as error:
+            self.import_bytes(data)
+        self.assertEqual(error.exception.line, 3)
+        self.assertFalse(m.Expense.objects.exists())  # pylint: disable=E1101; # noqa
+        self.assertFalse(m.Category.objects.exists())  # pylint: disable=E1101; # noqa
+
+        # Chunks before the invalid row are saved
+        with self.assertRaisesMessage(importer.InvalidRow, 'Line 3:'):
+            self.import_bytes(data, workers=1, chunk_size=2)
+        self.assertEqual(list(m.Expense.objects.values_list(  # pylint: disable=E1101; # noqa
+                         'note', flat=True)), ['Bread'])
+
+        # ...and importing the fixed file resumes after them
+        saved, skipped, resume_line = self.import_bytes(
+          data.replace('x' * 151, 'Butter'), chunk_size=2)
+        self.assertEqual((saved[importer.EXPENSE], skipped, resume_line),
+                         (2, 1, 2))
+        self.assertEqual(list(m.Expense.objects.order_by('date').values_list(  # pylint: disable=E1101; # noqa
+                         'note', flat=True)), ['Bread', 'Butter', 'Milk'])
+
+    def test_imports_are_idempotent(self):
+        data = (HEADER +
+                ',2020/01/01,€10,Coffee,Food,,2020/01/01,€100,,Wage\n'
+                ',2020/01/01,€10,Coffee,Food,,,,,\n'
+                ',2020/01/01,€10,Coffee,Food,,,,,\n')
+        saved, skipped, resume_line = self.import_bytes(data)
+        # Identical rows of a file are all imported
+        self.assertEqual(saved, {importer.EXPENSE: 3, importer.INCOME: 1})
+        self.assertEqual((skipped, resume_line), (0, 0))
+
+        # The same file, again: skipped thanks to the checkpoint
+        saved, skipped, resume_line = self.import_bytes(data)
+        self.assertEqual(sum(saved.values()), 0)
+        self.assertEqual((skipped, resume_line), (4, 4))
+
+        # ...or thanks to the fingerprints, without it
+        m.ImportCheckpoint.objects.all().delete()  # pylint: disable=E1101; # noqa
+        saved, skipped, resume_line = self.import_bytes(data, batch_size=2)
+        self.assertEqual(sum(saved.values()), 0)
+        self.assertEqual((skipped, resume_line), (4, 0))
+
+        # A longer version of the file: only the new rows are imported
+        longer = data + ',2020/01/02,€10,Coffee,Food,,,,,\n' * 2
+        saved, skipped, resume_line = self.import_bytes(longer)
+        self.assertEqual(saved[importer.EXPENSE], 2)
+        self.assertEqual((skipped, resume_line), (4, 4))
+
+        # A changed file: the checkpoint is ignored
+        saved, skipped, resume_line = self.import_bytes(
+          longer.replace('€100', '€200'))
+        self.assertEqual(saved, {importer.EXPENSE: 0, importer.INCOME: 1})
+        self.assertEqual((skipped, resume_line), (5, 0))
+        # The same rows, from another file
+        saved, _, _ = self.import_bytes(data, source='other.csv')
+        self.assertEqual(saved, {importer.EXPENSE: 3, importer.INCOME: 1})
+
+        self.assertEqual(m.Expense.objects.count(), 8)  # pylint: disable=E1101; # noqa
+        total = m.MonthlyCategoryTotal.objects.get(  # pylint: disable=E1101; # noqa
+                created_by=self.user)
+        self.assertEqual((total.amount, total.count), (80, 8))
+
+    def test_fingerprints(self):
+        coffee = importer.Entry(importer.EXPENSE, 1, datetime.date(2020, 1, 1),
+                                10, 'Coffee', 'Food')
+        tea = coffee._replace(note='Tea')
+        entries = importer.Sequencer('test.csv')(
+                  [coffee, tea, coffee, tea, tea, coffee])
+        fingerprints = [entry.fingerprint for entry in entries]
+        self.assertEqual(len(set(fingerprints)), 6)
+        # Fingerprints do not depend on where the file is split in chunks
+        sequencer = importer.Sequencer('test.csv')
+        self.assertEqual([entry.fingerprint for entry in
+                          sequencer([coffee, tea]) +
+                          sequencer([coffee, tea, tea, coffee])],
+                         fingerprints)
+        self.assertNotEqual(
+          importer.Sequencer('other.csv')([coffee])[0].fingerprint,
+          fingerprints[0])
+
+        # Identical entries far apart in the file are told apart too
+        others = [coffee._replace(note=f'Note {i}') for i in range(1000)]
+        entries = importer.Sequencer('test.csv')([coffee] + others + [coffee])
+        self.assertEqual(len({entry.fingerprint for entry in entries}), 1002)
+
+    @mock.patch.object(importer, 'OCCURRENCE_KEY_BYTES', 0)
+    def test_fingerprints_with_shared_keys(self):
+        # Every entry is counted under the same key: fingerprints still
+        # differ, and do not change importing the file again
+        data = (HEADER +
+                ',2020/01/01,€10,Coffee,Food,,2020/01/01,€100,,Wage\n'
+                ',2020/01/01,€10,Tea,Food,,,,,\n'
+                ',2020/01/01,€10,Coffee,Food,,,,,\n')
+        saved, _, _ = self.import_bytes(data)
+        self.assertEqual(saved, {importer.EXPENSE: 3, importer.INCOME: 1})
+        m.ImportCheckpoint.objects.all().delete()  # pylint: disable=E1101; # noqa
+        saved, skipped, _ = self.import_bytes(data)
+        self.assertEqual((sum(saved.values()), skipped), (0, 4))
+
+    def test_report(self):
+        report = importer.Report()
+        self.import_sample(workers=1, chunk_size=5, report=report)
+        report = report.as_dict()
+        self.assertEqual(report['accepted'],
+                         {importer.EXPENSE: 16, importer.INCOME: 3})
+        self.assertEqual(report['rejected'][importer.EXPENSE], {
+          importer.HEADER: {'count': 1, 'lines': [4]},
+          importer.NO_CATEGORY: {'count': 3, 'lines': [1, 2, 12]}})
+        self.assertEqual(report['date_fallbacks'][importer.EXPENSE],
+                         {'count': 3, 'lines': [10, 13, 14]})
+        self.assertEqual(report['new_categories'][importer.INCOME],
+                         ['Freelance income', 'Other', 'Paycheck'])
+
+        # Categories created before are not reported
+        report = importer.Report()
+        self.import_bytes(HEADER + ',2020/01/01,€10,Bread,Food,,,,,\n'
+                                   ',2020/01/02,€10,Shoes,Clothes,,,,,\n',
+                          report=report)
+        self.assertEqual(report.new_categories[importer.EXPENSE],
+                         {'Clothes'})
+
+    def test_dry_run(self):
+        data = (HEADER +
+                ',2020/01/01,€10,Bread,Food,,2020/01/01,€100,,Wage\n'
+                f',2020/01/02,€10,{"x" * 151},Food,,,,,\n'
+                ',2020/13/01,€ten,Milk,Food,,,,,\n'
+                ',2020/13/01,€10,Milk,Food,,2020/01/05,€5\n' +
+                ',,€10,Butter,Food\n' * 7)
+        report = importer.Report()
+        saved, skipped, _ = self.import_bytes(data, report=report,
+                                              dry_run=True)
+        self.assertEqual((saved, skipped),
+                         ({importer.EXPENSE: 9, importer.INCOME: 1}, 0))
+        # Nothing is written, and rows which would stop the import are
+        # rejected instead
+        for model in (m.Expense, m.Income, m.Category, m.IncomeCategory,
+                      m.MonthlyCategoryTotal, m.ImportCheckpoint):
+            self.assertFalse(model.objects.exists(), model)  # pylint: disable=E1101; # noqa
+        rejected = report.as_dict()['rejected']
+        self.assertEqual(rejected[importer.EXPENSE], {
+          importer.HEADER: {'count': 1, 'lines': [1]},
+          importer.INVALID_AMOUNT: {'count': 1, 'lines': [4]},
+          importer.TOO_LONG: {'count': 1, 'lines': [3]}})
+        self.assertEqual(rejected[importer.INCOME], {
+          importer.HEADER: {'count': 1, 'lines': [1]},
+          importer.MISSING_COLUMNS: {'count': 1, 'lines': [5]}})
+        # Only the first lines of each case are listed
+        self.assertEqual(report.date_fallbacks[importer.EXPENSE],
+                         [8, [5, 6, 7, 8, 9]])
+        self.assertEqual(report.new_categories,
+                         {importer.EXPENSE: {'Food'},
+                          importer.INCOME: {'Wage'}})
+
+        # Entries imported before would be skipped
+        data = data.replace('x' * 151, 'Cheese')
+        self.import_bytes(data, chunk_size=2)
+        m.ImportCheckpoint.objects.all().delete()  # pylint: disable=E1101; # noqa
+        saved, skipped, _ = self.import_bytes(data, dry_run=True)
+        self.assertEqual((saved, skipped),
+                         ({importer.EXPENSE: 0, importer.INCOME: 0}, 11))
+
+    def test_command(self):
+        out = StringIO()
+        call_command('import_csv', SAMPLE_CSV, '--user', self.user.username,
+                     '--batch-size', '5', '--workers', '2', stdout=out)
+        self.assertIn('Created 16 expenses and 3 incomes, skipped 0',
+                      out.getvalue())
+        self.assertIn('write  19 entries', out.getvalue())
+
+        out = StringIO()
+        call_command('import_csv', SAMPLE_CSV, '--user', self.user.username,
+                     stdout=out)
+        self.assertIn('Resumed after line 21', out.getvalue())
+        self.assertIn('Created 0 expenses and 0 incomes, skipped 19',
+                      out.getvalue())
+
+        # Dry runs write nothing but the report
+        m.ImportCheckpoint.objects.all().delete()  # pylint: disable=E1101; # noqa
+        out = StringIO()
+        call_command('import_csv', SAMPLE_CSV, '--user', self.user.username,
+                     '--dry-run', '--report', '-', stdout=out)
+        self.assertIn('Would create 0 expenses and 0 incomes, would skip 19',
+                      out.getvalue())
+        self.assertIn('rejected 3 expense entries (no category), lines 1, 2, '
+                      '12', out.getvalue())
+        self.assertIn('"dry_run": true', out.getvalue())
+        self.assertFalse(m.ImportCheckpoint.objects.exists())  # pylint: disable=E1101; # noqa
+
+        with self.assertRaises(CommandError):
+            call_command('import_csv', SAMPLE_CSV, '--user', 'nobody',
+                         stdout=out)
+        with self.assertRaises(CommandError):
+            call_command('import_csv', 'missing.csv', '--user',
+                         self.user.username, stdout=out)
@@ -0,0 +1,95 @@
+# Copyright: (c) 2020, Michele Valsecchi <https://github.com/MicheleV>
+# GNU General Public License v3.0+
+# (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+import os
+from unittest import mock
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from budgets.tests.base import BaseTest
+
+
+class QueryPlanTest(BaseTest):
+    """
+    Check the per user, per date queries are answered by the
+    (created_by, date) indexes, instead of scanning the whole table
+    """
+
+    def setUp(self):
+        super().setUp()
+        if connection.vendor not in ('sqlite', 'postgresql'):
+            self.skipTest(f"No query plan check for {connection.vendor}")
+        self._login()
+        category = self.create_category('Rent')
+        self.create_expense(category=category, amount=5000, note='first',
+                            date='2019-08-04')
+        self.create_expense(category=category, amount=3000, note='second',
+                            date='2019-08-05')
+
+    @staticmethod
+    def explain(sql):
+        """Return the query plan of sql, as a single string"""
+        with connection.cursor() as cursor:
+            if connection.vendor == 'sqlite':
+                cursor.execute(f"EXPLAIN QUERY PLAN {sql}")
+                return '\n'.join(row[-1] for row in cursor.fetchall())
+            # Tables used by tests are tiny: without this, Postgres would
+            # rather scan them than use any index
+            cursor.execute("SET enable_seqscan = off")
+            cursor.execute(f"EXPLAIN {sql}")
+            plan = '\n'.join(row[0] for row in cursor.fetchall())
+            cursor.execute("RESET enable_seqscan")
+            return plan
+
+    def get_plans(self, url, table):
+        """
+        Return the (sql, plan) tuples of the queries on table run to serve url
+        """
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        plans = [(query['sql'], self.explain(query['sql']))
+                 for query in ctx.captured_queries
+                 if query['sql'].startswith('SELECT') and
+                 f'FROM "{table}"' in query['sql']]
+        self.assertNotEqual(plans, [], f"No query on {table} for {url}")
+        return plans
+
+    def assertUsesIndex(self, plan, table, index):  # pylint: disable=C0103; # noqa
+        """Check plan reads table via index"""
+        if connection.vendor == 'sqlite':
+            self.assertIn(f"{table} USING", plan)
+            self.assertNotRegex(plan, fr"SCAN (TABLE )?{table}\b")
+        else:
+            self.assertNotIn(f"Seq Scan on {table}", plan)
+        self.assertIn(index, plan)
+
+    def test_expense_list(self):
+        url = reverse('budgets:expenses_filtered',
+                      kwargs={'start': '2019-08-01', 'end': '2019-08-31'})
+        for sql, plan in self.get_plans(url, 'budgets_expense'):
+            self.assertUsesIndex(plan, 'budgets_expense',
+                                 'expense_user_date_idx')
+            if 'ORDER BY "budgets_expense"."date" DESC' in sql:
+                # Rows are read in (date, id) order: no sorting needed
+                self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_expenses_api(self):
+        url = reverse('api:expenses') + '?start=2019-08-01&end=2019-08-31'
+        first = self.client.get(url + '&page_size=1').json()
+        for page in (url, url + f"&page_size=1&cursor={first['next']}"):
+            for _, plan in self.get_plans(page, 'budgets_expense'):
+                self.assertUsesIndex(plan, 'budgets_expense',
+                                     'expense_user_date_idx')
+                # Rows are read in (date, id) order: no sorting needed
+                self.assertNotIn('TEMP B-TREE', plan)
+
+    @mock.patch.dict(os.environ, {'DASHBOARD_CACHE_TIMEOUT': '0'})
+    def test_monthly_balances(self):
+        for url in (reverse('budgets:home'),
+                    reverse('budgets:monthly_balances')):
+            for _, plan in self.get_plans(url, 'budgets_monthlybalance'):
+                self.assertUsesIndex(plan, 'budgets_monthlybalance',
+                                     'monthlybalance_user_date_idx')
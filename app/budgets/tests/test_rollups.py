@@ -0,0 +1,239 @@
+# Copyright: (c) 2020, Michele Valsecchi <https://github.com/MicheleV>
+# GNU General Public License v3.0+
+# (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+import datetime
+from io import StringIO
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.urls import reverse
+
+import budgets.models as m
+from budgets import rollups
+from budgets import signals
+import budgets.views_utils as utils
+from budgets.tests.base import BaseTest
+
+
+class RollupsTest(BaseTest):
+    """Unit tests for the monthly totals of expenses and incomes"""
+
+    def setUp(self):
+        super().setUp()
+        self.rent = self.create_category('Rent')
+        self.food = self.create_category('Food')
+
+    @staticmethod
+    def totals(rollup=m.MonthlyCategoryTotal):
+        """Return the totals as a {(category_id, month): (amount, count)}"""
+        return {(t.category_id, t.date.strftime('%Y-%m')): (t.amount, t.count)
+                for t in rollup.objects.all()}
+
+    @staticmethod
+    def positive_totals(rollup=m.MonthlyCategoryTotal):
+        """Return the totals as a {(category_id, month): positive_amount}"""
+        return {(t.category_id, t.date.strftime('%Y-%m')): t.positive_amount
+                for t in rollup.objects.all()}
+
+    def assertTotalsMatchRebuild(self):  # pylint: disable=C0103; # noqa
+        """Check the totals are the same computing them from scratch"""
+        expected = [(self.totals(rollup), self.positive_totals(rollup))
+                    for rollup in rollups.ROLLUPS.values()]
+        rollups.rebuild()
+        self.assertEqual([(self.totals(rollup), self.positive_totals(rollup))
+                          for rollup in rollups.ROLLUPS.values()], expected)
+
+    def test_create(self):
+        self.create_expense(self.rent, 1000, 'a', '2020-01-05')
+        self.create_expense(self.rent, 500, 'b', '2020-01-25')
+        self.create_expense(self.food, 30, 'c', '2020-01-25')
+        self.create_expense(self.rent, 1000, 'd', '2020-02-01')
+        self.assertEqual(self.totals(), {
+          (self.rent.id, '2020-01'): (1500, 2),
+          (self.food.id, '2020-01'): (30, 1),
+          (self.rent.id, '2020-02'): (1000, 1),
+        })
+        self.assertTotalsMatchRebuild()
+
+    def test_update(self):
+        expense = self.create_expense(self.rent, 1000, 'a', '2020-01-05')
+        self.create_expense(self.rent, 500, 'b', '2020-01-25')
+
+        expense.amount = 700
+        expense.save()
+        self.assertEqual(self.totals(), {(self.rent.id, '2020-01'): (1200, 2)})
+
+        # Moved to another month and category: loaded again from the DB
+        expense = m.Expense.objects.get(pk=expense.pk)  # pylint: disable=E1101; # noqa
+        expense.date = datetime.date(2020, 3, 1)
+        expense.category = self.food
+        expense.save()
+        self.assertEqual(self.totals(), {
+          (self.rent.id, '2020-01'): (500, 1),
+          (self.food.id, '2020-03'): (700, 1),
+        })
+        self.assertTotalsMatchRebuild()
+
+    def test_update_deferred_fields(self):
+        self.create_expense(self.rent, 1000, 'a', '2020-01-05')
+        expense = m.Expense.objects.only('note').get()  # pylint: disable=E1101; # noqa
+        expense.note = 'changed'
+        expense.save()
+        self.assertEqual(self.totals(), {(self.rent.id, '2020-01'): (1000, 1)})
+
+    def test_delete(self):
+        expense = self.create_expense(self.rent, 1000, 'a', '2020-01-05')
+        self.create_expense(self.rent, 500, 'b', '2020-01-25')
+        self.create_expense(self.food, 30, 'c', '2020-01-25')
+
+        expense.delete()
+        self.assertEqual(self.totals(), {
+          (self.rent.id, '2020-01'): (500, 1),
+          (self.food.id, '2020-01'): (30, 1),
+        })
+
+        # Empty totals are removed
+        m.Expense.objects.filter(category=self.food).delete()  # pylint: disable=E1101; # noqa
+        self.assertEqual(self.totals(), {(self.rent.id, '2020-01'): (500, 1)})
+
+    def test_refunds(self):
+        expense = self.create_expense(self.food, 300, 'a', '2020-01-05')
+        refund = self.create_expense(self.food, -100, 'b', '2020-01-25')
+        self.assertEqual(self.totals(), {(self.food.id, '2020-01'): (200, 2)})
+        self.assertEqual(self.positive_totals(),
+                         {(self.food.id, '2020-01'): 300})
+
+        refund.amount = 50
+        refund.save()
+        expense.delete()
+        self.assertEqual(self.positive_totals(),
+                         {(self.food.id, '2020-01'): 50})
+        self.assertTotalsMatchRebuild()
+
+    @BaseTest.login
+    def test_expenses_report(self):
+        self.create_expense(self.rent, 1000, 'a', '2020-01-05')
+        self.create_expense(self.food, 300, 'b', '2020-01-25')
+        self.create_expense(self.food, -100, 'c', '2020-01-25')
+        self.create_expense(self.food, 30, 'd', '2020-02-25')
+        month = datetime.date(2020, 1, 1)
+        expected = utils.get_expenses_by_category(
+                   self.user, month, datetime.date(2020, 1, 31))
+        for row in expected:
+            del row['first_id']
+        self.assertEqual(
+          utils.get_month_expenses_by_category(self.user, month), expected)
+
+        # Monthly reports read the totals, not the expenses
+        m.MonthlyCategoryTotal.objects.filter(category=self.rent).update(  # pylint: disable=E1101; # noqa
+          positive_amount=1, amount=1)
+        response = self.client.get(reverse('budgets:expenses',
+                                           kwargs={'start': '2020-01'}))
+        self.assertEqual(response.context['expenses_sum'], 201)
+        self.assertEqual(response.context['exp_aggregates']['Rent']['total'],
+                         1)
+        self.assertEqual(utils.load_expenses_pie_graph_data(
+                         self.user, '2020-01'), (['Rent', 'Food'], [1, 300]))
+
+    def test_delete_deferred_fields(self):
+        self.create_expense(self.rent, 1000, 'a', '2020-01-05')
+        self.create_expense(self.rent, 500, 'b', '2020-01-25')
+        self.create_expense(self.food, 30, 'c', '2020-01-25')
+        salary = self.create_income_category('Salary')
+        self.create_income(salary, 3000, 'a', '2020-01-25')
+        owner = self.user
+        self.signup_and_login()
+        other = self.create_expense(self.create_category('Rent'), 700, 'c',
+                                    '2020-01-05')
+        # Not rebuilt: only the totals of the owner are
+        m.MonthlyCategoryTotal.objects.filter(  # pylint: disable=E1101; # noqa
+          created_by=other.created_by).update(amount=1)
+
+        # The values of the deleted rows are read before deleting them
+        m.Expense.objects.only('id').get(note='a').delete()  # pylint: disable=E1101; # noqa
+        m.Income.objects.only('id').get().delete()  # pylint: disable=E1101; # noqa
+        m.Category.objects.only('id').get(pk=self.food.pk).delete()  # pylint: disable=E1101; # noqa
+        self.assertEqual(self.totals(), {
+          (self.rent.id, '2020-01'): (500, 1),
+          (None, '2020-01'): (30, 1),
+          (other.category_id, '2020-01'): (1, 1),
+        })
+        self.assertEqual(self.totals(m.MonthlyIncomeCategoryTotal), {})
+
+        # Rows deleted before their owner could be read: every total is
+        # computed again
+        expense = m.Expense.objects.only('id').get(note='b')  # pylint: disable=E1101; # noqa
+        m.Expense.objects.get(note='b').delete()  # pylint: disable=E1101; # noqa
+        signals.update_rollups_on_delete(m.Expense, expense)
+        self.assertEqual(self.totals(), {
+          (None, '2020-01'): (30, 1),
+          (other.category_id, '2020-01'): (700, 1),
+        })
+
+        category = m.Category.objects.only('id').get(  # pylint: disable=E1101; # noqa
+                   created_by=owner)
+        m.MonthlyCategoryTotal.objects.update(amount=1)  # pylint: disable=E1101; # noqa
+        m.Category.objects.get(created_by=owner).delete()  # pylint: disable=E1101; # noqa
+        signals.rebuild_rollups_on_category_delete(m.Category, category)
+        self.assertEqual(self.totals(), {
+          (None, '2020-01'): (30, 1),
+          (other.category_id, '2020-01'): (700, 1),
+        })
+
+    def test_delete_category(self):
+        self.create_expense(self.rent, 1000, 'a', '2020-01-05')
+        self.create_expense(self.food, 30, 'c', '2020-01-25')
+        self.food.delete()
+        self.assertEqual(self.totals(), {
+          (self.rent.id, '2020-01'): (1000, 1),
+          (None, '2020-01'): (30, 1),
+        })
+        self.assertTotalsMatchRebuild()
+
+    def test_incomes(self):
+        salary = self.create_income_category('Salary')
+        income = self.create_income(salary, 3000, 'a', '2020-01-25')
+        self.create_income(salary, 3000, 'b', '2020-02-25')
+        income.delete()
+        self.assertEqual(self.totals(m.MonthlyIncomeCategoryTotal),
+                         {(salary.id, '2020-02'): (3000, 1)})
+        self.assertEqual(self.totals(), {})
+
+    def test_rebuild_command(self):
+        self.create_expense(self.rent, 1000, 'a', '2020-01-05')
+        self.create_expense(self.rent, 500, 'b', '2020-01-25')
+        expected = self.totals()
+        m.MonthlyCategoryTotal.objects.all().delete()  # pylint: disable=E1101; # noqa
+
+        out = StringIO()
+        call_command('rebuild_rollups', stdout=out)
+        self.assertIn('Created 1 monthly totals', out.getvalue())
+        self.assertEqual(self.totals(), expected)
+
+        call_command('rebuild_rollups', '--user', self.user.username,
+                     stdout=out)
+        self.assertEqual(self.totals(), expected)
+        with self.assertRaises(CommandError):
+            call_command('rebuild_rollups', '--user', 'nobody', stdout=out)
+
+    @BaseTest.login
+    def test_api(self):
+        self.create_expense(self.rent, 1000, 'a', '2020-01-05')
+        self.create_expense(self.rent, 500, 'b', '2020-01-25')
+        self.create_expense(self.food, 30, 'c', '2020-02-25')
+        url = reverse('api:expense_monthly_totals')
+
+        response = self.client.get(url, {'start': '2020-01', 'end': '2020-01'})
+        self.assertEqual(response.json(), [
+          {'date': '2020-01-01', 'category_id': self.rent.id,
+           'category_text': 'Rent', 'amount': 1500, 'count': 2},
+        ])
+
+        response = self.client.get(url, {'category_id': self.food.id})
+        self.assertEqual([row['amount'] for row in response.json()], [30])
+
+        response = self.client.get(url, {'start': 'not a date'})
+        self.assertEqual(response.status_code, 400)
+
+        response = self.client.get(reverse('api:income_monthly_totals'))
+        self.assertEqual(response.json(), [])
@@ -0,0 +1,77 @@
+# Copyright: (c) 2020, Michele Valsecchi <https://github.com/MicheleV>
+# GNU General Public License v3.0+
+# (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+import importlib
+import os
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from budgeteer import db
+import budgeteer.settings
+
+
+class SettingsTest(SimpleTestCase):
+    """Unit tests for the cache, session and DB connection settings"""
+
+    @staticmethod
+    def load(**env):
+        """Return the settings module, as loaded with env"""
+        with mock.patch.dict(os.environ, env):
+            try:
+                return vars(importlib.reload(budgeteer.settings)).copy()
+            finally:
+                importlib.reload(budgeteer.settings)
+
+    def test_defaults(self):
+        settings = self.load()
+        cache = settings['CACHES']['default']
+        self.assertEqual(cache['BACKEND'],
+                         'django.core.cache.backends.locmem.LocMemCache')
+        self.assertEqual(cache['OPTIONS'], {'MAX_ENTRIES': 1000})
+        self.assertEqual(settings['SESSION_ENGINE'],
+                         'django.contrib.sessions.backends.db')
+        self.assertEqual(settings['DATABASES']['default']['CONN_MAX_AGE'], 0)
+
+    def test_shared_cache(self):
+        settings = self.load(CACHE_BACKEND='memcached',
+                             CACHE_LOCATION='cache:11211',
+                             DB_CONN_MAX_AGE='60')
+        cache = settings['CACHES']['default']
+        self.assertEqual(cache['BACKEND'],
+                         'django.core.cache.backends.memcached.MemcachedCache')
+        self.assertEqual(cache['LOCATION'], 'cache:11211')
+        self.assertNotIn('OPTIONS', cache)
+        self.assertEqual(settings['SESSION_ENGINE'],
+                         'django.contrib.sessions.backends.cached_db')
+        self.assertEqual(settings['DATABASES']['default']['CONN_MAX_AGE'], 60)
+
+        settings = self.load(CACHE_BACKEND='file',
+                             SESSION_ENGINE='django.contrib.sessions.backends.cache')
+        self.assertEqual(settings['CACHES']['default']['LOCATION'],
+                         '/tmp/budgeteer-cache')
+        self.assertEqual(settings['SESSION_ENGINE'],
+                         'django.contrib.sessions.backends.cache')
+
+    def test_unknown_cache(self):
+        with self.assertRaises(ValueError):
+            self.load(CACHE_BACKEND='redis')
+
+    def test_health_checks(self):
+        def connection(max_age, usable, in_atomic_block=False):
+            return mock.Mock(settings_dict={'CONN_MAX_AGE': max_age},
+                             in_atomic_block=in_atomic_block,
+                             **{'is_usable.return_value': usable})
+        broken = connection(60, False)
+        healthy = connection(60, True)
+        not_persistent = connection(0, False)
+        in_transaction = connection(60, False, True)
+        closed = connection(60, False)
+        closed.connection = None
+        conns = [broken, healthy, not_persistent, in_transaction, closed]
+
+        with mock.patch.object(db, 'connections') as connections:
+            connections.all.return_value = conns
+            db.close_unusable_connections()
+        self.assertEqual([c.close.called for c in conns],
+                         [True, False, False, False, False])
@@ -3,18 +3,43 @@
 # (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
 import datetime
 from functools import wraps
+import os
 import random
+from unittest import mock
 
 from django.contrib.auth.models import User
+from django.db import connection
 from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
 from django.urls import resolve
 from django.urls import reverse
 
+from budgets import dashboard
 import budgets.forms as f
 import budgets.models as m
+from budgets import signals
 from budgets.tests.base import BaseTest
 import budgets.views as v
 import budgets.views_utils as utils
+from graphs.background import BackgroundRenderer
+from graphs.cache import ChartCache
+from graphs.cache import LocMemChartCache
+from graphs.tests.test_background import ManualExecutor
+
+
+def multiple_create_data(rows):
+    """Return the POST data of a multiple create formset with rows"""
+    data = {
+      'form-TOTAL_FORMS': len(rows),
+      'form-INITIAL_FORMS': 0,
+      'form-MIN_NUM_FORMS': 0,
+      'form-MAX_NUM_FORMS': 1000,
+    }
+    for i, (category, amount, date) in enumerate(rows):
+        data[f'form-{i}-category'] = category.id
+        data[f'form-{i}-amount'] = amount
+        data[f'form-{i}-date'] = date
+    return data
 
 
 class HomePageTest(BaseTest):
@@ -35,6 +60,132 @@ class HomePageTest(BaseTest):
         self.assertTemplateUsed(response, 'home.html')
 
 
+    def create_balances(self, categories, months):
+        """Create balances for categories x months, up to the current month"""
+        date = datetime.date.today().replace(day=1)
+        for month in range(months):
+            for i in range(categories):
+                category = m.MonthlyBalanceCategory.objects.get_or_create(  # pylint: disable=E1101; # noqa
+                           text=f"category {i}", created_by=self.user,
+                           is_foreign_currency=i % 2 == 0)[0]
+                self.create_monthly_balance(category, 1000 * (i + 1), date)
+            date = utils.get_previous_month_first_day_date(date)
+
+    @BaseTest.login
+    def test_balances_and_totals(self):
+        self.create_balances(categories=2, months=2)
+        response = self.get_response_from_named_url('budgets:home')
+        rate = int(os.getenv("EXCHANGE_RATE"))
+        self.assertEqual(response.context['current_balance'], 1000 * rate + 2000)
+        self.assertEqual(response.context['starting_balance'], 1000 * rate + 2000)
+        self.assertEqual(response.context['two_months_diff'], 0)
+        self.assertEqual(len(response.context['current_mb']), 2)
+        self.assertEqual(len(response.context['prev_mb']), 2)
+
+    @BaseTest.login
+    def test_number_of_queries_is_constant(self):
+        url = reverse('budgets:home')
+        self.create_goal(1000, 'goal', 'note')
+        for categories, months in ((0, 0), (1, 1), (2, 2), (15, 24)):
+            m.MonthlyBalance.objects.all().delete()  # pylint: disable=E1101; # noqa
+            self.create_balances(categories, months)
+            # Session and user, balances of both months, goals and balances
+            # history (bar graph)
+            with self.assertNumQueries(5):
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            # Session and user only: the rest comes from the snapshot
+            with self.assertNumQueries(2):
+                self.client.get(url)
+
+    @BaseTest.login
+    def test_snapshot_invalidated_on_writes(self):
+        url = reverse('budgets:home')
+        self.create_balances(categories=1, months=1)
+        response = self.client.get(url)
+        self.assertEqual(response.context['current_balance'],
+                         1000 * int(os.getenv("EXCHANGE_RATE")))
+
+        balance = m.MonthlyBalance.objects.get()  # pylint: disable=E1101; # noqa
+        balance.category.is_foreign_currency = False
+        balance.category.save()
+        response = self.client.get(url)
+        self.assertEqual(response.context['current_balance'], 1000)
+
+        balance.amount = 3000
+        balance.save()
+        response = self.client.get(url)
+        self.assertEqual(response.context['current_balance'], 3000)
+
+        self.assertNotContains(response, 'new goal')
+        self.create_goal(5000, 'new goal', 'note')
+        response = self.client.get(url)
+        self.assertContains(response, 'new goal')
+
+        balance.delete()
+        response = self.client.get(url)
+        self.assertIsNone(response.context['current_balance'])
+
+    @BaseTest.login
+    def test_snapshot_invalidated_on_deferred_deletes(self):
+        url = reverse('budgets:home')
+        self.create_balances(categories=1, months=1)
+        self.create_goal(5000, 'new goal', 'note')
+        self.client.get(url)
+
+        for model in (m.Goal, m.MonthlyBalance, m.MonthlyBalanceCategory):
+            version = dashboard.get_version(self.user.id)
+            model.objects.only('id').get().delete()  # pylint: disable=E1101; # noqa
+            self.assertNotEqual(dashboard.get_version(self.user.id), version)
+        response = self.client.get(url)
+        self.assertIsNone(response.context['current_balance'])
+        self.assertNotContains(response, 'new goal')
+
+        # Rows deleted before their owner could be loaded outdate the
+        # snapshots of every user
+        self.create_monthly_balance(
+          self.create_monthly_balance_category('Bank'), 10,
+          datetime.date.today())
+        balance = m.MonthlyBalance.objects.only('id').get()  # pylint: disable=E1101; # noqa
+        m.MonthlyBalance.objects.get().delete()  # pylint: disable=E1101; # noqa
+        version = dashboard.get_version(self.user.id)
+        signals.invalidate_dashboard(m.MonthlyBalance, balance)
+        self.assertNotEqual(dashboard.get_version(self.user.id), version)
+
+    @BaseTest.login
+    def test_snapshot_is_per_user(self):
+        url = reverse('budgets:home')
+        self.create_balances(categories=1, months=1)
+        response = self.client.get(url)
+        self.assertIsNotNone(response.context['current_balance'])
+
+        self._logout()
+        self.signup_and_login()
+        response = self.client.get(url)
+        self.assertIsNone(response.context['current_balance'])
+
+    @BaseTest.login
+    def test_bar_graph_history_window(self):
+        self.create_balances(categories=1, months=5)
+        with mock.patch.dict(os.environ,
+                             {'MONTHLY_BALANCES_HISTORY_MONTHS': '3'}):
+            dates, _, _ = dashboard.get_snapshot(self.user)['bar']
+            self.assertEqual(len(dates), 3)
+            self.assertEqual(dates[-1], datetime.date.today().replace(day=1))
+        with mock.patch.dict(os.environ,
+                             {'MONTHLY_BALANCES_HISTORY_MONTHS': '0'}):
+            dates, _, _ = dashboard.get_snapshot(self.user)['bar']
+            self.assertEqual(len(dates), 5)
+
+    @BaseTest.login
+    def test_snapshot_disabled(self):
+        url = reverse('budgets:home')
+        with mock.patch.dict(os.environ, {'DASHBOARD_CACHE_TIMEOUT': '0'}):
+            self.client.get(url)
+            with self.assertNumQueries(5):
+                self.client.get(url)
+
+
 class CategoriesPageTest(BaseTest):
     """Unit tests related to the categories pages"""
     @BaseTest.login
@@ -200,6 +351,69 @@ class MonthlyBudgetPageTest(BaseTest):
         self.assertContains(response, text2)
         self.assertContains(response, '{:,}'.format(amount2))
 
+    @BaseTest.login
+    def test_multiple_create_updates_existing_budgets(self):
+        rent = self.create_category('Rent')
+        food = self.create_category('Food')
+        date = datetime.date.today().replace(day=1).strftime("%Y-%m-%d")
+        self.create_monthly_budgets(rent, 1000, date)
+
+        url = reverse('budgets:monthly_budgets_multiple_create')
+        response = self.client.post(url, multiple_create_data(
+                   [(rent, 1200, date), (food, 300, date)]))
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(response['location'],
+                         reverse('budgets:monthly_budgets'))
+        budgets = m.MonthlyBudget.objects.order_by('id')  # pylint: disable=E1101; # noqa
+        self.assertEqual([(b.category, b.amount, b.created_by) for b in budgets],
+                         [(rent, 1200, self.user), (food, 300, self.user)])
+
+    @BaseTest.login
+    def test_multiple_create_rejects_repeated_categories(self):
+        rent = self.create_category('Rent')
+        date = datetime.date.today().replace(day=1).strftime("%Y-%m-%d")
+        url = reverse('budgets:monthly_budgets_multiple_create')
+        response = self.client.post(url, multiple_create_data(
+                   [(rent, 1200, date), (rent, 300, date)]))
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Rent is used more than once')
+        self.assertFalse(m.MonthlyBudget.objects.exists())  # pylint: disable=E1101; # noqa
+
+    @BaseTest.login
+    def test_multiple_create_page_queries(self):
+        prev_month = utils.get_previous_month_first_day_date(
+                     datetime.date.today())
+        url = reverse('budgets:monthly_budgets_multiple_create')
+        for i in range(20):
+            category = self.create_category(f'Category {i}')
+            self.create_monthly_budgets(category, 100 + i, prev_month)
+            if i in (1, 19):
+                # Session, user, categories and previous month budgets
+                with self.assertNumQueries(4):
+                    response = self.client.get(url)
+                self.assertEqual(len(response.context['formset']), i + 1)
+        self.assertContains(response, 'Previous month amount: 119')
+
+    @BaseTest.login
+    def test_multiple_create_queries_do_not_depend_on_forms_count(self):
+        date = datetime.date.today().replace(day=1).strftime("%Y-%m-%d")
+        url = reverse('budgets:monthly_budgets_multiple_create')
+        categories = [self.create_category(f'Category {i}') for i in range(50)]
+        for category in categories[:25]:
+            self.create_monthly_budgets(category, 100, date)
+
+        # Both requests update some budgets, and create some others
+        queries = []
+        for count in (30, 50):
+            rows = [(c, 500, date) for c in categories[:count]]
+            with CaptureQueriesContext(connection) as ctx:
+                response = self.client.post(url, multiple_create_data(rows))
+            self.assertEqual(response.status_code, 302)
+            queries.append(len(ctx))
+        self.assertEqual(queries[0], queries[1])
+        self.assertEqual(m.MonthlyBudget.objects.filter(amount=500).count(),  # pylint: disable=E1101; # noqa
+                         50)
+
     def test_displays_only_current_user_monhtly_bugets(self):
         """Confirm ownership filter works correctly"""
 
@@ -369,6 +583,49 @@ class ExpensesPageTest(BaseTest):
         self.assertNotContains(response, form)
         self.assertNotContains(response, button)
 
+    @BaseTest.login
+    def test_expenses_aggregates(self):
+        rent = self.create_category('Rent')
+        food = self.create_category('Food')
+        self.create_category('Unused')
+        date = datetime.date.today().replace(day=1)
+        date_ymd = date.strftime("%Y-%m-%d")
+        self.create_expense(rent, 1000, 'a', date_ymd)
+        self.create_expense(rent, 2000, 'b', date_ymd)
+        self.create_expense(food, 300, 'c', date_ymd)
+        # Refunds count in the total only
+        self.create_expense(food, -100, 'd', date_ymd)
+        self.create_monthly_budgets(rent, 2500, date_ymd)
+
+        response = self.get_response_from_named_url('budgets:expenses')
+        self.assertEqual(response.context['expenses_sum'], 3200)
+        self.assertEqual(response.context['exp_aggregates'], {
+          'Food': {'total': 300, 'budgeted': 0, 'category': food.id,
+                   'date': date_ymd},
+          'Rent': {'total': 3000, 'budgeted': 2500, 'category': rent.id,
+                   'date': date_ymd},
+        })
+
+    @BaseTest.login
+    def test_expenses_queries_do_not_depend_on_expenses_count(self):
+        category = self.create_category('Rent')
+        date = datetime.date.today().replace(day=1).strftime("%Y-%m-%d")
+        url = reverse('budgets:expenses')
+
+        self.create_expense(category, 100, 'first', date)
+        self.create_expense(category, 100, 'second', date)
+        with CaptureQueriesContext(connection) as few:
+            self.client.get(url)
+
+        for i in range(100):
+            self.create_expense(category, 100, f"note {i}", date)
+        with CaptureQueriesContext(connection) as many:
+            response = self.client.get(url)
+
+        self.assertEqual(len(many), len(few))
+        self.assertEqual(response.context['expenses_sum'], 10200)
+        self.assertEqual(len(response.context['object_list']), 30)
+
     # TODO
     def test_creating_malformed_expenses_throw_errors(self):
         pass
@@ -808,6 +1065,54 @@ class MonthlyBalanceTest(BaseTest):
         self.assertEqual(response.status_code, 302)
         self.assertEqual(response['location'], redirect_url)
 
+    @BaseTest.login
+    def test_multiple_create_updates_existing_balances(self):
+        bank = self.create_monthly_balance_category('Bank')
+        cash = self.create_monthly_balance_category('Cash')
+        date = datetime.date.today().replace(day=1).strftime("%Y-%m-%d")
+        self.create_monthly_balance(bank, 1000, date)
+        version = dashboard.get_version(self.user.id)
+
+        url = reverse('budgets:monthly_balances_multiple_create')
+        self.assertContains(self.client.get(url), 'Cash')
+        response = self.client.post(url, multiple_create_data(
+                   [(bank, 1200, date), (cash, 300, date)]))
+        self.assertEqual(response.status_code, 302)
+        balances = m.MonthlyBalance.objects.order_by('id')  # pylint: disable=E1101; # noqa
+        self.assertEqual([(b.category, b.amount, b.created_by)
+                          for b in balances],
+                         [(bank, 1200, self.user), (cash, 300, self.user)])
+        # Bulk writes send no signals: the home page is outdated by the view
+        self.assertNotEqual(dashboard.get_version(self.user.id), version)
+
+    @BaseTest.login
+    def test_multiple_create_page_queries(self):
+        prev_month = utils.get_previous_month_first_day_date(
+                     datetime.date.today())
+        url = reverse('budgets:monthly_balances_multiple_create')
+        for i in range(20):
+            category = self.create_monthly_balance_category(f'Category {i}')
+            self.create_monthly_balance(category, 100 + i, prev_month)
+            if i in (1, 19):
+                # Session, user, categories and previous month balances
+                with self.assertNumQueries(4):
+                    response = self.client.get(url)
+                self.assertEqual(len(response.context['formset']), i + 1)
+        self.assertContains(response, 'Previous month amount: 119')
+
+    def test_multiple_create_rejects_other_users_categories(self):
+        self.signup_and_login()
+        bank = self.create_monthly_balance_category('Bank')
+        self._logout()
+        self.signup_and_login()
+
+        date = datetime.date.today().replace(day=1).strftime("%Y-%m-%d")
+        url = reverse('budgets:monthly_balances_multiple_create')
+        response = self.client.post(url, multiple_create_data(
+                   [(bank, 1200, date)]))
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(m.MonthlyBalance.objects.exists())  # pylint: disable=E1101; # noqa
+
     # TODO: write me
     def data_is_ordered_by_date_ascending(self):
         pass
@@ -1069,3 +1374,186 @@ class GoalPageTest(BaseTest):
         self.assertEqual(updated_goal.text, new_text)
         self.assertEqual(updated_goal.note, new_note)
         self.assertEqual(updated_goal.amount, new_amount)
+
+
+class GraphsTest(BaseTest):
+    """Unit tests related to the graph images"""
+
+    def create_two_expenses(self, date):
+        """Create two expenses in two different categories"""
+        for _ in range(2):
+            category = self.create_category(self.generate_string(10))
+            self.create_expense(category, random.randint(1, 90000),
+                                self.generate_string(10), date)
+
+    @BaseTest.login
+    def test_expenses_page_links_pie_graph(self):
+        date = datetime.date.today().replace(day=1)
+        self.create_two_expenses(date)
+
+        response = self.client.get(reverse('budgets:expenses'))
+        graph_url = reverse('budgets:expenses_pie_graph',
+                            kwargs={'start': date.strftime('%Y-%m'),
+                                    'fmt': 'png'})
+        self.assertEqual(response.context['pie_graph'], graph_url)
+        self.assertContains(response, f'<img src="{graph_url}"')
+
+    @BaseTest.login
+    def test_expenses_pie_graph_is_a_png(self):
+        date = datetime.date.today().replace(day=1)
+        self.create_two_expenses(date)
+
+        url = reverse('budgets:expenses_pie_graph',
+                      kwargs={'start': date.strftime('%Y-%m'),
+                              'fmt': 'png'})
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'image/png')
+        self.assertTrue(response.content.startswith(b'\x89PNG'))
+        self.assertIn('private', response['Cache-Control'])
+
+    @BaseTest.login
+    def test_unchanged_graph_is_not_modified(self):
+        """Revalidating with the ETag returns 304 until data changes"""
+        date = datetime.date.today().replace(day=1)
+        self.create_two_expenses(date)
+        url = reverse('budgets:expenses_pie_graph',
+                      kwargs={'start': date.strftime('%Y-%m'),
+                              'fmt': 'png'})
+
+        etag = self.client.get(url)['ETag']
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        self.create_two_expenses(date)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    @BaseTest.login
+    def test_graph_needs_at_least_two_entries(self):
+        date = datetime.date.today().replace(day=1)
+        category = self.create_category(self.generate_string(10))
+        self.create_expense(category, 10, self.generate_string(10), date)
+
+        url = reverse('budgets:expenses_pie_graph',
+                      kwargs={'start': date.strftime('%Y-%m'),
+                              'fmt': 'png'})
+        self.assertEqual(self.client.get(url).status_code, 404)
+        response = self.client.get(reverse('budgets:expenses'))
+        self.assertFalse(response.context['pie_graph'])
+
+    @BaseTest.login
+    def test_monthly_balances_graphs(self):
+        start = datetime.date.today().replace(day=1)
+        prev = utils.get_previous_month_first_day_date(start)
+        for _ in range(2):
+            cat = self.create_monthly_balance_category(self.generate_string(10))
+            self.create_monthly_balance(cat, random.randint(1, 90000), start)
+            self.create_monthly_balance(cat, random.randint(1, 90000), prev)
+
+        response = self.client.get(reverse('budgets:home'))
+        bar_url = reverse('budgets:monthly_balances_bar_graph',
+                          kwargs={'fmt': 'png'})
+        pie_url = reverse('budgets:monthly_balances_pie_graph',
+                          kwargs={'date': start.strftime('%Y-%m'),
+                                  'fmt': 'png'})
+        self.assertEqual(response.context['bar_graph'], bar_url)
+        self.assertEqual(response.context['pie_graph'], pie_url)
+
+        for url in (bar_url, pie_url):
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response['Content-Type'], 'image/png')
+
+    def test_graphs_show_only_current_user_data(self):
+        self._login()
+        date = datetime.date.today().replace(day=1)
+        self.create_two_expenses(date)
+        url = reverse('budgets:expenses_pie_graph',
+                      kwargs={'start': date.strftime('%Y-%m'),
+                              'fmt': 'png'})
+        self.assertEqual(self.client.get(url).status_code, 200)
+        self._logout()
+
+        self.signup_and_login()
+        self.assertEqual(self.client.get(url).status_code, 404)
+        url = reverse('budgets:monthly_balances_bar_graph',
+                      kwargs={'fmt': 'png'})
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 404)
+
+    @BaseTest.login
+    def test_stale_graph_is_served_while_rendering(self):
+        """
+        With background rendering enabled, the previous image is returned
+        (and flagged as stale) until the new one is rendered
+        """
+        cache = ChartCache(LocMemChartCache())
+        executor = ManualExecutor(auto=True)
+        renderer = BackgroundRenderer(cache, executor)
+        url = reverse('budgets:monthly_balances_bar_graph',
+                      kwargs={'fmt': 'png'})
+        start = datetime.date.today().replace(day=1)
+        cat = self.create_monthly_balance_category(self.generate_string(10))
+        self.create_monthly_balance(cat, 100, start)
+        self.create_monthly_balance(
+            cat, 200, utils.get_previous_month_first_day_date(start))
+
+        with mock.patch.dict(os.environ, {'CHART_RENDER_WORKERS': '1'}), \
+                mock.patch('graphs.background.get_background_renderer',
+                           return_value=renderer):
+            first = self.client.get(url)
+            self.assertNotIn('X-Chart-Stale', first)
+
+            executor.auto = False
+            self.create_monthly_balance(
+                cat, 300, start - datetime.timedelta(days=65))
+            response = self.client.get(url)
+            self.assertEqual(response['X-Chart-Stale'], '1')
+            self.assertNotIn('ETag', response)
+            self.assertEqual(response.content, first.content)
+
+            executor.run_all()
+            response = self.client.get(url)
+            self.assertNotIn('X-Chart-Stale', response)
+            self.assertNotEqual(response['ETag'], first['ETag'])
+
+    @BaseTest.login
+    def test_graphs_rendered_again_on_deferred_deletes(self):
+        renderer = BackgroundRenderer(ChartCache(LocMemChartCache()),
+                                      ManualExecutor())
+        start = datetime.date.today().replace(day=1)
+        category = self.create_category('Rent')
+        balance_category = self.create_monthly_balance_category('Bank')
+        for i in range(3):
+            self.create_expense(category, 100, f'note {i}', start)
+            self.create_monthly_balance(
+              balance_category, 100,
+              start - datetime.timedelta(days=40 * i))
+        self.create_goal(1000, 'goal', 'note')
+
+        with mock.patch.dict(os.environ, {'CHART_RENDER_WORKERS': '1'}), \
+                mock.patch('graphs.background.get_background_renderer',
+                           return_value=renderer), \
+                mock.patch('django.db.transaction.on_commit',
+                           side_effect=lambda func: func()):
+            for model in (m.Expense, m.MonthlyBalance, m.Goal):
+                renderer.executor.jobs = []
+                model.objects.only('id').first().delete()  # pylint: disable=E1101; # noqa
+                self.assertTrue(renderer.executor.jobs, model)
+
+    @BaseTest.login
+    def test_svg_graphs(self):
+        """Pages link SVG images when CHART_FORMAT=svg"""
+        date = datetime.date.today().replace(day=1)
+        self.create_two_expenses(date)
+
+        with mock.patch.dict(os.environ, {'CHART_FORMAT': 'svg'}):
+            response = self.client.get(reverse('budgets:expenses'))
+        url = response.context['pie_graph']
+        self.assertTrue(url.endswith('.svg'))
+
+        response = self.client.get(url)
+        self.assertEqual(response['Content-Type'], 'image/svg+xml')
+        self.assertIn(b'<svg', response.content)
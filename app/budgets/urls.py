@@ -112,4 +112,15 @@ urlpatterns = [
     # ############### Function based routes #################
     path('', views.home_page, name='home'),
     path('landing_page', views.landing_page, name='landing_page'),
+
+    # Graphs (PNG or SVG images)
+    re_path(r'graphs/expenses/pie/(?P<start>(19|20)[0-9]{2}-(0[1-9]|1[012]))\.(?P<fmt>png|svg)$',
+            views.expenses_pie_graph, name='expenses_pie_graph'),
+    re_path(r'graphs/expenses/pie/(?P<start>(19|20)[0-9]{2}-(0[1-9]|1[012])-([0-3][0-9]))'
+            r'/(?P<end>(19|20)[0-9]{2}-(0[1-9]|1[012])-([0-3][0-9]))\.(?P<fmt>png|svg)$',
+            views.expenses_pie_graph, name='expenses_filtered_pie_graph'),
+    re_path(r'graphs/balances/pie/(?P<date>(19|20)[0-9]{2}-(0[1-9]|1[012]))\.(?P<fmt>png|svg)$',
+            views.monthly_balances_pie_graph, name='monthly_balances_pie_graph'),
+    re_path(r'graphs/balances/bar\.(?P<fmt>png|svg)$', views.monthly_balances_bar_graph,
+            name='monthly_balances_bar_graph'),
 ]
@@ -0,0 +1,119 @@
+# Copyright: (c) 2020, Michele Valsecchi <https://github.com/MicheleV>
+# GNU General Public License v3.0+
+# (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+"""
+Per user data versions, used to answer API conditional requests
+
+Every user has a version token stored in Django cache
+(DATA_VERSION_CACHE_ALIAS, default 'default'). The token is replaced (see
+budgets.signals) whenever any row owned by the user changes: as long as it is
+the same, so is every API response for that user, and requests with a
+matching If-None-Match get a 304 without any query.
+
+Only ETags are sent: responses also depend on the current date and exchange
+rate, which a Last-Modified time can not express.
+
+Writes bypassing signals (bulk_create, bulk_update, QuerySet.update) must call
+bump() themselves.
+
+NOTE: with several server processes, use a cache shared among them
+(e.g. memcached): a process would otherwise keep answering 304 with its own
+token after another process changed the data. Set API_CONDITIONAL_REQUESTS=n
+to disable conditional requests. They are also skipped while the cache can not
+hold versions (e.g. DummyCache, or memcached unreachable)
+"""
+import datetime
+import functools
+import hashlib
+import os
+import uuid
+
+from django.core.cache import caches
+from django.db import transaction
+from django.utils.cache import get_conditional_response
+from django.utils.cache import patch_cache_control
+
+
+def is_enabled():
+    """Return True if the API answers conditional requests"""
+    return 'y' in os.getenv('API_CONDITIONAL_REQUESTS', 'y')
+
+
+def _get_cache():
+    return caches[os.getenv('DATA_VERSION_CACHE_ALIAS', 'default')]
+
+
+def _version_key(user_id):
+    return f"data:token:{user_id}"
+
+
+def _load_version(user_id):
+    """
+    Return the current data version token of a user, and whether the cache
+    holds it
+    """
+    cache = _get_cache()
+    version = cache.get(_version_key(user_id))
+    if version is None:
+        # add() is a no-op if another process set the version in the meantime:
+        # read it again so that every process agrees on the same one
+        new_version = uuid.uuid4().hex
+        cache.add(_version_key(user_id), new_version, None)
+        version = cache.get(_version_key(user_id))
+        if version is None:
+            # The cache could not store it: it is valid for this call only
+            return new_version, False
+    return version, True
+
+
+def get_version(user_id):
+    """Return the current data version token of a user"""
+    return _load_version(user_id)[0]
+
+
+def bump(user_id):
+    """
+    Give a user a new data version, now and once the current transaction is
+    committed (requests served in the meantime could read the old data)
+    """
+    def set_version():
+        _get_cache().set(_version_key(user_id), uuid.uuid4().hex, None)
+    set_version()
+    transaction.on_commit(set_version)
+
+
+def conditional(view):
+    """
+    Decorator of API views: tag responses with the user data version (ETag),
+    and answer 304 to requests already having it
+    """
+    @functools.wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if (not is_enabled() or request.method not in ('GET', 'HEAD') or
+                not request.user.is_authenticated):
+            return view(request, *args, **kwargs)
+
+        token, stored = _load_version(request.user.id)
+        if not stored:
+            # Writes could not replace the version: it would never match
+            return view(request, *args, **kwargs)
+        # Responses of the same url differ by format (json, browsable api),
+        # and may change with no write: by default, some of them show the
+        # current month data, converted with the current exchange rate
+        variant = (f"{request.get_full_path()}|"
+                   f"{request.META.get('HTTP_ACCEPT')}|"
+                   f"{datetime.date.today()}|{os.getenv('EXCHANGE_RATE')}")
+        digest = hashlib.sha1(variant.encode()).hexdigest()[:16]
+        etag = f'"{token}-{digest}"'
+
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = view(request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+        response['ETag'] = etag
+        # API data belongs to the user: let browsers store it, but always
+        # revalidate
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
+    return wrapper
@@ -7,12 +7,9 @@ import datetime
 import os
 
 from django.contrib.auth.decorators import login_required
-from django.db.models import Sum
-from django.db.models import F
-from django.db.models import Case
-from django.db.models import When
 from django.core.exceptions import PermissionDenied
 from django.forms import formset_factory
+from django.http import Http404
 from django.shortcuts import redirect
 from django.shortcuts import render
 from django.urls import reverse
@@ -25,9 +22,12 @@ from django.views.generic import DetailView
 from django.views.generic import ListView
 from django.views.generic import UpdateView
 
+from budgets import dashboard
 import budgets.forms as f
 import budgets.models as m
 import budgets.views_utils as utils
+from graphs import background
+from graphs import plot
 
 
 ###############################################################################
@@ -131,15 +131,22 @@ class ExpenseListView(ListView):
         monthly_budgets = m.MonthlyBudget.objects.select_related(   # pylint: disable=E1101; # noqa
                           'category').filter(date=start, created_by=self.request.user)   # pylint: disable=E1101; # noqa
 
-        expenses = self.profile
+        # Totals are computed by the DB (read from the monthly totals for
+        # whole months): the expenses themselves are only fetched one page
+        # at a time
+        if self.kwargs.get('end', None) is None:
+            expenses_by_category = utils.get_month_expenses_by_category(
+                                   self.request.user, start)
+        else:
+            expenses_by_category = utils.get_expenses_by_category(
+                                   self.request.user, *self.start_end())
 
         # Get monthly budgets only for categories having expenses in that month
-        exp_aggregates = utils.aggregate_expenses_by_category(expenses, start_ymd)
+        exp_aggregates = utils.aggregate_expenses_by_category(
+                         expenses_by_category, start_ymd)
 
-        expenses_sum = 0
-        for _ in expenses:
-            expenses_sum += _.amount
-        context['expenses_sum'] = expenses_sum
+        context['expenses_sum'] = sum(
+          row['amount_sum'] for row in expenses_by_category)
 
         # NOTE: show budgets only if we do NOT filter by start & end dates
         #       start is never None, hence we only check for end
@@ -160,7 +167,20 @@ class ExpenseListView(ListView):
                                                        'date': start_ymd}
             context['exp_aggregates'] = exp_aggregates
 
-        pie_graph = utils.generate_current_month_expenses_pie_graph(expenses)
+        # The graph itself is served by expenses_pie_graph
+        pie_graph = False
+        if context['paginator'].count > 1:
+            end = self.kwargs.get('end', None)
+            if end is None:
+                pie_graph = utils.get_chart_url(
+                            'budgets:expenses_pie_graph',
+                            'api:expenses_pie_graph_data',
+                            {'start': start.strftime('%Y-%m')})
+            else:
+                pie_graph = utils.get_chart_url(
+                            'budgets:expenses_filtered_pie_graph',
+                            'api:expenses_pie_graph_data',
+                            {'start': start_ymd, 'end': end})
         context['pie_graph'] = pie_graph
         return context
 
@@ -503,6 +523,11 @@ class MonthlyBalancesView(ListView):  # pylint: disable=R0903; # noqa
     """WRITE ME."""
     model = m.MonthlyBalance
 
+    def get_queryset(self):
+        """Retrieve object owned by the current logged in user."""
+        return m.MonthlyBalance.objects.filter(  # pylint: disable=E1101; # noqa
+               created_by=self.request.user)
+
     def get_context_data(self, **kwargs):
         """WRITE ME."""
         context = super().get_context_data(**kwargs)
@@ -512,23 +537,19 @@ class MonthlyBalancesView(ListView):  # pylint: disable=R0903; # noqa
 
         rate = int(os.getenv("EXCHANGE_RATE"))
         total = None
-        bar_graph = False
 
-        m_b = m.MonthlyBalance.objects.select_related('category'). \
-            values('date').order_by('date'). \
-            annotate(amount=Sum(Case(
-              When(category__is_foreign_currency=False, then='amount'),
-              When(category__is_foreign_currency=True, then=F('amount') * rate)
-            ))).filter(created_by=self.request.user)
+        # Every month of the current user
+        m_b = utils.get_monthly_balances_by_date(self.request.user, rate)
         total = 0
         for _ in m_b:
-            total += _['amount']
+            total += _['actual_amount']
 
-        # Display only not archived goals
-        goals = m.Goal.objects.filter(  # pylint: disable=E1101; # noqa
-                is_archived=False, created_by=self.request.user)
-        if len(m_b) > 0:
-            bar_graph = utils.generate_monthly_balance_bar_graph(m_b, goals)
+        # The graph itself is served by monthly_balances_bar_graph
+        bar_graph = False
+        if len(m_b) > 1:
+            bar_graph = utils.get_chart_url(
+                        'budgets:monthly_balances_bar_graph',
+                        'api:monthly_balances_bar_graph_data')
 
         context['monthly_balances'] = m_b
         context['bar_graph'] = bar_graph
@@ -544,6 +565,11 @@ class MonthlyBalancesSingleMonthView(ListView):  # pylint: disable=R0903; # noqa
     """
     model = m.MonthlyBalance
 
+    def get_queryset(self):
+        """Retrieve object owned by the current logged in user."""
+        return m.MonthlyBalance.objects.filter(  # pylint: disable=E1101; # noqa
+               created_by=self.request.user)
+
     template_name = 'budgets/monthlybalance_singlemonth_list.html'
 
     def get_context_data(self, **kwargs):
@@ -626,23 +652,26 @@ class MonthlyBalanceDeleteView(DeleteView):
 @require_http_methods(["GET", "POST"])
 def multiple_new_monthly_budget(request):
     """WRITE ME."""
-    categories = m.Category.objects.filter(is_archived=False, created_by=request.user)  # pylint: disable=E1101; # noqa
-    cats = categories.count()
-    mb_formset = formset_factory(form=f.MonthlyBudgetForm, extra=cats,
-                                 max_num=cats)
+    # Every form validates and lists the user categories: load them once
+    user_categories = m.Category.objects.filter(  # pylint: disable=E1101; # noqa
+                      created_by=request.user).order_by('id').in_bulk()
+    categories = [c for c in user_categories.values() if not c.is_archived]
+    cats = len(categories)
+    mb_formset = formset_factory(form=f.MultipleMonthlyBudgetForm,
+                                 formset=f.MultipleMonthlyFormSet,
+                                 extra=cats, max_num=cats)
+    form_kwargs = {'user': request.user, 'categories': user_categories}
 
     curr_month_start = utils.get_month_boundaries()[0]
     prev_month_start = utils.get_previous_month_first_day_date(
                        curr_month_start)
     if request.method == 'POST':
-        formset = mb_formset(data=request.POST, form_kwargs={'user': request.user})
-        # FIXME: we are not handling when the user submit forms with the same
-        # category, and we're also not handling creation of monthly_budgets
-        # that already exists for that (category - date combination)
+        formset = mb_formset(data=request.POST, form_kwargs=form_kwargs)
+        # Budgets already existing for a (category, date) pair are updated
         if formset.is_valid():
-            for form in formset:
-                form.instance.created_by = request.user
-                form.save()
+            utils.upsert_monthly_rows(m.MonthlyBudget, request.user,  # pylint: disable=E1101; # noqa
+                                      [form.instance for form in formset
+                                       if form.has_changed()])
             return redirect('budgets:monthly_budgets')
     else:
         # Prepopulate the form date field, and select a different category
@@ -650,13 +679,11 @@ def multiple_new_monthly_budget(request):
         intial_data = []
         for c in categories:
             intial_data.append({'date': curr_month_start, 'category': c.id})
-        formset = mb_formset(initial=intial_data, form_kwargs={'user': request.user})
+        formset = mb_formset(initial=intial_data, form_kwargs=form_kwargs)
 
-    prev_month_monthly_budgets = m.MonthlyBudget.objects.filter(  # pylint: disable=E1101; # noqa
-                                 date=prev_month_start)
-    prev_month_dic = {}
-    for _ in prev_month_monthly_budgets:
-        prev_month_dic[int(_.category.id)] = _.amount
+    prev_month_dic = dict(m.MonthlyBudget.objects.filter(  # pylint: disable=E1101; # noqa
+                          date=prev_month_start, created_by=request.user
+                          ).values_list('category_id', 'amount'))
 
     return render(request, 'budgets/multiple_monthly_budget_form.html',
                   {'formset': formset,
@@ -667,34 +694,38 @@ def multiple_new_monthly_budget(request):
 @require_http_methods(["GET", "POST"])
 def multiple_new_monthly_balance(request):
     """WRITE ME."""
-    categories = m.MonthlyBalanceCategory.objects.filter(created_by=request.user)  # pylint: disable=E1101; # noqa
-    cats = categories.count()
-    mb_formset = formset_factory(form=f.MonthlyBalanceForm, extra=cats,
-                                 max_num=cats)
+    # Every form validates and lists the user categories: load them once
+    user_categories = m.MonthlyBalanceCategory.objects.filter(  # pylint: disable=E1101; # noqa
+                      created_by=request.user).order_by('id').in_bulk()
+    cats = len(user_categories)
+    mb_formset = formset_factory(form=f.MultipleMonthlyBalanceForm,
+                                 formset=f.MultipleMonthlyFormSet,
+                                 extra=cats, max_num=cats)
+    form_kwargs = {'user': request.user, 'categories': user_categories}
 
     curr_month_start = utils.get_month_boundaries()[0]
     prev_month_start = utils.get_previous_month_first_day_date(curr_month_start)
     if request.method == 'POST':
-        formset = mb_formset(data=request.POST, form_kwargs={'user': request.user})
-        # FIXME: we are not handling when the user submit forms with the same
-        # category, and we're also not handling creation of monthly_balance
-        # that already exists for that (category - date combination)
+        formset = mb_formset(data=request.POST, form_kwargs=form_kwargs)
+        # Balances already existing for a (category, date) pair are updated
         if formset.is_valid():
-            for form in formset:
-                form.instance.created_by = request.user
-                form.save()
+            balances = [form.instance for form in formset if form.has_changed()]
+            utils.upsert_monthly_rows(m.MonthlyBalance, request.user, balances)  # pylint: disable=E1101; # noqa
+            # Bulk writes send no signals: do what budgets.signals would
+            dashboard.invalidate(request.user.id)
+            if background.is_enabled():
+                for date in {balance.date for balance in balances}:
+                    utils.rerender_monthly_balance_graphs(request.user, date)
             return redirect('budgets:monthly_balances')
     else:
         intial_data = []
-        for c in categories:
-            intial_data.append({'date': curr_month_start, 'category': c.id})
-        formset = mb_formset(initial=intial_data, form_kwargs={'user': request.user})
+        for c in user_categories:
+            intial_data.append({'date': curr_month_start, 'category': c})
+        formset = mb_formset(initial=intial_data, form_kwargs=form_kwargs)
 
-    prev_month_monthly_balances = m.MonthlyBalance.objects.filter(  # pylint: disable=E1101; # noqa
-                                  date=prev_month_start, created_by=request.user)
-    prev_month_dic = {}
-    for _ in prev_month_monthly_balances:
-        prev_month_dic[int(_.category.id)] = _.amount
+    prev_month_dic = dict(m.MonthlyBalance.objects.filter(  # pylint: disable=E1101; # noqa
+                          date=prev_month_start, created_by=request.user
+                          ).values_list('category_id', 'amount'))
 
     return render(request, 'budgets/multiple_monthly_balance_form.html',
                   {'formset': formset,
@@ -720,54 +751,88 @@ def landing_page(request):
 def home_page(request):
     """Display the home page."""
     currency = os.getenv("CURRENCY")
-    webpack = os.getenv("USE_WEBPACK_DEV_SERVER")
+    (start, _) = utils.current_month_boundaries()
+
+    # Balances, goals and charts data are cached until they change
     # TODO: refactor this to enable multiple currencies (and enable currency
     # rates to be edited inside the app: drop the value from .env file)
-    rate = int(os.getenv("EXCHANGE_RATE"))
-    (start, _) = utils.current_month_boundaries()
-    user = request.user
+    snapshot = dashboard.get_snapshot(request.user)
+    context = dict(snapshot['context'])
+
+    # Display pie graph (served by monthly_balances_pie_graph)
+    pie_graph = False
+    if snapshot['pie'] is not None:
+        pie_graph = utils.get_chart_url('budgets:monthly_balances_pie_graph',
+                                        'api:monthly_balances_pie_graph_data',
+                                        {'date': start.strftime('%Y-%m')})
+
+    # The graph itself is served by monthly_balances_bar_graph, which only
+    # draws the current user data
+    bar_graph = False
+    if snapshot['bar'] is not None:
+        bar_graph = utils.get_chart_url('budgets:monthly_balances_bar_graph',
+                                        'api:monthly_balances_bar_graph_data')
+
+    context.update({
+        # TODO: do this on the template side
+        'currency': currency,
+        'bar_graph': bar_graph,
+        'pie_graph': pie_graph,
+    })
+    return render(request, 'home.html', context)
 
-    # Get current and preivous month balances
-    current_balance = utils.get_total_of_monthly_balances(start, user)
-    prev_month = utils.get_previous_month_first_day_date(start)
-    starting_balance = utils.get_total_of_monthly_balances(prev_month, user)
 
-    # Fetch previous month data to compare it with the current month's
-    prev_mb, prev_tot = utils.get_month_balance_stats(prev_month, rate, user)
-    current_mb, curr_tot = utils.get_month_balance_stats(start, rate, user)
+###############################################################################
+# Graphs (served as PNG or SVG, see graphs.plot.get_output_format)
+###############################################################################
+@login_required
+@require_http_methods(["GET"])
+def expenses_pie_graph(request, start, fmt, end=None):
+    """
+    Return the pie graph of the expenses of a given month (YYYY-mm),
+    or between two dates (YYYY-mm-dd, extremes included)
+    """
+    data = utils.load_expenses_pie_graph_data(request.user, start, end)
+    if data is None:
+        raise Http404()
 
-    # Display pie graph
-    pie_graph = utils.generate_current_monthly_balance_pie_graph(current_mb)
+    # Only whole months graphs are rendered in background
+    slot = None
+    if end is None:
+        slot = utils.expenses_pie_graph_slot(request.user, start, fmt)
+    job = plot.pie_graph_job(*data, fmt=fmt)
+    return utils.graph_response(request, job, fmt, slot)
 
-    # TODO: use 1 year or 6 months, instead of 2 months
-    curr_tot, diff, diff_perc = utils.calc_increase_perc(curr_tot, prev_tot)
 
-    # Display bar graph: only draw active goals
-    goals = utils.get_goals_and_time_to_completions(curr_tot, diff)
-    # FIXME: filter by current user
-    monthly_balance = m.MonthlyBalance.objects.select_related('category').values('date').annotate(actual_amount=Sum(Case(  # pylint: disable=E1101; # noqa
-                      When(category__is_foreign_currency=False, then='amount'),
-                      When(category__is_foreign_currency=True, then=F('amount') * rate)
-        ))).order_by('date')
+@login_required
+@require_http_methods(["GET"])
+def monthly_balances_pie_graph(request, date, fmt):
+    """
+    Return the pie graph of the monthly balances of a given month (YYYY-mm)
+    """
+    data = dashboard.load_monthly_balance_pie_graph_data(request.user, date)
+    if data is None:
+        raise Http404()
 
-    bar_graph = utils.generate_monthly_balance_bar_graph(monthly_balance, goals)
+    slot = utils.monthly_balance_pie_graph_slot(request.user, date, fmt)
+    job = plot.pie_graph_job(*data, fmt=fmt)
+    return utils.graph_response(request, job, fmt, slot)
 
-    return render(request, 'home.html',  {
-        'current_balance': current_balance,
-        'starting_balance': starting_balance,
-        # TODO: do this on the template side
-        'currency': currency,
-        'bar_graph': bar_graph,
-        'pie_graph': pie_graph,
-        'current_mb': current_mb,
-        'current_mb_total': curr_tot,
-        'prev_mb': prev_mb,
-        'prev_mb_total': prev_tot,
-        'two_months_diff': diff,
-        'two_months_diff_perc': diff_perc,
-        'goals': goals,
-        'webpack': webpack,
-    })
+
+@login_required
+@require_http_methods(["GET"])
+def monthly_balances_bar_graph(request, fmt):
+    """
+    Return the bar graph of the monthly balances totals, including the
+    current user not archived goals
+    """
+    data = dashboard.load_monthly_balance_bar_graph_data(request.user)
+    if data is None:
+        raise Http404()
+
+    slot = utils.monthly_balance_bar_graph_slot(request.user, fmt)
+    job = plot.bar_graph_job(*data, fmt=fmt)
+    return utils.graph_response(request, job, fmt, slot)
 
 
 ###############################################################################
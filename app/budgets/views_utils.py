@@ -5,19 +5,32 @@ import calendar
 import datetime
 import math
 import os
+from urllib.parse import urlencode
 from dateutil.relativedelta import relativedelta
 
 from django.core.exceptions import ValidationError
+from django.db import transaction
 from django.db.models import Sum
 from django.db.models import F
 from django.db.models import Case
+from django.db.models import Count
+from django.db.models import IntegerField
+from django.db.models import Min
 from django.db.models import When
 from django.db.utils import IntegrityError
+from django.http import HttpResponse
 from django.shortcuts import redirect
 from django.urls import reverse
+from django.utils.cache import get_conditional_response
+from django.utils.cache import patch_cache_control
+from graphs import background
 from graphs import plot
 
 import budgets.models as m
+from budgets import versions
+
+# Months of balances drawn by the monthly balances bar graph
+DEFAULT_HISTORY_MONTHS = 60
 
 
 def get_previous_month_first_day_date(date):
@@ -27,18 +40,6 @@ def get_previous_month_first_day_date(date):
     return (date - relativedelta(months=1)).replace(day=1)
 
 
-def get_total_of_monthly_balances(date, user):
-    """
-    Return the sum of the monthly balances date/user combination passed as args
-    """
-    rate = int(os.getenv("EXCHANGE_RATE"))
-    balances = m.MonthlyBalance.objects.select_related('category').filter(date=date, created_by=user)  # pylint: disable=E1101; # noqa
-    return balances.aggregate(correct_sum=Sum(Case(
-      When(category__is_foreign_currency=False, then='amount'),
-      When(category__is_foreign_currency=True, then=F('amount') * rate)
-    )))['correct_sum']
-
-
 def get_month_boundaries(date=None):
     """
     Return a tuple composed of the first and the last day
@@ -78,98 +79,296 @@ def current_month_boundaries():
     return (start, end)
 
 
-def generate_monthly_balance_bar_graph(data, goals):
+def get_monthly_balance_bar_graph_data(data):
     """
-    Return a base64 string making up the graph or false
+    Return the dates and the amounts to be drawn in the monthly balances
+    bar graph
     """
-    if len(data) > 1:
-        dates = []
-        amounts = []
-        for val in data:
-            dates.append(val['date'])
-            try:
-                amounts.append(val['actual_amount'])
-            except (AttributeError, NameError, KeyError) as e:  # pylint: disable=W0612,C0103; # noqa
-                print("You've forgot to add actual_amount somewhere (bar)")
-                amounts.append(val['amount'])
-        return plot.generateBarGraph(dates, amounts, goals)
-
-    return False
-
-
-def generate_current_monthly_balance_pie_graph(data):
+    dates = []
+    amounts = []
+    for val in data:
+        dates.append(val['date'])
+        try:
+            amounts.append(val['actual_amount'])
+        except (AttributeError, NameError, KeyError) as e:  # pylint: disable=W0612,C0103; # noqa
+            print("You've forgot to add actual_amount somewhere (bar)")
+            amounts.append(val['amount'])
+    return dates, amounts
+
+
+def get_monthly_balance_pie_graph_data(data):
     """
-    Return a base64 string making up the graph or false
+    Return the labels and the values to be drawn in the monthly balances
+    pie graph
     """
-    if len(data) > 1:
-        labels = []
-        values = []
-        for m_b in filter(lambda y: y.amount > 0, data):
-            labels.append(m_b.category.text)
-            # TODO: remove this once all places calling this function are
-            # passing monthly budgets with actual_ammount attribute
-            try:
-                values.append(m_b.actual_amount)
-            except AttributeError as e:  # pylint: disable=W0612,C0103; # noqa
-                print("You've forgot to add actual_amount somewhere (pie)")
-                values.append(m_b.amount)
-        return plot.generatePieGraph(labels, values)
-    return False
+    labels = []
+    values = []
+    for m_b in filter(lambda y: y.amount > 0, data):
+        labels.append(m_b.category.text)
+        # TODO: remove this once all places calling this function are
+        # passing monthly budgets with actual_ammount attribute
+        try:
+            values.append(m_b.actual_amount)
+        except AttributeError as e:  # pylint: disable=W0612,C0103; # noqa
+            print("You've forgot to add actual_amount somewhere (pie)")
+            values.append(m_b.amount)
+    return labels, values
+
+
+def get_expenses_by_category(user, start, end):
+    """
+    Return the expenses between start and end (extremes included) grouped by
+    category in a single query, in order of first expense.
+
+    Each row is a dict with the keys:
+    - category, category__text
+    - total: the sum of the positive amounts
+    - amount_sum: the sum of every amount
+    - count: the number of expenses
+    """
+    positive_amount = Case(When(amount__gt=0, then='amount'), default=0,
+                           output_field=IntegerField())
+    return list(m.Expense.objects.filter(  # pylint: disable=E1101; # noqa
+                date__range=(start, end), created_by=user).values(
+                'category', 'category__text').annotate(
+                total=Sum(positive_amount), amount_sum=Sum('amount'),
+                count=Count('id'), first_id=Min('id')).order_by('first_id'))
 
 
-# Credits https://stackoverflow.com/a/58612038
-def find_in_list(_list, item):
+def get_month_expenses_by_category(user, month):
     """
-    Return the index of item inside List, or -1 if not found
+    Return the same rows get_expenses_by_category does, for the month
+    starting at month (a date), read from the monthly totals (in order of
+    category) instead of the expenses
     """
-    try:
-        # 'list' is a reserved keyword, using workaround
-        return _list.index(item)
-    except ValueError:
-        return -1
+    totals = m.MonthlyCategoryTotal.objects.filter(  # pylint: disable=E1101; # noqa
+             created_by=user, date=month).order_by('category_id').values_list(
+             'category', 'category__text', 'positive_amount', 'amount',
+             'count')
+    return [{'category': category, 'category__text': text, 'total': total,
+             'amount_sum': amount_sum, 'count': count}
+            for category, text, total, amount_sum, count in totals]
 
 
 def aggregate_expenses_by_category(data, date=None):
     """Return an array of dicts with expense sums, which keys are category.text
 
+    - data are the rows returned by get_expenses_by_category
     - If a date is passed, it will be added to each category expense aggregate
     - Each dictionary will have a default budgeted key with value 0 and it will
     also have a date if passed, otherwise date is None
     """
     results = {}
-    for exp in filter(lambda y: y.amount > 0, data):
-        if exp.category.text in results:
-            results[exp.category.text]['total'] += exp.amount
-        else:
-            results[exp.category.text] = {
-              'total': exp.amount,
-              'budgeted': 0,
-              'category': exp.category.id,
-              'date': date
-            }
+    for row in filter(lambda y: y['total'] > 0, data):
+        results[row['category__text']] = {
+          'total': row['total'],
+          'budgeted': 0,
+          'category': row['category'],
+          'date': date
+        }
     return results
 
 
-def generate_current_month_expenses_pie_graph(data):
+def get_expenses_pie_graph_data(data):
     """
-    Return the graph and returns the data in base64
-    Return boolean representing whether a graph was generated or not
+    Return the labels (category names) and the values (expenses sum per
+    category) to be drawn in the expenses pie graph
+    data are the rows returned by get_expenses_by_category
     """
-    if len(data) > 1:
-        labels = []
-        values = []
+    labels = []
+    values = []
+    for row in filter(lambda y: y['total'] > 0, data):
+        labels.append(row['category__text'])
+        values.append(row['total'])
+    return labels, values
+
+
+def get_history_months():
+    """
+    Return how many months of balances (current one included) the monthly
+    balances bar graph shows, 0 for all of them
+    """
+    return int(os.getenv("MONTHLY_BALANCES_HISTORY_MONTHS",
+                         DEFAULT_HISTORY_MONTHS))
+
+
+def get_monthly_balances_by_date(user, rate, months=0):
+    """
+    Return the sum of the monthly balances of each month (adjusted to local
+    currency) as a list of dicts with 'date' and 'actual_amount' keys
+    Only the last months (current one included) are returned, unless
+    months is 0
+    """
+    filters = {'created_by': user}
+    if months > 0:
+        (start, _) = current_month_boundaries()
+        filters['date__gte'] = start - relativedelta(months=months - 1)
+    return m.MonthlyBalance.objects.filter(**filters).values('date').annotate(actual_amount=Sum(Case(  # pylint: disable=E1101; # noqa
+                      When(category__is_foreign_currency=False, then='amount'),
+                      When(category__is_foreign_currency=True, then=F('amount') * rate)
+        ))).order_by('date')
+
+
+def load_expenses_pie_graph_data(user, start, end=None):
+    """
+    Return the labels and values of the expenses pie graph for a given month
+    (YYYY-mm), or between two dates (YYYY-mm-dd, extremes included)
+    Return None if there is not enough data to draw a graph
+    """
+    if end is None:
+        (start, _) = get_month_boundaries(start)
+        expenses = get_month_expenses_by_category(user, start)
+    else:
+        expenses = get_expenses_by_category(user, start, end)
+    if sum(row['count'] for row in expenses) < 2:
+        return None
+    return get_expenses_pie_graph_data(expenses)
+
+
+def load_monthly_balance_pie_graph_data(user, date):
+    """
+    Return the labels and values of the monthly balances pie graph for a
+    given month (YYYY-mm)
+    Return None if there is not enough data to draw a graph
+    """
+    rate = int(os.getenv("EXCHANGE_RATE"))
+    (start, _) = get_month_boundaries(date)
+    balances, _ = get_month_balance_stats(start, rate, user)
+    if len(balances) < 2:
+        return None
+    return get_monthly_balance_pie_graph_data(balances)
+
+
+def load_monthly_balance_bar_graph_data(user):
+    """
+    Return the dates, amounts and goals of the monthly balances bar graph
+    Only not archived goals are returned
+    Return None if there is not enough data to draw a graph
+    """
+    rate = int(os.getenv("EXCHANGE_RATE"))
+    balances = get_monthly_balances_by_date(user, rate, get_history_months())
+    if len(balances) < 2:
+        return None
+    goals = m.Goal.objects.filter(  # pylint: disable=E1101; # noqa
+            is_archived=False, created_by=user).order_by('id')
+    dates, amounts = get_monthly_balance_bar_graph_data(balances)
+    return dates, amounts, list(goals)
+
+
+def use_client_side_charts():
+    """
+    Return whether charts are drawn by the browser (CHART_RENDERING=client)
+    instead of being rendered to PNG by the server
+    """
+    return os.getenv("CHART_RENDERING", "server") == "client"
+
+
+def get_chart_url(image_url_name, series_url_name, kwargs=None):
+    """
+    Return the url the page should use to display a chart: the image route
+    (in the CHART_FORMAT format), or the JSON series api route when charts
+    are drawn client side
+    """
+    kwargs = kwargs or {}
+    if use_client_side_charts():
+        url = reverse(series_url_name)
+        if kwargs:
+            url = f"{url}?{urlencode(kwargs)}"
+        return url
+    return reverse(image_url_name,
+                   kwargs={**kwargs, 'fmt': plot.get_output_format()})
+
+
+def expenses_pie_graph_slot(user, month, fmt):
+    """
+    Return the name identifying the expenses pie graph of a user for a given
+    month (YYYY-mm) and format, regardless of the data drawn in it
+    """
+    return f"expenses_pie:{user.id}:{month}:{fmt}"
+
+
+def monthly_balance_pie_graph_slot(user, month, fmt):
+    """
+    Return the name identifying the monthly balances pie graph of a user for
+    a given month (YYYY-mm) and format, regardless of the data drawn in it
+    """
+    return f"balances_pie:{user.id}:{month}:{fmt}"
+
+
+def monthly_balance_bar_graph_slot(user, fmt):
+    """
+    Return the name identifying the monthly balances bar graph of a user in a
+    given format, regardless of the data drawn in it
+    """
+    return f"balances_bar:{user.id}:{fmt}"
+
+
+def graph_response(request, job, fmt, slot=None):
+    """
+    Return an HttpResponse containing the image described by job (see
+    graphs.plot.pie_graph_job and graphs.plot.bar_graph_job)
+
+    The chart key is a hash of the data being drawn, hence it is used as ETag:
+    clients revalidating an unchanged chart get a 304 without any rendering.
+
+    When charts are rendered in background, the previous image of the same
+    slot may be returned while the new one is rendering: it is flagged with
+    the X-Chart-Stale header and must not be stored by the client
+    """
+    key = job[0]
+    etag = f'"{key}"'
+    response = get_conditional_response(request, etag=etag)
+    stale = False
+    if response is None:
+        if slot is not None and background.is_enabled():
+            renderer = background.get_background_renderer()
+            image, stale = renderer.get(slot, job)
+        else:
+            image = plot.get_image(job)
+        response = HttpResponse(image, content_type=plot.CONTENT_TYPES[fmt])
+
+    if stale:
+        response['X-Chart-Stale'] = '1'
+        patch_cache_control(response, no_store=True)
+    else:
+        response['ETag'] = etag
+        # Charts contain user data: let browsers store them, but always
+        # revalidate
+        patch_cache_control(response, private=True, no_cache=True)
+    return response
 
-        # NOTE: this ugly block saves us one query... is it worth it?
-        for m_b in filter(lambda y: y.amount > 0, data):
-            index = find_in_list(labels, m_b.category.text)
-            if index == -1:
-                labels.append(m_b.category.text)
-                values.append(m_b.amount)
-            else:
-                values[index] = values[index] + m_b.amount
 
-        return plot.generatePieGraph(labels, values)
-    return False
+def rerender_expenses_pie_graph(user, date):
+    """
+    Render in background the expenses pie graph of date's month
+    """
+    month = str(date)[:7]
+    fmt = plot.get_output_format()
+    data = load_expenses_pie_graph_data(user, month)
+    if data is not None:
+        background.get_background_renderer().enqueue(
+            expenses_pie_graph_slot(user, month, fmt),
+            plot.pie_graph_job(*data, fmt=fmt))
+
+
+def rerender_monthly_balance_graphs(user, date=None):
+    """
+    Render in background the monthly balances bar graph and, if date is
+    given, the pie graph of date's month
+    """
+    renderer = background.get_background_renderer()
+    fmt = plot.get_output_format()
+    if date is not None:
+        month = str(date)[:7]
+        data = load_monthly_balance_pie_graph_data(user, month)
+        if data is not None:
+            renderer.enqueue(monthly_balance_pie_graph_slot(user, month, fmt),
+                             plot.pie_graph_job(*data, fmt=fmt))
+
+    data = load_monthly_balance_bar_graph_data(user)
+    if data is not None:
+        renderer.enqueue(monthly_balance_bar_graph_slot(user, fmt),
+                         plot.bar_graph_job(*data, fmt=fmt))
 
 
 def append_year_and_month_to_url(obj, named_url, delete=False):
@@ -185,12 +384,14 @@ def append_year_and_month_to_url(obj, named_url, delete=False):
     return redirect_url
 
 
-def get_goals_and_time_to_completions(current_mb_total, two_months_diff):
+def get_goals_and_time_to_completions(current_mb_total, two_months_diff, user):
     """
-    Returns non archived goals with how many months will it take to complete
+    Returns non archived goals of user with how many months will it take to
+    complete
     """
     # Display bar graph (only draw "active" goals)
-    goals = m.Goal.objects.filter(is_archived=False)  # pylint: disable=E1101; # noqa
+    goals = m.Goal.objects.filter(  # pylint: disable=E1101; # noqa
+            is_archived=False, created_by=user).order_by('id')
     # Calculate time to complete each goal given the last two months difference
     for goal in goals:
         if current_mb_total >= goal.amount:
@@ -215,14 +416,36 @@ def get_month_balance_stats(date, rate, user):
     """
     prev_mb = m.MonthlyBalance.objects.select_related('category').filter(  # pylint: disable=E1101; # noqa
               date=date, created_by=user).order_by('category_id')
+    return compute_balance_stats(prev_mb, rate)
+
+
+def compute_balance_stats(balances, rate):
+    """
+    Return the monthly balances and their sum (adjusted to local currency).
+    Foreign currency balances get an actual_amount attribute
+    """
     total = 0
-    for mv in prev_mb:
+    for mv in balances:
         if mv.category.is_foreign_currency:
             total += mv.amount * rate
             mv.actual_amount = mv.amount * rate
         else:
             total += mv.amount
-    return prev_mb, total
+    return balances, total
+
+
+def get_months_balance_stats(dates, rate, user):
+    """
+    Return a {date: (monthly balances, sum)} dictionary for each date, see
+    get_month_balance_stats. Balances of all the dates are fetched at once
+    """
+    by_date = {date: [] for date in dates}
+    balances = m.MonthlyBalance.objects.select_related('category').filter(  # pylint: disable=E1101; # noqa
+               date__in=dates, created_by=user).order_by('category_id')
+    for balance in balances:
+        by_date[balance.date].append(balance)
+    return {date: compute_balance_stats(month_balances, rate)
+            for date, month_balances in by_date.items()}
 
 
 def calc_increase_perc(current_mb_total, prev_mb_total):
@@ -261,3 +484,34 @@ def check_constraints_workaround(self, form, already_exists_message, url):
         form.add_error('text', already_exists_message)
         return self.form_invalid(form)
     return redirect(url)
+
+
+def upsert_monthly_rows(model, user, instances):
+    """
+    Store instances of model (MonthlyBudget or MonthlyBalance) for user in one
+    transaction: those whose (category, date) pair already exists update the
+    stored amount, the others are inserted with a single bulk_create.
+    Return the (created, updated) lists of rows.
+    NOTE: bulk operations send no signals: only the user data version is
+    bumped here
+    """
+    with transaction.atomic():
+        stored = {(row.category_id, row.date): row
+                  for row in model.objects.select_for_update().filter(
+                    category__in={i.category_id for i in instances},
+                    date__in={i.date for i in instances})}
+        created, updated = [], []
+        for instance in instances:
+            row = stored.get((instance.category_id, instance.date))
+            if row is None:
+                instance.created_by = user
+                created.append(instance)
+            else:
+                row.amount = instance.amount
+                updated.append(row)
+        if updated:
+            model.objects.bulk_update(updated, ['amount'])
+        if created:
+            model.objects.bulk_create(created)
+        versions.bump(user.id)
+    return created, updated
@@ -0,0 +1,141 @@
+# Copyright: (c) 2020, Michele Valsecchi <https://github.com/MicheleV>
+# GNU General Public License v3.0+
+# (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+"""
+Render charts outside of the request/response cycle
+
+Charts are rendered by a local process pool (no broker needed) and stored in
+the chart cache (see graphs.cache). Each chart has a "slot" (e.g. the pie
+graph of a given user and month) remembering the key of the last rendered
+image: while a newer version is being rendered, the previous image is served
+instead, flagged as stale.
+
+Enabled by setting CHART_RENDER_WORKERS to the number of processes to use
+(0, the default, renders charts inside the request as before)
+"""
+from concurrent.futures import ProcessPoolExecutor
+import logging
+import multiprocessing
+import os
+import threading
+import time
+
+from graphs.cache import get_chart_cache
+from graphs.cache import make_key
+
+logger = logging.getLogger(__name__)
+
+
+class BackgroundRenderer():
+    """Submit chart jobs to an executor and keep track of their results"""
+
+    def __init__(self, chart_cache, executor):
+        self.chart_cache = chart_cache
+        self.executor = executor
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _slot_key(slot):
+        return make_key('slot', slot)
+
+    def latest_key(self, slot):
+        """Return the key of the last image rendered for slot, or None"""
+        key = self.chart_cache.backend.get(self._slot_key(slot))
+        return key.decode('ascii') if key is not None else None
+
+    def enqueue(self, slot, job):
+        """
+        Render job in background, unless the same image is already cached or
+        being rendered. Return a Future, or None if the image was cached
+        """
+        key, render, args = job
+        with self._lock:
+            if key in self._pending:
+                return self._pending[key]
+            if self.chart_cache.backend.get(key) is not None:
+                self._set_latest(slot, key)
+                return None
+            future = self.executor.submit(render, *args)
+            self._pending[key] = future
+        future.add_done_callback(
+            lambda f: self._on_rendered(slot, key, f))
+        return future
+
+    def _set_latest(self, slot, key):
+        if slot is not None:
+            self.chart_cache.backend.set(self._slot_key(slot),
+                                         key.encode('ascii'))
+
+    def _on_rendered(self, slot, key, future):
+        with self._lock:
+            self._pending.pop(key, None)
+        try:
+            png = future.result()
+        except Exception:  # pylint: disable=W0703; # noqa
+            logger.exception("Failed to render chart %s", slot)
+            return
+        self.chart_cache.backend.set(key, png)
+        self._set_latest(slot, key)
+
+    def get(self, slot, job):
+        """
+        Return a (png, is_stale) tuple for job.
+
+        If the image is not rendered yet, the last image of the same slot is
+        returned (is_stale is True) while the new one renders in background.
+        The caller waits for the render only if there is nothing to show
+        """
+        key = job[0]
+        png = self.chart_cache.backend.get(key)
+        if png is not None:
+            self.chart_cache.count('hits')
+            self._set_latest(slot, key)
+            return png, False
+
+        future = self.enqueue(slot, job)
+        previous = self.latest_key(slot) if slot is not None else None
+        if previous is not None and previous != key:
+            png = self.chart_cache.backend.get(previous)
+            if png is not None:
+                self.chart_cache.count('stale_hits')
+                return png, True
+
+        if future is None:
+            # Rendered in the meantime
+            return self.chart_cache.backend.get(key), False
+        start = time.perf_counter()
+        png = future.result()
+        self.chart_cache.count('misses', time.perf_counter() - start)
+        return png, False
+
+
+def is_enabled():
+    """Return whether charts are rendered in background"""
+    return int(os.getenv('CHART_RENDER_WORKERS', '0')) > 0
+
+
+_renderer = None
+_renderer_lock = threading.Lock()
+
+
+def get_background_renderer():
+    """
+    Return the process wide background renderer, creating its process pool
+    on first use
+    """
+    global _renderer  # pylint: disable=W0603; # noqa
+    if _renderer is None:
+        with _renderer_lock:
+            if _renderer is None:
+                chart_cache = get_chart_cache()
+                if chart_cache.backend is None:
+                    raise ValueError("Rendering charts in background needs "
+                                     "a CHART_CACHE_BACKEND")
+                # Spawn (instead of fork) the workers: the web server process
+                # holds threads and DB connections the workers must not inherit
+                executor = ProcessPoolExecutor(
+                    max_workers=int(os.getenv('CHART_RENDER_WORKERS')),
+                    mp_context=multiprocessing.get_context('spawn'))
+                _renderer = BackgroundRenderer(chart_cache, executor)
+    return _renderer
@@ -0,0 +1,255 @@
+# Copyright: (c) 2020, Michele Valsecchi <https://github.com/MicheleV>
+# GNU General Public License v3.0+
+# (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+"""
+Content-addressed cache for rendered charts
+
+Keys are a hash of everything that affects the output image (chart kind,
+labels, values, goals, theme, dpi), so the same data always maps to the same
+entry and there is nothing to invalidate: new data simply means a new key.
+
+The backend is selected via the CHART_CACHE_BACKEND env variable:
+- 'locmem' (default): per process LRU dictionary
+- 'django': Django cache framework (CHART_CACHE_ALIAS, default 'default')
+- 'file': one PNG per key inside CHART_CACHE_DIR
+- 'none': disable caching
+"""
+from collections import OrderedDict
+import hashlib
+import json
+import os
+import threading
+import time
+
+
+DEFAULT_MAX_ENTRIES = 128
+
+
+def make_key(kind, *parts):
+    """
+    Return a sha256 hex digest identifying a chart and its inputs
+    """
+    payload = json.dumps([kind, parts], default=str, sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class LocMemChartCache():
+    """Per process LRU cache, safe to share among threads"""
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Return the cached value, or None"""
+        with self._lock:
+            try:
+                self._data.move_to_end(key)
+            except KeyError:
+                return None
+            return self._data[key]
+
+    def set(self, key, value):
+        """Store value, evicting the least recently used entries"""
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        """Drop every entry"""
+        with self._lock:
+            self._data.clear()
+
+
+class DjangoChartCache():
+    """
+    Store charts using Django cache framework, so they can be shared among
+    workers. Eviction is delegated to the backend (see MAX_ENTRIES option)
+    """
+
+    prefix = 'chart'
+
+    def __init__(self, alias='default'):
+        self.alias = alias
+
+    @property
+    def _cache(self):
+        # Import lazily: this module is imported before settings are ready
+        from django.core.cache import caches
+        return caches[self.alias]
+
+    def get(self, key):
+        """Return the cached value, or None"""
+        return self._cache.get(f"{self.prefix}:{key}")
+
+    def set(self, key, value):
+        """Store value without expiration, the key is content-addressed"""
+        self._cache.set(f"{self.prefix}:{key}", value, None)
+
+    def clear(self):
+        """Drop every entry (of the whole Django cache)"""
+        self._cache.clear()
+
+
+class FileChartCache():
+    """
+    Store each chart as <key>.png inside a directory.
+    File modification time is used to track recency: it is bumped on every hit
+    and the oldest files are removed once max_entries is exceeded
+    """
+
+    suffix = '.png'
+
+    def __init__(self, directory, max_entries=DEFAULT_MAX_ENTRIES):
+        self.directory = directory
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + self.suffix)
+
+    def get(self, key):
+        """Return the cached value, or None"""
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as cached:
+                value = cached.read()
+            os.utime(path)
+        except OSError:
+            return None
+        return value
+
+    def set(self, key, value):
+        """Store value, evicting the least recently used files"""
+        path = self._path(key)
+        # Write then rename, so concurrent readers never see a partial file
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as tmp:
+            tmp.write(value)
+        os.replace(tmp_path, path)
+        with self._lock:
+            self._evict()
+
+    def _evict(self):
+        entries = []
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if entry.name.endswith(self.suffix):
+                    try:
+                        entries.append((entry.stat().st_mtime, entry.path))
+                    except OSError:
+                        # Removed by another process in the meantime
+                        continue
+        excess = len(entries) - self.max_entries
+        if excess > 0:
+            for _, path in sorted(entries)[:excess]:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    def clear(self):
+        """Drop every entry"""
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if entry.name.endswith(self.suffix):
+                    os.remove(entry.path)
+
+
+class ChartCache():
+    """
+    Wrap a backend and keep hit/miss counters, plus the time spent rendering
+    on misses (used to estimate how much rendering time the hits saved)
+    """
+
+    def __init__(self, backend=None):
+        self.backend = backend
+        self._lock = threading.Lock()
+        self.reset_stats()
+
+    def reset_stats(self):
+        """Zero every counter"""
+        with self._lock:
+            self.hits = 0
+            self.misses = 0
+            # Outdated images served while rendering (see graphs.background)
+            self.stale_hits = 0
+            self.render_seconds = 0.0
+
+    def count(self, counter, render_seconds=0.0):
+        """Increment one of the hits, misses or stale_hits counters"""
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+            self.render_seconds += render_seconds
+
+    def get_or_render(self, key, render):
+        """
+        Return the cached value for key, calling render() to create it
+        when missing
+        """
+        if self.backend is not None:
+            value = self.backend.get(key)
+            if value is not None:
+                self.count('hits')
+                return value
+
+        start = time.perf_counter()
+        value = render()
+        self.count('misses', time.perf_counter() - start)
+
+        if self.backend is not None:
+            self.backend.set(key, value)
+        return value
+
+    def stats(self):
+        """Return a dictionary with the cache counters"""
+        with self._lock:
+            avg = self.render_seconds / self.misses if self.misses else 0.0
+            return {
+              'backend': type(self.backend).__name__,
+              'hits': self.hits,
+              'misses': self.misses,
+              'stale_hits': self.stale_hits,
+              'render_seconds': self.render_seconds,
+              'avg_render_seconds': avg,
+              'estimated_saved_seconds': avg * self.hits,
+            }
+
+
+def create_backend(name=None):
+    """
+    Return the cache backend described by the env variables, or None
+    when caching is disabled
+    """
+    if name is None:
+        name = os.getenv('CHART_CACHE_BACKEND', 'locmem')
+    max_entries = int(os.getenv('CHART_CACHE_SIZE', DEFAULT_MAX_ENTRIES))
+
+    if name == 'none':
+        return None
+    if name == 'locmem':
+        return LocMemChartCache(max_entries)
+    if name == 'django':
+        return DjangoChartCache(os.getenv('CHART_CACHE_ALIAS', 'default'))
+    if name == 'file':
+        directory = os.getenv('CHART_CACHE_DIR', '/tmp/budgeteer-charts')
+        return FileChartCache(directory, max_entries)
+    raise ValueError(f"Unknown CHART_CACHE_BACKEND: {name}")
+
+
+_chart_cache = None
+_chart_cache_lock = threading.Lock()
+
+
+def get_chart_cache():
+    """Return the process wide chart cache, creating it on first use"""
+    global _chart_cache  # pylint: disable=W0603; # noqa
+    if _chart_cache is None:
+        with _chart_cache_lock:
+            if _chart_cache is None:
+                _chart_cache = ChartCache(create_backend())
+    return _chart_cache
@@ -1,36 +1,164 @@
-import base64
+from collections import namedtuple
 import datetime
+import functools
 from io import BytesIO
 import os
 
 from dotenv import load_dotenv
-from matplotlib import use as mpl_use
-from matplotlib import ticker
-from matplotlib.backends.backend_agg import FigureCanvasAgg
-import matplotlib.cm as cmx
-from matplotlib.cm import get_cmap
-from matplotlib.dates import DayLocator
-from matplotlib.dates import HourLocator
-from matplotlib.dates import DateFormatter
-from matplotlib.dates import drange
-from matplotlib.figure import Figure
-import matplotlib.patches as mpatches
-from matplotlib.patches import Circle
-from matplotlib.pyplot import xticks
-import numpy as np
-import pandas as pd
 
+from graphs.cache import get_chart_cache
+from graphs.cache import make_key
+from graphs.pool import pooled_figure
 from graphs.themes import _tab20c_data
 
 # Read env variables from .env file
 load_dotenv()
 
-# Avoid threading issues
-# Credits: https://stackoverflow.com/a/51178529
-mpl_use('Agg')
+# NOTE: matplotlib is imported inside the render_* functions only: loading it
+# is the largest part of the process startup time (gunicorn workers,
+# manage.py commands, tests), and most of them never draw a graph.
+# Python caches imported modules, so this is paid only on the first render.
+# Use tools/benchmarks/startup_time.py to check the import time
 
-# Address https://github.com/pandas-dev/pandas/issues/18301
-pd.plotting.register_matplotlib_converters()
+
+def _setup_matplotlib():
+    """
+    Configure matplotlib before the first render
+    """
+    from matplotlib import use as mpl_use
+
+    # Avoid threading issues
+    # Credits: https://stackoverflow.com/a/51178529
+    mpl_use('Agg')
+
+
+# Layout parameters shared by the figure templates below
+SUBPLOT_PARAMS = ('left', 'bottom', 'right', 'top', 'wspace', 'hspace')
+
+
+def _build_figure(dpi):
+    """
+    Return a new figure, attached to an Agg canvas, with a single axes
+    """
+    _setup_matplotlib()
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    fig = Figure(dpi=dpi)
+    FigureCanvasAgg(fig)
+    fig.add_subplot(111)
+    return fig
+
+
+def _reset_figure(fig):
+    """
+    Remove everything drawn on a figure returned by _build_figure
+    """
+    from matplotlib import rcParams
+
+    ax = fig.axes[0]
+    ax.clear()
+    # Neither of these is restored by clear()
+    ax.set_aspect('auto')
+    fig.subplots_adjust(**{param: rcParams[f'figure.subplot.{param}']
+                           for param in SUBPLOT_PARAMS})
+
+
+def _build_pie_figure():
+    """
+    Return a figure ready to draw a pie graph on
+    """
+    fig = _build_figure(PIE_FIGURE_DPI)
+    fig.axes[0].set_prop_cycle("color", _tab20c_data)
+    return fig
+
+
+def _reset_pie_figure(fig):
+    """
+    Restore a pie graph figure to the state of _build_pie_figure
+    """
+    _reset_figure(fig)
+    fig.axes[0].set_prop_cycle("color", _tab20c_data)
+
+
+def _build_bar_figure():
+    """
+    Return a figure ready to draw a bar graph on
+    """
+    return _build_figure(BAR_FIGURE_DPI)
+
+
+@functools.lru_cache(maxsize=None)
+def get_goal_colors():
+    """
+    Return the colors of the goal lines, looked up once per process
+    """
+    _setup_matplotlib()
+    from matplotlib.cm import get_cmap
+
+    return get_cmap(GOALS_COLORMAP).colors
+
+
+PIE_FIGURE_DPI = 310
+BAR_FIGURE_DPI = 111
+SAVE_DPI = 230
+# PNGs exceeding their byte budget are saved again at a lower dpi, down to
+MIN_SAVE_DPI = 50
+CONTENT_TYPES = {
+    'png': 'image/png',
+    'svg': 'image/svg+xml',
+}
+# The blue color used in the examples on matplot docs
+# https://github.com/matplotlib/matplotlib/blob/v3.1.2/lib/matplotlib/_color_data.py#L17
+BAR_BASE_COLOR = '#1f77b4'
+GOALS_COLORMAP = 'Set1'
+
+# Goals as drawn in the bar graph: unlike model instances, these can be sent
+# to the background rendering processes
+GoalLine = namedtuple('GoalLine', ['amount', 'text'])
+
+
+def get_output_format():
+    """
+    Return the format charts are served in (CHART_FORMAT: png or svg)
+    """
+    fmt = os.getenv("CHART_FORMAT", "png")
+    if fmt not in CONTENT_TYPES:
+        raise ValueError(f"Unknown CHART_FORMAT: {fmt}")
+    return fmt
+
+
+def get_output_dpi():
+    """
+    Return the dpi PNG charts are saved at (CHART_DPI)
+    """
+    return int(os.getenv("CHART_DPI", SAVE_DPI))
+
+
+def get_max_bytes(kind):
+    """
+    Return the byte budget of a chart kind ('pie' or 'bar') set via
+    CHART_PIE_MAX_BYTES or CHART_BAR_MAX_BYTES, or None if unlimited
+    """
+    return int(os.getenv(f"CHART_{kind.upper()}_MAX_BYTES", 0)) or None
+
+
+def save_figure(fig, fmt='png', dpi=SAVE_DPI, max_bytes=None):
+    """
+    Return the figure as bytes in the given format.
+    PNGs larger than max_bytes are saved again at a lower dpi until they fit
+    (or MIN_SAVE_DPI is reached). SVGs do not depend on dpi.
+    """
+    while True:
+        buf = BytesIO()
+        fig.savefig(buf, format=fmt, bbox_inches="tight", dpi=dpi)
+        data = buf.getvalue()
+        if (fmt != 'png' or max_bytes is None or len(data) <= max_bytes or
+                dpi <= MIN_SAVE_DPI):
+            return data
+        # The PNG size grows roughly with the pixel count, i.e. dpi squared
+        ratio = (max_bytes / len(data)) ** 0.5
+        dpi = max(MIN_SAVE_DPI, min(dpi - 1, int(dpi * ratio * 0.95)))
 
 
 def get_pie_slice_font_size(labels):
@@ -85,114 +213,159 @@ def get_goal_font_size(goals):
     return goal_font_size
 
 
+def pie_graph_key(labels, values, fmt='png', dpi=SAVE_DPI, max_bytes=None):
+    """
+    Return the key identifying the pie graph drawn with the given data
+    """
+    return make_key('pie', list(labels), list(values), _tab20c_data,
+                    PIE_FIGURE_DPI, fmt, dpi, max_bytes)
+
+
+def get_image(job):
+    """
+    Return the image bytes of a job (see pie_graph_job and bar_graph_job),
+    rendering it only on cache miss
+    """
+    key, render, args = job
+    return get_chart_cache().get_or_render(key, lambda: render(*args))
+
+
+def pie_graph_job(labels, values, fmt=None, dpi=None):
+    """
+    Return a (key, render function, args) tuple describing the pie graph,
+    used to render it in background (see graphs.background)
+    Format and dpi default to the CHART_FORMAT and CHART_DPI settings
+    """
+    labels, values = list(labels), list(values)
+    fmt = fmt or get_output_format()
+    dpi = dpi or get_output_dpi()
+    max_bytes = get_max_bytes('pie')
+    return (pie_graph_key(labels, values, fmt, dpi, max_bytes),
+            render_pie_graph, (labels, values, fmt, dpi, max_bytes))
+
+
 # Source:
 # https://matplotlib.org/3.1.1/faq/howto_faq.html#how-to-use-matplotlib-in-a-web-application-server
-def generatePieGraph(labels, values):
+def render_pie_graph(labels, values, fmt='png', dpi=SAVE_DPI, max_bytes=None):
     """
-    Create the pie graph data
-    Returns the data in base64
-    Return False in case of failure
+    Draw the pie graph and return it as bytes in the given format
     """
+    _setup_matplotlib()
+    from matplotlib.patches import Circle
 
     pie_slice_font_size = get_pie_slice_font_size(labels)
 
-    fig = Figure(dpi=310)
-    canvas = FigureCanvasAgg(fig)
-
     # Credits: https://stackoverflow.com/a/46693008/2535658
     def hide_less_2_perc_pies_labels(pct):
         return ('%1.1f%%' % pct) if pct > 2 else ''
 
-    ax1 = fig.add_subplot(111)
-    theme = _tab20c_data
+    # The figure comes with the theme colors already set
+    with pooled_figure('pie', _build_pie_figure, _reset_pie_figure) as fig:
+        ax1 = fig.axes[0]
 
-    ax1.set_prop_cycle("color", _tab20c_data)
+        # explode = (0.05,0.05,0.05,0.05)
+        explode = tuple([0.05] * len(values))
 
-    # explode = (0.05,0.05,0.05,0.05)
-    explode = tuple([0.05] * len(values))
+        patches, texts, _ = ax1.pie(
+          values, autopct=hide_less_2_perc_pies_labels, shadow=False,
+          startangle=90, explode=explode,
+          textprops={'fontsize': pie_slice_font_size})
 
-    patches, texts, _ = ax1.pie(values, autopct=hide_less_2_perc_pies_labels,
-                                shadow=False, startangle=90, explode=explode,
-                                textprops={'fontsize': pie_slice_font_size})
+        # Set aspect ratio to be equal so that pie is drawn as a circle.
+        ax1.axis('equal')
 
-    # Set aspect ratio to be equal so that pie is drawn as a circle.
-    ax1.axis('equal')
+        circle = Circle((0, 0), 0.80, facecolor='white')
+        ax1.add_artist(circle)
 
-    circle = Circle((0, 0), 0.80, facecolor='white')
-    ax1.add_artist(circle)
+        # Legend
+        legend_font_size = get_pie_legend_font_size(labels)
 
-    # Legend
-    legend_font_size = get_pie_legend_font_size(labels)
+        ax1.legend(patches, labels, loc="best", facecolor="white",
+                   framealpha=0.3, fontsize=legend_font_size)
+        fig.tight_layout()
 
-    ax1.legend(patches, labels, loc="best", facecolor="white", framealpha=0.3,
-               fontsize=legend_font_size)
-    fig.tight_layout()
+        return save_figure(fig, fmt, dpi, max_bytes)
 
-    buf = BytesIO()
-    fig.savefig(buf, format="png", bbox_inches="tight", dpi=230)
 
-    return base64.b64encode(buf.getbuffer()).decode("ascii")
+def bar_graph_key(x, y, goals, fmt='png', dpi=SAVE_DPI, max_bytes=None):
+    """
+    Return the key identifying the bar graph drawn with the given data
+    """
+    currency = os.getenv("CURRENCY")
+    goal_lines = [(goal.amount, goal.text) for goal in goals or []]
+    return make_key('bar', list(x), list(y), goal_lines, currency,
+                    BAR_BASE_COLOR, GOALS_COLORMAP, BAR_FIGURE_DPI, fmt, dpi,
+                    max_bytes)
 
 
-def generateBarGraph(x, y, goals):
+def bar_graph_job(x, y, goals, fmt=None, dpi=None):
     """
-    Create the bar graph data
-    Returns the data in base64
-    Return False in case of failure
+    Return a (key, render function, args) tuple describing the bar graph,
+    used to render it in background (see graphs.background)
+    Format and dpi default to the CHART_FORMAT and CHART_DPI settings
     """
+    goal_lines = [GoalLine(goal.amount, goal.text) for goal in goals or []]
+    x, y = list(x), list(y)
+    fmt = fmt or get_output_format()
+    dpi = dpi or get_output_dpi()
+    max_bytes = get_max_bytes('bar')
+    return (bar_graph_key(x, y, goal_lines, fmt, dpi, max_bytes),
+            render_bar_graph, (x, y, goal_lines, fmt, dpi, max_bytes))
+
+
+def render_bar_graph(x, y, goals, fmt='png', dpi=SAVE_DPI, max_bytes=None):
+    """
+    Draw the bar graph and return it as bytes in the given format
+    """
+    _setup_matplotlib()
+    from matplotlib import ticker
+    import matplotlib.patches as mpatches
+
     currency = os.getenv("CURRENCY")
-    # The blue color used in the examples on matplot docs
-    # https://github.com/matplotlib/matplotlib/blob/v3.1.2/lib/matplotlib/_color_data.py#L17
-    base_color = '#1f77b4'
-
-    # Create 1 figure
-    fig = Figure(dpi=111)
-    ax = fig.add_subplot(111)
-
-    ax.bar(x, y, width=10, color=base_color)
-    ax.xaxis_date()
-
-    # Set the figure title and the axis labels
-    ax.set(xlabel='Time (months)', ylabel=f'Amount ({currency})',
-           title='Monthly balances')
-    ax.grid(True, which='major')
-
-    # Turns the date labels by 90 degrees, so they do not overlap
-    x_ticket_labels = ax.get_xticklabels()
-    font_size = get_bar_ticket_font_size(x)
-    for l in x_ticket_labels:
-        l.set_rotation(90)
-        l.set_horizontalalignment('right')
-        l.set_fontsize(font_size)
-
-    # Force all dates labels to be displayed on the x axis
-    ax.set_xticks(x)
-
-    # Formats y axis to use comma every 3 digits
-    ax.get_yaxis().set_major_formatter(
-      ticker.FuncFormatter(lambda x, p: format(int(x), ',')))
-
-    # Draw goals if present
-    if goals:
-        cmap = get_cmap("Set1")
-        color_list = cmap.colors
-
-        legend_items = []
-        for idx in range(len(goals)):
-            goal = goals[idx]
-            colorVal = color_list[idx]
-            ax.axhline(y=goal.amount, xmin=0.0, xmax=1.0, color=colorVal)
-
-            # Set goal legend
-            patch = mpatches.Patch(color=colorVal, label=goal.text)
-            legend_items.append(patch)
-
-        goal_font_size = get_goal_font_size(goals)
-
-        ax.legend(handles=legend_items, loc="center left",
-                  fontsize=goal_font_size)
-
-    buf = BytesIO()
-    fig.savefig(buf, format="png", bbox_inches="tight", dpi=230)
-    # Embed the result in the html output.
-    return base64.b64encode(buf.getbuffer()).decode("ascii")
+
+    with pooled_figure('bar', _build_bar_figure, _reset_figure) as fig:
+        ax = fig.axes[0]
+
+        ax.bar(x, y, width=10, color=BAR_BASE_COLOR)
+        ax.xaxis_date()
+
+        # Set the figure title and the axis labels
+        ax.set(xlabel='Time (months)', ylabel=f'Amount ({currency})',
+               title='Monthly balances')
+        ax.grid(True, which='major')
+
+        # Turns the date labels by 90 degrees, so they do not overlap
+        x_ticket_labels = ax.get_xticklabels()
+        font_size = get_bar_ticket_font_size(x)
+        for l in x_ticket_labels:
+            l.set_rotation(90)
+            l.set_horizontalalignment('right')
+            l.set_fontsize(font_size)
+
+        # Force all dates labels to be displayed on the x axis
+        ax.set_xticks(x)
+
+        # Formats y axis to use comma every 3 digits
+        ax.get_yaxis().set_major_formatter(
+          ticker.FuncFormatter(lambda x, p: format(int(x), ',')))
+
+        # Draw goals if present
+        if goals:
+            color_list = get_goal_colors()
+
+            legend_items = []
+            for idx in range(len(goals)):
+                goal = goals[idx]
+                colorVal = color_list[idx]
+                ax.axhline(y=goal.amount, xmin=0.0, xmax=1.0, color=colorVal)
+
+                # Set goal legend
+                patch = mpatches.Patch(color=colorVal, label=goal.text)
+                legend_items.append(patch)
+
+            goal_font_size = get_goal_font_size(goals)
+
+            ax.legend(handles=legend_items, loc="center left",
+                      fontsize=goal_font_size)
+
+        return save_figure(fig, fmt, dpi, max_bytes)
@@ -0,0 +1,99 @@
+# Copyright: (c) 2020, Michele Valsecchi <https://github.com/MicheleV>
+# GNU General Public License v3.0+
+# (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+"""
+Pool of pre-built matplotlib figures
+
+Building a Figure, its canvas and axes costs about as much as drawing a small
+chart. Figures are instead kept in a pool (one per chart kind, per process),
+cleared and filled with new data on every render.
+
+A matplotlib figure must not be used by two threads at the same time: each
+figure is handed to one caller only, until it is released back to the pool.
+Figures whose render raised are discarded, as their state is unknown.
+
+The pool size is set via CHART_FIGURE_POOL_SIZE (0 disables pooling)
+"""
+from contextlib import contextmanager
+import os
+import threading
+
+
+DEFAULT_POOL_SIZE = 4
+
+
+class FigurePool():
+    """
+    Keep up to max_size figures created by build(fig) and restored to
+    their initial state by reset(fig) before being reused
+    """
+
+    def __init__(self, build, reset, max_size=DEFAULT_POOL_SIZE):
+        self.build = build
+        self.reset = reset
+        self.max_size = max_size
+        self._free = []
+        self._lock = threading.Lock()
+        self.created = 0
+        self.reused = 0
+
+    @contextmanager
+    def figure(self):
+        """Lend a figure, ready to be drawn on, for the duration of the block"""
+        with self._lock:
+            fig = self._free.pop() if self._free else None
+            if fig is None:
+                self.created += 1
+            else:
+                self.reused += 1
+
+        if fig is None:
+            fig = self.build()
+        else:
+            self.reset(fig)
+
+        yield fig
+
+        # Not reached if the block raised: the figure is simply dropped
+        with self._lock:
+            if len(self._free) < self.max_size:
+                self._free.append(fig)
+
+    def clear(self):
+        """Drop every idle figure"""
+        with self._lock:
+            self._free.clear()
+
+
+def get_pool_size():
+    """Return the number of figures to keep per chart kind"""
+    return int(os.getenv('CHART_FIGURE_POOL_SIZE', DEFAULT_POOL_SIZE))
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+@contextmanager
+def pooled_figure(kind, build, reset):
+    """
+    Lend a figure of the given kind ('pie' or 'bar') from the process wide
+    pool, or a new one when pooling is disabled
+    """
+    size = get_pool_size()
+    if size <= 0:
+        yield build()
+        return
+
+    with _pools_lock:
+        pool = _pools.get(kind)
+        if pool is None:
+            pool = _pools[kind] = FigurePool(build, reset, size)
+    with pool.figure() as fig:
+        yield fig
+
+
+def clear_pools():
+    """Drop every pooled figure (e.g. after changing matplotlib settings)"""
+    with _pools_lock:
+        _pools.clear()
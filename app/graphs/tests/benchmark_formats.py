@@ -0,0 +1,65 @@
+# Copyright: (c) 2020, Michele Valsecchi <https://github.com/MicheleV>
+# GNU General Public License v3.0+
+# (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+"""
+Report render time and payload size of each chart output format
+
+Not collected by `manage.py test` (the file name does not start with test),
+run it explicitly with:
+    python manage.py test graphs.tests.benchmark_formats
+"""
+import datetime
+import statistics
+import time
+
+from django.test import SimpleTestCase
+
+import graphs.plot as p
+from graphs.plot import GoalLine
+
+RUNS = 5
+
+PIE_LABELS = [f"category {i}" for i in range(15)]
+PIE_VALUES = [(i + 1) * 12345 for i in range(15)]
+BAR_DATES = [datetime.date(2018 + i // 12, i % 12 + 1, 1) for i in range(36)]
+BAR_VALUES = [1000000 + i * 25000 for i in range(36)]
+BAR_GOALS = [GoalLine(2000000, 'goal')]
+
+# (format, dpi, byte budget)
+VARIANTS = [
+    ('png', 230, None),
+    ('png', 150, None),
+    ('png', 100, None),
+    ('png', 72, None),
+    ('png', 230, 60000),
+    ('svg', 230, None),
+]
+
+
+class FormatsBenchmark(SimpleTestCase):
+    """Print render time and size of each format, for both charts."""
+
+    @staticmethod
+    def measure(render, *args):
+        """Return the median render time (ms) and the output size (KiB)"""
+        timings = []
+        for _ in range(RUNS):
+            start = time.perf_counter()
+            data = render(*args)
+            timings.append(time.perf_counter() - start)
+        return statistics.median(timings) * 1000, len(data) / 1024
+
+    def test_report(self):
+        # Load matplotlib before timing anything
+        p.render_pie_graph(PIE_LABELS, PIE_VALUES)
+
+        print(f"\n{'chart':<5} {'format':<6} {'dpi':>4} {'budget':>7}"
+              f" {'time (ms)':>10} {'size (KiB)':>11}")
+        for fmt, dpi, budget in VARIANTS:
+            pie = self.measure(p.render_pie_graph, PIE_LABELS, PIE_VALUES,
+                               fmt, dpi, budget)
+            bar = self.measure(p.render_bar_graph, BAR_DATES, BAR_VALUES,
+                               BAR_GOALS, fmt, dpi, budget)
+            for name, (elapsed, size) in (('pie', pie), ('bar', bar)):
+                print(f"{name:<5} {fmt:<6} {dpi:>4} {budget or '-':>7}"
+                      f" {elapsed:>10.1f} {size:>11.1f}")
@@ -0,0 +1,66 @@
+# Copyright: (c) 2020, Michele Valsecchi <https://github.com/MicheleV>
+# GNU General Public License v3.0+
+# (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+"""
+Compare the render time of each chart with and without the figure pool
+
+Not collected by `manage.py test` (the file name does not start with test),
+run it explicitly with:
+    python manage.py test graphs.tests.benchmark_pool
+"""
+import datetime
+import os
+import statistics
+import time
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+import graphs.plot as p
+from graphs.plot import GoalLine
+from graphs.pool import clear_pools
+
+RUNS = 10
+
+PIE_LABELS = [f"category {i}" for i in range(15)]
+PIE_VALUES = [(i + 1) * 12345 for i in range(15)]
+BAR_DATES = [datetime.date(2018 + i // 12, i % 12 + 1, 1) for i in range(36)]
+BAR_VALUES = [1000000 + i * 25000 for i in range(36)]
+BAR_GOALS = [GoalLine(2000000, 'goal')]
+
+
+class PoolBenchmark(SimpleTestCase):
+    """Print the median render time of each chart, pooled and not"""
+
+    @staticmethod
+    def measure(render, *args):
+        """Return the median render time in ms"""
+        timings = []
+        for _ in range(RUNS):
+            start = time.perf_counter()
+            render(*args)
+            timings.append(time.perf_counter() - start)
+        return statistics.median(timings) * 1000
+
+    def test_report(self):
+        clear_pools()
+        self.addCleanup(clear_pools)
+        charts = (
+          ('pie', p.render_pie_graph, (PIE_LABELS, PIE_VALUES)),
+          ('bar', p.render_bar_graph, (BAR_DATES, BAR_VALUES, BAR_GOALS)),
+        )
+        print(f"\n{'chart':<5} {'format':<6} {'new (ms)':>9}"
+              f" {'pooled (ms)':>12} {'saved':>6}")
+        for fmt, dpi in (('png', 230), ('png', 72), ('svg', 230)):
+            for name, render, args in charts:
+                args = (*args, fmt, dpi)
+                with mock.patch.dict(os.environ,
+                                     {'CHART_FIGURE_POOL_SIZE': '0'}):
+                    # Load matplotlib before timing anything
+                    render(*args)
+                    new = self.measure(render, *args)
+                with mock.patch.dict(os.environ,
+                                     {'CHART_FIGURE_POOL_SIZE': '1'}):
+                    pooled = self.measure(render, *args)
+                print(f"{name:<5} {fmt:<6} {new:>9.1f} {pooled:>12.1f}"
+                      f" {(new - pooled) / new:>6.0%}")
@@ -0,0 +1,87 @@
+# Copyright: (c) 2020, Michele Valsecchi <https://github.com/MicheleV>
+# GNU General Public License v3.0+
+# (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+from concurrent.futures import Future
+
+from django.test import SimpleTestCase
+
+from graphs.background import BackgroundRenderer
+from graphs.cache import ChartCache
+from graphs.cache import LocMemChartCache
+
+
+class ManualExecutor():
+    """
+    Executor running jobs when run_all() is called, or right away if auto
+    """
+
+    def __init__(self, auto=False):
+        self.auto = auto
+        self.jobs = []
+
+    def submit(self, func, *args):
+        future = Future()
+        if self.auto:
+            future.set_result(func(*args))
+        else:
+            self.jobs.append((future, func, args))
+        return future
+
+    def run_all(self):
+        jobs, self.jobs = self.jobs, []
+        for future, func, args in jobs:
+            future.set_result(func(*args))
+
+
+def render(value):
+    return value.encode('ascii')
+
+
+class TestBackgroundRenderer(SimpleTestCase):
+    """Unit tests for the background chart renderer."""
+
+    def setUp(self):  # pylint: disable=C0103; # noqa
+        self.cache = ChartCache(LocMemChartCache())
+        self.executor = ManualExecutor()
+        self.renderer = BackgroundRenderer(self.cache, self.executor)
+
+    def test_waits_when_there_is_nothing_to_show(self):
+        self.executor.auto = True
+        png, stale = self.renderer.get('slot', ('key_1', render, ('v1',)))
+        self.assertEqual(png, b'v1')
+        self.assertFalse(stale)
+        self.assertEqual(self.cache.stats()['misses'], 1)
+
+    def test_serves_previous_image_while_rendering(self):
+        self.executor.auto = True
+        self.renderer.get('slot', ('key_1', render, ('v1',)))
+
+        # Data changed: the new image is queued, the old one is served
+        self.executor.auto = False
+        png, stale = self.renderer.get('slot', ('key_2', render, ('v2',)))
+        self.assertEqual(png, b'v1')
+        self.assertTrue(stale)
+
+        self.executor.run_all()
+        png, stale = self.renderer.get('slot', ('key_2', render, ('v2',)))
+        self.assertEqual(png, b'v2')
+        self.assertFalse(stale)
+        self.assertEqual(self.renderer.latest_key('slot'), 'key_2')
+        self.assertEqual(self.cache.stats()['stale_hits'], 1)
+        self.assertEqual(self.cache.stats()['hits'], 1)
+
+    def test_enqueue_skips_pending_and_cached_images(self):
+        job = ('key_1', render, ('v1',))
+        first = self.renderer.enqueue('slot', job)
+        self.assertIs(self.renderer.enqueue('slot', job), first)
+        self.assertEqual(len(self.executor.jobs), 1)
+
+        self.executor.run_all()
+        self.assertIsNone(self.renderer.enqueue('slot', job))
+
+    def test_slots_are_independent(self):
+        self.executor.auto = True
+        self.renderer.get('slot_1', ('key_1', render, ('v1',)))
+        self.renderer.get('slot_2', ('key_2', render, ('v2',)))
+        self.assertEqual(self.renderer.latest_key('slot_1'), 'key_1')
+        self.assertEqual(self.renderer.latest_key('slot_2'), 'key_2')
@@ -0,0 +1,95 @@
+# Copyright: (c) 2020, Michele Valsecchi <https://github.com/MicheleV>
+# GNU General Public License v3.0+
+# (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+import datetime
+import tempfile
+from unittest import mock
+
+from django.test import TestCase
+
+import graphs.cache as c
+import graphs.plot as p
+
+
+class TestChartCache(TestCase):
+    """Unit tests for the rendered chart cache."""
+
+    def test_key_depends_on_every_input(self):
+        """Same inputs give the same key, any change gives a new one"""
+        key = c.make_key('pie', ['a', 'b'], [1, 2], 230)
+        self.assertEqual(key, c.make_key('pie', ['a', 'b'], [1, 2], 230))
+        self.assertNotEqual(key, c.make_key('bar', ['a', 'b'], [1, 2], 230))
+        self.assertNotEqual(key, c.make_key('pie', ['a', 'c'], [1, 2], 230))
+        self.assertNotEqual(key, c.make_key('pie', ['a', 'b'], [1, 3], 230))
+        self.assertNotEqual(key, c.make_key('pie', ['a', 'b'], [1, 2], 111))
+
+    def test_key_accepts_dates(self):
+        """Bar graphs use dates on the x axis"""
+        date = datetime.date(2020, 1, 1)
+        self.assertEqual(c.make_key('bar', [date]), c.make_key('bar', [date]))
+
+    def test_locmem_evicts_least_recently_used(self):
+        backend = c.LocMemChartCache(max_entries=2)
+        backend.set('a', b'1')
+        backend.set('b', b'2')
+        # Touch 'a', so that 'b' is the oldest entry
+        self.assertEqual(backend.get('a'), b'1')
+        backend.set('c', b'3')
+        self.assertIsNone(backend.get('b'))
+        self.assertEqual(backend.get('a'), b'1')
+        self.assertEqual(backend.get('c'), b'3')
+
+    def test_file_backend_evicts_oldest_files(self):
+        with tempfile.TemporaryDirectory() as directory:
+            backend = c.FileChartCache(directory, max_entries=2)
+            backend.set('a', b'1')
+            backend.set('b', b'2')
+            backend.set('c', b'3')
+            self.assertEqual(backend.get('c'), b'3')
+            self.assertEqual(
+                len([k for k in 'abc' if backend.get(k) is not None]), 2)
+            self.assertIsNone(backend.get('missing'))
+
+    def test_django_backend(self):
+        backend = c.DjangoChartCache()
+        self.assertIsNone(backend.get('a'))
+        backend.set('a', b'1')
+        self.assertEqual(backend.get('a'), b'1')
+
+    def test_hit_and_miss_counters(self):
+        cache = c.ChartCache(c.LocMemChartCache())
+        render = mock.Mock(return_value=b'png')
+
+        self.assertEqual(cache.get_or_render('key', render), b'png')
+        self.assertEqual(cache.get_or_render('key', render), b'png')
+
+        render.assert_called_once()
+        stats = cache.stats()
+        self.assertEqual(stats['hits'], 1)
+        self.assertEqual(stats['misses'], 1)
+
+    def test_disabled_cache_always_renders(self):
+        cache = c.ChartCache(None)
+        render = mock.Mock(return_value=b'png')
+        cache.get_or_render('key', render)
+        cache.get_or_render('key', render)
+        self.assertEqual(render.call_count, 2)
+        self.assertEqual(cache.stats()['misses'], 2)
+
+    def test_unknown_backend_is_rejected(self):
+        with self.assertRaises(ValueError):
+            c.create_backend('memcached')
+
+    def test_graphs_are_rendered_once(self):
+        """Rendering the same data twice hits the cache"""
+        cache = c.ChartCache(c.LocMemChartCache())
+        dates = [datetime.date(2020, 1, 1), datetime.date(2020, 2, 1)]
+        with mock.patch('graphs.plot.get_chart_cache', return_value=cache):
+            for job in (lambda: p.pie_graph_job(['a', 'b'], [10, 20], 'png'),
+                        lambda: p.bar_graph_job(dates, [10, 20], [], 'png')):
+                first = p.get_image(job())
+                second = p.get_image(job())
+                self.assertEqual(first, second)
+                self.assertTrue(first.startswith(b'\x89PNG'))
+        self.assertEqual(cache.stats()['misses'], 2)
+        self.assertEqual(cache.stats()['hits'], 2)
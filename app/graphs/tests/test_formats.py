@@ -0,0 +1,49 @@
+# Copyright: (c) 2020, Michele Valsecchi <https://github.com/MicheleV>
+# GNU General Public License v3.0+
+# (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+import os
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+import graphs.plot as p
+
+
+LABELS = [f"category {i}" for i in range(12)]
+VALUES = [(i + 1) * 1000 for i in range(12)]
+
+
+class TestOutputFormats(SimpleTestCase):
+    """Unit tests for the chart output formats and byte budgets."""
+
+    def test_svg_output(self):
+        svg = p.render_pie_graph(LABELS, VALUES, fmt='svg')
+        self.assertIn(b'<svg', svg)
+
+    def test_png_respects_byte_budget(self):
+        png = p.render_pie_graph(LABELS, VALUES, fmt='png', dpi=230)
+        budget = len(png) // 3
+        smaller = p.render_pie_graph(LABELS, VALUES, fmt='png', dpi=230,
+                                     max_bytes=budget)
+        self.assertTrue(smaller.startswith(b'\x89PNG'))
+        self.assertLessEqual(len(smaller), budget)
+
+    def test_key_depends_on_format_and_dpi(self):
+        png = p.pie_graph_job(LABELS, VALUES, fmt='png', dpi=100)[0]
+        self.assertNotEqual(png, p.pie_graph_job(LABELS, VALUES, fmt='svg',
+                                                 dpi=100)[0])
+        self.assertNotEqual(png, p.pie_graph_job(LABELS, VALUES, fmt='png',
+                                                 dpi=200)[0])
+
+    def test_settings_from_env(self):
+        env = {'CHART_FORMAT': 'svg', 'CHART_DPI': '100',
+               'CHART_PIE_MAX_BYTES': '5000'}
+        with mock.patch.dict(os.environ, env):
+            self.assertEqual(p.get_output_format(), 'svg')
+            self.assertEqual(p.get_output_dpi(), 100)
+            self.assertEqual(p.get_max_bytes('pie'), 5000)
+            self.assertIsNone(p.get_max_bytes('bar'))
+
+        with mock.patch.dict(os.environ, {'CHART_FORMAT': 'gif'}):
+            with self.assertRaises(ValueError):
+                p.get_output_format()
@@ -0,0 +1,29 @@
+# Copyright: (c) 2020, Michele Valsecchi <https://github.com/MicheleV>
+# GNU General Public License v3.0+
+# (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+import subprocess
+import sys
+
+from django.conf import settings
+from django.test import SimpleTestCase
+
+
+class TestLazyImports(SimpleTestCase):
+    """Make sure the plotting stack is loaded on first render only."""
+
+    def test_views_do_not_import_matplotlib(self):
+        """
+        Importing the views (i.e. starting a worker) must not load matplotlib
+        Run in a new interpreter, as the test runner may already have loaded it
+        """
+        code = (
+            "import sys, django;"
+            "django.setup();"
+            "import budgets.views, api.views;"
+            "print([m for m in ('matplotlib', 'numpy', 'pandas')"
+            " if m in sys.modules])"
+        )
+        result = subprocess.run([sys.executable, '-c', code],
+                                cwd=settings.BASE_DIR, check=True,
+                                stdout=subprocess.PIPE)
+        self.assertEqual(result.stdout.decode().strip(), '[]')
@@ -0,0 +1,97 @@
+# Copyright: (c) 2020, Michele Valsecchi <https://github.com/MicheleV>
+# GNU General Public License v3.0+
+# (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+import datetime
+import os
+import threading
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+import graphs.plot as p
+from graphs.plot import GoalLine
+from graphs.pool import FigurePool
+from graphs.pool import clear_pools
+
+
+class TestFigurePool(SimpleTestCase):
+    """Unit tests for the figure pool"""
+
+    def setUp(self):
+        self.resets = []
+        self.pool = FigurePool(object, self.resets.append, max_size=2)
+
+    def test_reuse(self):
+        with self.pool.figure() as first:
+            pass
+        with self.pool.figure() as second:
+            pass
+        self.assertIs(first, second)
+        self.assertEqual(self.resets, [first])
+        self.assertEqual((self.pool.created, self.pool.reused), (1, 1))
+
+    def test_concurrent_users_get_different_figures(self):
+        with self.pool.figure() as first:
+            with self.pool.figure() as second:
+                self.assertIsNot(first, second)
+        self.assertEqual(self.resets, [])
+
+    def test_max_size(self):
+        with self.pool.figure(), self.pool.figure(), self.pool.figure():
+            pass
+        self.assertEqual(len(self.pool._free), 2)
+
+    def test_discard_on_error(self):
+        with self.assertRaises(ZeroDivisionError):
+            with self.pool.figure():
+                1 / 0
+        self.assertEqual(self.pool._free, [])
+
+    def test_threads(self):
+        in_use = set()
+        lock = threading.Lock()
+        errors = []
+
+        def worker():
+            for _ in range(200):
+                with self.pool.figure() as fig:
+                    with lock:
+                        if id(fig) in in_use:
+                            errors.append(fig)
+                        in_use.add(id(fig))
+                    with lock:
+                        in_use.discard(id(fig))
+
+        threads = [threading.Thread(target=worker) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+
+
+class TestPooledRendering(SimpleTestCase):
+    """Pooled figures must draw exactly what a new figure would"""
+
+    def setUp(self):
+        clear_pools()
+        self.addCleanup(clear_pools)
+
+    @staticmethod
+    def render_all():
+        dates = [datetime.date(2019, m, 1) for m in range(1, 13)]
+        return [
+          p.render_pie_graph(['a', 'b', 'c'], [1, 2, 3]),
+          p.render_pie_graph([f"c{i}" for i in range(18)], list(range(1, 19))),
+          p.render_bar_graph(dates, [i * 1000 for i in range(12)],
+                             [GoalLine(5000, 'goal'), GoalLine(9000, 'x')]),
+          p.render_bar_graph(dates[:5], [5, 4, 3, 2, 1], []),
+        ]
+
+    def test_same_output(self):
+        with mock.patch.dict(os.environ, {'CHART_FIGURE_POOL_SIZE': '0'}):
+            expected = self.render_all()
+        with mock.patch.dict(os.environ, {'CHART_FIGURE_POOL_SIZE': '1'}):
+            # Twice, so that every figure is reused at least once
+            self.assertEqual(self.render_all(), expected)
+            self.assertEqual(self.render_all(), expected)
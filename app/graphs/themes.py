@@ -1,8 +1,6 @@
 # BSD License: https://matplotlib.org/3.2.1/users/license.html
 # Docs at https://matplotlib.org/3.1.0/tutorials/colors/colormaps.html
 
-from matplotlib import cycler
-
 # From:
 # https://github.com/matplotlib/matplotlib/blob/master/lib/matplotlib/_cm.py
 _tab20c_data = ['#3182bd', '#6baed6', '#9ecae1', '#c6dbef', '#e6550d',
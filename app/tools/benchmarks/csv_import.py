@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+# Copyright: (c) 2020, Michele Valsecchi <https://github.com/MicheleV>
+# GNU General Public License v3.0+
+# (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+"""
+Measure the rows/second tools/csv_parser imports a generated CSV file at,
+inserting and committing rows one by one, and in batches of increasing size.
+
+Each run imports the same file into a new temporary SQLite DB, created from
+the csv_parser models.
+
+Usage (from the app folder):
+    python tools/benchmarks/csv_import.py [--rows 100000] [--batch-sizes 1000]
+"""
+import argparse
+import csv
+import datetime
+import os
+import sys
+import tempfile
+import time
+
+CSV_PARSER_DIR = os.path.join(os.path.dirname(os.path.dirname(
+                 os.path.abspath(__file__))), 'csv_parser')
+sys.path.insert(0, CSV_PARSER_DIR)
+
+from sqlalchemy import create_engine  # pylint: disable=C0413; # noqa
+
+import csv_parser  # pylint: disable=C0413; # noqa
+from models import Base  # pylint: disable=C0413; # noqa
+
+EXPENSE_CATEGORIES = ('Rent', 'Food', 'Water', 'Electricity', 'Leisure')
+INCOME_CATEGORIES = ('Paycheck', 'Freelance income', 'Other')
+# One row out of INCOME_EVERY also has an income
+INCOME_EVERY = 10
+
+
+def write_csv(path, rows):
+    """Write a csv file with rows expenses, in the sample.csv format"""
+    start = datetime.date(2010, 1, 1)
+    with open(path, 'w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(['', 'Date', 'Amount', 'Description', 'Category',
+                         '', 'Date', 'Amount', 'Description', 'Category'])
+        for i in range(rows):
+            date = (start + datetime.timedelta(days=i // 30)).strftime(
+                   '%Y/%m/%d')
+            row = ['', date, f'€{i % 5000 + 1:,}', f'expense {i}',
+                   EXPENSE_CATEGORIES[i % len(EXPENSE_CATEGORIES)],
+                   '', '', '', '', '']
+            if i % INCOME_EVERY == 0:
+                row[6:] = [date, f'€{i % 100000 + 1:,}', f'income {i}',
+                           INCOME_CATEGORIES[i % len(INCOME_CATEGORIES)]]
+            writer.writerow(row)
+
+
+def measure(csv_file, db_path, batch_size):
+    """Import csv_file into a new DB, return the rows/second"""
+    db_url = f'sqlite:///{db_path}'
+    Base.metadata.create_all(create_engine(db_url))
+    utils = csv_parser.Utils(db_url=db_url, batch_size=batch_size)
+    start = time.perf_counter()
+    expenses, income = utils.importFile(csv_file)
+    elapsed = time.perf_counter() - start
+    utils.session.close()
+    return (expenses + income) / elapsed, expenses + income
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--batch-sizes', type=int, nargs='+',
+                        default=[100, 1000, 10000])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_file = os.path.join(tmp, 'expenses.csv')
+        write_csv(csv_file, args.rows)
+        for batch_size in [0] + args.batch_sizes:
+            db_path = os.path.join(tmp, f'db-{batch_size}.sqlite3')
+            rate, imported = measure(csv_file, db_path, batch_size)
+            name = f'batch {batch_size}' if batch_size else 'one by one'
+            print(f"{name:<12} {rate:10.0f} rows/s  ({imported} rows)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,173 @@
+#!/usr/bin/env python
+# Copyright: (c) 2020, Michele Valsecchi <https://github.com/MicheleV>
+# GNU General Public License v3.0+
+# (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+"""
+Measure the requests/second the expense list page is served at, with Django
+defaults (no shared cache, DB sessions, a new DB connection per request) and
+with the cache, cached sessions and persistent connections settings.
+
+Each configuration runs in its own server process (gunicorn if installed,
+else a single wsgiref process) against the same DB, which is a temporary
+SQLite file unless DATABASE and the SQL_* variables point to another one.
+
+Usage (from the app folder):
+    python tools/benchmarks/expense_list_rps.py [--seconds 10] [--clients 4]
+"""
+import argparse
+import concurrent.futures
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.dirname(
+          os.path.abspath(__file__))))
+
+CONFIGS = {
+    'defaults': {
+        'CACHE_BACKEND': 'locmem',
+        'SESSION_ENGINE': 'django.contrib.sessions.backends.db',
+        'DB_CONN_MAX_AGE': '0',
+    },
+    'cached': {
+        'CACHE_BACKEND': 'file',
+        'SESSION_ENGINE': 'django.contrib.sessions.backends.cached_db',
+        'DB_CONN_MAX_AGE': '60',
+    },
+}
+
+SETUP = """
+import datetime, os, sys, django
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'budgeteer.settings')
+django.setup()
+from django.contrib.auth.models import User
+from django.test import Client
+import budgets.models as m
+user = User.objects.create_user(username='benchmark', password='benchmark')
+category = m.Category.objects.create(text='Rent', created_by=user)
+today = datetime.date.today()
+m.Expense.objects.bulk_create([
+  m.Expense(category=category, amount=100 + i, note=f'expense {i}',
+            date=today.replace(day=1 + i % 28), created_by=user)
+  for i in range(int(sys.argv[1]))])
+client = Client()
+client.force_login(user)
+print(client.cookies['sessionid'].value)
+"""
+
+# Serves one request at a time, as a gunicorn sync worker does: DB connections
+# belong to the thread which opened them, so a new thread per request would
+# never reuse them
+WSGIREF = """
+import os, sys
+from wsgiref.simple_server import make_server, WSGIRequestHandler
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'budgeteer.settings')
+from budgeteer.wsgi import application
+
+class Handler(WSGIRequestHandler):
+    def log_message(self, *args):
+        pass
+
+make_server('127.0.0.1', int(sys.argv[1]), application,
+            handler_class=Handler).serve_forever()
+"""
+
+
+def free_port():
+    """Return a TCP port nobody is listening on"""
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server(env, port, workers):
+    """Start serving the app on port, return the server process"""
+    try:
+        import gunicorn  # pylint: disable=W0611,C0415; # noqa
+        cmd = [sys.executable, '-m', 'gunicorn', 'budgeteer.wsgi:application',
+               '--bind', f'127.0.0.1:{port}', '--workers', str(workers)]
+    except ImportError:
+        cmd = [sys.executable, '-c', WSGIREF, str(port)]
+    server = subprocess.Popen(cmd, cwd=APP_DIR, env=env,
+                              stdout=subprocess.DEVNULL,
+                              stderr=subprocess.DEVNULL)
+    for _ in range(100):
+        try:
+            socket.create_connection(('127.0.0.1', port), 0.1).close()
+            return server
+        except OSError:
+            time.sleep(0.1)
+    server.kill()
+    raise RuntimeError('The server did not start')
+
+
+def fetch(url, session, deadline):
+    """Request url until deadline, return the number of pages served"""
+    served = 0
+    request = urllib.request.Request(
+              url, headers={'Cookie': f'sessionid={session}'})
+    while time.perf_counter() < deadline:
+        with urllib.request.urlopen(request) as response:
+            response.read()
+            served += response.status == 200
+    return served
+
+
+def measure(url, session, seconds, clients):
+    """Return the requests/second served by clients concurrent clients"""
+    fetch(url, session, time.perf_counter() + 1)  # Warm up
+    deadline = time.perf_counter() + seconds
+    with concurrent.futures.ThreadPoolExecutor(clients) as executor:
+        futures = [executor.submit(fetch, url, session, deadline)
+                   for _ in range(clients)]
+        served = sum(future.result() for future in futures)
+    return served / seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--seconds', type=int, default=10)
+    parser.add_argument('--clients', type=int, default=4)
+    parser.add_argument('--workers', type=int, default=2,
+                        help='gunicorn workers')
+    parser.add_argument('--expenses', type=int, default=200)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ, DJANGO_DEBUG_MODE='n', SITENAME='127.0.0.1',
+                   CACHE_LOCATION=os.path.join(tmp, 'cache'),
+                   DASHBOARD_CACHE_TIMEOUT='0', CHART_RENDER_WORKERS='0')
+        env.setdefault('DJANGO_SECRET_KEY', 'benchmark')
+        env.setdefault('CURRENCY', 'EUR')
+        env.setdefault('EXCHANGE_RATE', '118')
+        if not env.get('DATABASE'):
+            env.update(DATABASE='sqlite',
+                       SQL_ENGINE='django.db.backends.sqlite3',
+                       SQL_DATABASE=os.path.join(tmp, 'db.sqlite3'))
+
+        subprocess.run([sys.executable, 'manage.py', 'migrate'], cwd=APP_DIR,
+                       env=env, check=True, stdout=subprocess.DEVNULL)
+        session = subprocess.run(
+                  [sys.executable, '-c', SETUP, str(args.expenses)],
+                  cwd=APP_DIR, env=env, check=True,
+                  stdout=subprocess.PIPE).stdout.decode().split()[-1]
+
+        for name, config in CONFIGS.items():
+            port = free_port()
+            server = start_server(dict(env, **config), port, args.workers)
+            try:
+                rps = measure(f'http://127.0.0.1:{port}/expenses', session,
+                              args.seconds, args.clients)
+            finally:
+                server.terminate()
+                server.wait()
+            print(f"{name:<10} {rps:8.1f} req/s  ({args.clients} clients,"
+                  f" {args.seconds} s)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+# Copyright: (c) 2020, Michele Valsecchi <https://github.com/MicheleV>
+# GNU General Public License v3.0+
+# (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+"""
+Measure the wall time of a fresh process importing budgets.views, and of
+`manage.py check`, which is what every gunicorn worker, management command
+and test run pays before doing any work.
+
+Usage (from the app folder):
+    python tools/benchmarks/startup_time.py [--runs 10]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.dirname(
+          os.path.abspath(__file__))))
+
+IMPORT_VIEWS = (
+    "import os, sys, django;"
+    "os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'budgeteer.settings');"
+    "django.setup();"
+    "import budgets.views;"
+    "heavy = [m for m in ('matplotlib', 'numpy', 'pandas') if m in sys.modules];"
+    "print(','.join(heavy))"
+)
+
+COMMANDS = {
+    'import budgets.views': [sys.executable, '-c', IMPORT_VIEWS],
+    'manage.py check': [sys.executable, 'manage.py', 'check'],
+}
+
+
+def measure(cmd, runs):
+    """Return the wall times of running cmd runs times, and its last output"""
+    timings = []
+    output = ''
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = subprocess.run(cmd, cwd=APP_DIR, check=True,
+                                stdout=subprocess.PIPE,
+                                stderr=subprocess.DEVNULL)
+        timings.append(time.perf_counter() - start)
+        output = result.stdout.decode().strip()
+    return timings, output
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--runs', type=int, default=10)
+    args = parser.parse_args()
+
+    for name, cmd in COMMANDS.items():
+        timings, output = measure(cmd, args.runs)
+        print(f"{name:<22} median {statistics.median(timings) * 1000:7.1f} ms"
+              f"  min {min(timings) * 1000:7.1f} ms  ({args.runs} runs)")
+        if name == 'import budgets.views':
+            print(f"{'':<22} plotting modules loaded: {output or 'none'}")
+
+
+if __name__ == '__main__':
+    main()
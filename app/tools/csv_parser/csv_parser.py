@@ -2,10 +2,17 @@
 # -*- coding: utf-8 -*-
 #
 # Only imports and save expense categories and expenses for now
+# NOTE: superseded by `python manage.py import_csv`, which shares the app models
+#       and works with any configured DB
 # NOTE: This tool is not unit tested
 # Refer to the sample.csv to follow the code: the format is quite unusual!
 #
+# By default every row is inserted and committed on its own: with
+# --batch-size N, rows are inserted N at a time, and the whole file is
+# imported in a single transaction (nothing is saved if anything fails)
+#
 
+import argparse
 import csv
 from datetime import datetime
 import sys
@@ -20,20 +27,13 @@ from models import Income
 from models import IncomeCategory
 
 
-class Usage(Exception):
-    """
-    Dummy exception
-    """
-    pass
-
-
 class Utils():
     """
     Parse, sanitize data and handle the database interactions
     """
 
-    def __init__(self):
-        engine = create_engine('sqlite:///../../db.sqlite3')
+    def __init__(self, db_url='sqlite:///../../db.sqlite3', batch_size=0):
+        engine = create_engine(db_url)
         Base.metadata.bind = engine
         DBSession = sessionmaker(bind=engine)
         session = DBSession()
@@ -44,6 +44,9 @@ class Utils():
         self.INCOME = 'INCOME'
 
         self.session = session
+        # Rows waiting to be inserted, when importing in batches
+        self.batch_size = batch_size
+        self.pending = {Expense: [], Income: []}
         self.cats = self.selectCategories()
         self.inc_cats = self.selectIncomeCategories()
         # Handle the case in which the first entry date is malformed
@@ -130,25 +133,55 @@ class Utils():
             res[c['text']] = c['id']
         return res
 
+    def save(self):
+        """
+        Write the added entries to the db
+        Commit them too, unless importing in batches
+        """
+        self.session.flush()
+        if not self.batch_size:
+            self.session.commit()
+
+    def addPending(self, model, amount, note, date, cat):
+        """
+        Queue an Expense or Income entry, and insert the queued ones
+        once they are batch_size
+        """
+        entry = {'amount': amount, 'note': note, 'date': date,
+                 'category_id': cat}
+        self.pending[model].append(entry)
+        if len(self.pending[model]) >= self.batch_size:
+            self.insertPending()
+        return entry
+
+    def insertPending(self):
+        """
+        Insert all the queued entries, with one INSERT statement per model
+        """
+        for model, entries in self.pending.items():
+            if entries:
+                self.session.bulk_insert_mappings(model, entries)
+                entries.clear()
+
     def createCategory(self, text):
         """
         Insert a Category entry into the db
         """
         new_category = Category(text=text.capitalize())
         self.session.add(new_category)
-        self.session.flush()
-        self.session.commit()
+        self.save()
         return new_category
 
     def createExpense(self, amount, note, date, cat):
         """
         Insert an Expense entry into the db
         """
+        if self.batch_size:
+            return self.addPending(Expense, amount, note, date, cat)
         expense = Expense(amount=amount, note=note, date=date,
                           category_id=cat)
         self.session.add(expense)
-        self.session.flush()
-        self.session.commit()
+        self.save()
         return expense
 
     def createIncomeCategory(self, text):
@@ -157,19 +190,19 @@ class Utils():
         """
         new_inc_category = IncomeCategory(text=text.capitalize())
         self.session.add(new_inc_category)
-        self.session.flush()
-        self.session.commit()
+        self.save()
         return new_inc_category
 
     def CreateIncome(self, amount, note, date, cat):
         """
         Insert an Income entry into the db
         """
+        if self.batch_size:
+            return self.addPending(Income, amount, note, date, cat)
         income = Income(amount=amount, note=note, date=date,
                         category_id=cat)
         self.session.add(income)
-        self.session.flush()
-        self.session.commit()
+        self.save()
         return income
 
     def getOrCreateCategory(self, name, category_type):
@@ -260,34 +293,51 @@ class Utils():
         safe_date = data[3]
         return createFunc(sanitized_price, note, safe_date, cat_id)
 
+    def importFile(self, csv_file):
+        """
+        Import the Expense and Income entries of a csv file
+        When importing in batches, either all of them are saved or none is
+        Return the number of created (expenses, income) entries
+        """
+        expenses = 0
+        income = 0
+        try:
+            with open(csv_file) as file:
+                csv_reader = csv.reader(file, delimiter=',')
+                for row in csv_reader:
+                    expense_data = self.readExpenseData(row)
+                    if expense_data:
+                        res = self.prepareCreateEntry(expense_data,
+                                                      self.EXPENSE)
+                        if res:
+                            expenses += 1
+
+                    income_data = self.readIncomeData(row)
+                    if income_data:
+                        res = self.prepareCreateEntry(income_data,
+                                                      self.INCOME)
+                        if res:
+                            income += 1
+            self.insertPending()
+            self.session.commit()
+        except Exception:
+            self.session.rollback()
+            raise
+        return expenses, income
 
-def main(argv):
-    utils = Utils()
-    try:
-        if len(argv) != 2:
-            raise Usage
-    except Usage:
-        print("Usage: csv_parser.py <csv-file-path>", file=sys.stderr)
-        return 1
-
-    csv_file = argv[1]
-    expenses = 0
-    income = 0
-    with open(csv_file) as file:
-        csv_reader = csv.reader(file, delimiter=',')
-        for row in csv_reader:
-            expense_data = utils.readExpenseData(row)
-            if expense_data:
-                res = utils.prepareCreateEntry(expense_data, utils.EXPENSE)
-                if res:
-                    expenses += 1
-
-            income_data = utils.readIncomeData(row)
-            if income_data:
-                res = utils.prepareCreateEntry(income_data, utils.INCOME)
-                if res:
-                    income += 1
 
+def main(argv):
+    parser = argparse.ArgumentParser(prog='csv_parser.py')
+    parser.add_argument('csv_file', metavar='csv-file-path')
+    parser.add_argument('--batch-size', type=int, default=0,
+                        help='insert rows N at a time, in one transaction'
+                             ' (default: insert and commit them one by one)')
+    args = parser.parse_args(argv[1:])
+    if args.batch_size < 0:
+        parser.error('--batch-size must not be negative')
+
+    utils = Utils(batch_size=args.batch_size)
+    expenses, income = utils.importFile(args.csv_file)
     print(f"Created {expenses} expenses and {income} income entries")
 
 
@@ -1,13 +1,33 @@
-import { Category, Expense, MonthlyBalanceCategory, MonthlyBalance } from "../common/interfaces"
+import { Category, ChartSeries, Expense, ExpensePage, MonthlyBalanceCategory, MonthlyBalance } from "../common/interfaces"
 
-export function getExpensesByCategoryId(category_id:number, start:string, end:string): Promise<Expense[]> {
+export function getExpensesPage(category_id:number, start:string, end:string, cursor?:string): Promise<ExpensePage> {
   // TODO: validate parameters!
-  return fetch(`/api/expenses?category_id=${category_id}&format=json&huge_page=yes&start=${start}&end=${end}`)
+  let url = `/api/expenses?category_id=${category_id}&format=json&start=${start}&end=${end}`
+  if (cursor) {
+    url += `&cursor=${encodeURIComponent(cursor)}`
+  }
+  return fetch(url)
     .then(function(response) {
       return response.json();
   })
 }
 
+// Follow the pages cursors until the last one: onPage receives the expenses
+// fetched so far after each page, so that they can be shown incrementally
+export async function getExpensesByCategoryId(category_id:number, start:string, end:string, onPage?: (expenses: Expense[]) => void): Promise<Expense[]> {
+  let expenses: Expense[] = []
+  let cursor: string | null = null
+  do {
+    const page: ExpensePage = await getExpensesPage(category_id, start, end, cursor || undefined)
+    expenses = expenses.concat(page.results)
+    if (onPage) {
+      onPage(expenses)
+    }
+    cursor = page.next
+  } while (cursor)
+  return expenses
+}
+
 export function getCategories(): Promise<Category[]> {
   return fetch('/api/categories')
     .then(function(response) {
@@ -34,3 +54,10 @@ export function getMonthlyBalances(date?:string): Promise<MonthlyBalance[]> {
       return response.json();
   })
 }
+
+export function getChartSeries(url:string): Promise<ChartSeries> {
+  return fetch(url)
+    .then(function(response) {
+      return response.json();
+  })
+}
@@ -10,6 +10,11 @@ export interface Expense {
   date: string;
 }
 
+export interface ExpensePage {
+  results: Array<Expense>;
+  next: string | null;
+}
+
 export interface Category {
   id: number;
   text: string;
@@ -52,4 +57,24 @@ export type PulldownProps = {
 
 export type ReducedTableProps = {
   data: Array<ExpenseAggregate>
-}
\ No newline at end of file
+}
+
+export interface ChartGoal {
+  text: string;
+  amount: number;
+}
+
+export interface ChartSeries {
+  labels: Array<string>;
+  values: Array<number>;
+  goals?: Array<ChartGoal>;
+}
+
+export type ChartProps = {
+  data: ChartSeries
+}
+
+export type ClientChartProps = {
+  type: string;
+  url: string;
+}
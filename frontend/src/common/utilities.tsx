@@ -23,4 +23,13 @@ export const isCorrectFormatDate = (date: string): Boolean => {
   // Only accepts dates between 1000 and 2999: edit this regex if using historical data, of if you are in year 3000+
   const date_regex = /^(1|2)\d{3}-(0[1-9]|1[0-2])-01$/g;
   return date_regex.test(date)
-}
\ No newline at end of file
+}
+// Same palette used by the server side charts (see app/graphs/themes.py)
+export const Tab20cColors = ['#3182bd', '#6baed6', '#9ecae1', '#c6dbef', '#e6550d',
+                             '#fd8d3c', '#fdae6b', '#fdd0a2', '#31a354', '#74c476',
+                             '#a1d99b', '#c7e9c0', '#756bb1', '#9e9ac8', '#bcbddc',
+                             '#dadaeb', '#636363', '#969696', '#bdbdbd', '#d9d9d9']
+
+// matplotlib "Set1" colormap, used for the goal lines
+export const Set1Colors = ['#e41a1c', '#377eb8', '#4daf4a', '#984ea3', '#ff7f00',
+                           '#ffff33', '#a65628', '#f781bf', '#999999']
@@ -0,0 +1,121 @@
+import React, { FC, ReactElement, useEffect, useState } from "react";
+import { getChartSeries } from "../common/api"
+import { ChartProps, ChartSeries, ClientChartProps } from "../common/interfaces"
+import { Formatter, Set1Colors, Tab20cColors } from "../common/utilities"
+
+// Draw the charts served as PNG by app/graphs/plot.py when CHART_RENDERING=client
+
+// Point on the circle of radius r, starting from 12 o'clock (counterclockwise,
+// to match matplotlib startangle=90)
+const polarToCartesian = (r: number, fraction: number): [number, number] => {
+  const angle = Math.PI / 2 + fraction * 2 * Math.PI
+  return [r * Math.cos(angle), -r * Math.sin(angle)]
+}
+
+export const PieChart: FC<ChartProps> = ({data}): ReactElement => {
+  const total = data.values.reduce((acc, curr) => acc + curr, 0)
+  let cumulative = 0
+
+  const slices = data.values.map((value, index) => {
+    const start = cumulative / total
+    cumulative += value
+    const end = cumulative / total
+    const color = Tab20cColors[index % Tab20cColors.length]
+    const [x1, y1] = polarToCartesian(1, start)
+    const [x2, y2] = polarToCartesian(1, end)
+    const largeArc = end - start > 0.5 ? 1 : 0
+    const perc = (end - start) * 100
+    // Same as the server side graph: hide labels of slices smaller than 2%
+    const [lx, ly] = polarToCartesian(0.9, (start + end) / 2)
+
+    return (
+      <g key={data.labels[index]}>
+        { end - start >= 1
+          ? <circle r={1} fill={color} />
+          : <path d={`M 0 0 L ${x1} ${y1} A 1 1 0 ${largeArc} 0 ${x2} ${y2} Z`} fill={color} /> }
+        { perc > 2
+          ? <text x={lx} y={ly} fontSize="0.08" textAnchor="middle">{perc.toFixed(1)}%</text>
+          : null }
+      </g>
+    )
+  })
+
+  const legend = data.labels.map((label, index) => {
+    return (
+      <li key={label}>
+        <span style={{color: Tab20cColors[index % Tab20cColors.length]}}>&#9632;</span> {label}
+      </li>
+    )
+  })
+
+  return <div>
+    <svg viewBox="-1.1 -1.1 2.2 2.2" width="100%">
+      {slices}
+      <circle r={0.8} fill="white" />
+    </svg>
+    <ul className="list-unstyled">{legend}</ul>
+  </div>
+}
+
+export const BarChart: FC<ChartProps> = ({data}): ReactElement => {
+  const width = 600
+  const height = 300
+  const padding = 60
+  const goals = data.goals || []
+  const max = Math.max(...data.values, ...goals.map(g => g.amount), 1)
+  const step = (width - padding) / data.values.length
+  const y = (value: number) => height - padding - (value / max) * (height - 2 * padding)
+
+  const bars = data.values.map((value, index) => {
+    const x = padding + index * step
+    return (
+      <g key={data.labels[index]}>
+        <rect x={x + step * 0.1} y={y(value)} width={step * 0.8}
+              height={y(0) - y(value)} fill="#1f77b4">
+          <title>{data.labels[index]}: {Formatter.format(value)}</title>
+        </rect>
+        <text x={x + step / 2} y={height - padding + 5} fontSize="8"
+              transform={`rotate(90 ${x + step / 2} ${height - padding + 5})`}>
+          {data.labels[index]}
+        </text>
+      </g>
+    )
+  })
+
+  const goalLines = goals.map((goal, index) => {
+    const color = Set1Colors[index % Set1Colors.length]
+    return (
+      <g key={goal.text}>
+        <line x1={padding} x2={width} y1={y(goal.amount)} y2={y(goal.amount)} stroke={color} />
+        <text x={padding + 5} y={y(goal.amount) - 3} fontSize="10" fill={color}>{goal.text}</text>
+      </g>
+    )
+  })
+
+  return <svg viewBox={`0 0 ${width} ${height}`} width="100%">
+    <text x={width / 2} y={15} fontSize="12" textAnchor="middle">Monthly balances</text>
+    <line x1={padding} x2={padding} y1={padding} y2={y(0)} stroke="black" />
+    <line x1={padding} x2={width} y1={y(0)} y2={y(0)} stroke="black" />
+    <text x={padding - 5} y={y(max)} fontSize="10" textAnchor="end">{Formatter.format(max)}</text>
+    <text x={padding - 5} y={y(0)} fontSize="10" textAnchor="end">0</text>
+    {bars}
+    {goalLines}
+  </svg>
+}
+
+export const ClientChart: FC<ClientChartProps> = ({type, url}): ReactElement => {
+  const [data, setData] = useState<ChartSeries>();
+
+  useEffect(() => {
+    getChartSeries(url).then(function(series: ChartSeries) {
+      setData(series)
+    }).catch((err) => {
+      console.log('Failed to fetch chart: ', err)
+    })
+  }, [url])
+
+  if (!data) {
+    return <div>Loading...</div>
+  }
+  return type === 'bar' ? <BarChart data={data} /> : <PieChart data={data} />
+}
@@ -24,7 +24,8 @@ export const ExpensebyCategoryTab = () => {
     if (isSending || CategoryId === 0) return; // TODO: is === 0 really necessary?
       setIsSending(true);
 
-      getExpensesByCategoryId(CategoryId, start, end)
+      // Show each page as soon as it arrives
+      getExpensesByCategoryId(CategoryId, start, end, setData)
       .then((data: Array<Expense>) => {
             setData(data)
             setIsSending(false);
@@ -19,7 +19,9 @@ export const ReduceExpensebyCategoryTab = () => {
     if (isFetching || CategoryId === 0) return;
       setisFetching(true);
 
-      getExpensesByCategoryId(CategoryId, start, end)
+      // Update the sums as soon as each page arrives
+      const onPage = (expenses: Array<Expense>) => setData(aggregateData(expenses))
+      getExpensesByCategoryId(CategoryId, start, end, onPage)
       .then((expenses: Array<Expense>) => {
             // Aggregate expenses by note text
             const dataArray = aggregateData(expenses)
@@ -5,6 +5,7 @@ import { ReduceExpensebyCategoryTab } from "./components/reducedexpenses";
 import { Tabs, Tab, Content } from "./components/shared";
 import { ExpensebyCategoryTab } from "./components/expenses";
 import { MonthlyBalanceTab } from "./components/monthlybalance";
+import { ClientChart } from "./components/charts";
 
 const App = () => {
   const [active, setActive] = useState(0);
@@ -44,7 +45,19 @@ const App = () => {
 }
 
 
-ReactDOM.render(
-  <App />,
-  document.getElementById("root")
-);
+// The tabs are only displayed in the home page
+const root = document.getElementById("root")
+if (root) {
+  ReactDOM.render(
+    <App />,
+    root
+  );
+}
+
+// Charts placeholders, see app/budgets/templates/chart.html
+document.querySelectorAll<HTMLElement>(".client-chart").forEach((el) => {
+  ReactDOM.render(
+    <ClientChart type={el.dataset.chartType || "pie"} url={el.dataset.seriesUrl || ""} />,
+    el
+  );
+});